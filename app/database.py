@@ -1,7 +1,13 @@
+import asyncio
 import os
-from sqlalchemy import create_engine
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
+from app.services.metrics import Gauge, TimedAsyncQueuePool, TimedQueuePool, instrument_engine, register
 
 # Читаем настройки подключения из переменных окружения
 DB_USER = os.getenv("DB_USER")
@@ -10,20 +16,278 @@ DB_HOST = os.getenv("DB_HOST")
 DB_NAME = os.getenv("DB_NAME")
 DB_PORT = os.getenv("DB_PORT")
 
+# Режим работы эндпоинтов с БД: sync (psycopg2 в пуле потоков) или async (asyncpg в event loop).
+# Оба режима доступны одновременно в коде, чтобы их можно было сравнивать на одной сборке.
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+# Реплика для чтения (необязательна). Без DB_READ_HOST все читается с основной БД.
+# Остальные параметры по умолчанию совпадают с основной БД.
+DB_READ_HOST = os.getenv("DB_READ_HOST")
+DB_READ_PORT = os.getenv("DB_READ_PORT", DB_PORT)
+DB_READ_USER = os.getenv("DB_READ_USER", DB_USER)
+DB_READ_PASSWORD = os.getenv("DB_READ_PASSWORD", DB_PASSWORD)
+DB_READ_NAME = os.getenv("DB_READ_NAME", DB_NAME)
+
+# Размеры пулов задаются отдельно: запись короткая и частая, чтение аналитики — долгое
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "10"))
+# Сколько соединений каждого пула открыть до приема трафика (не больше размера пула)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+# Сколько секунд после записи запросы того же клиента читают с основной БД (read-your-writes)
+READ_YOUR_WRITES_SEC = float(os.getenv("READ_YOUR_WRITES_SEC", "5"))
+READ_YOUR_WRITES_COOKIE = "bm_wrote_at"
+
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+READ_DATABASE_URL = (
+    f"postgresql://{DB_READ_USER}:{DB_READ_PASSWORD}@{DB_READ_HOST}:{DB_READ_PORT}/{DB_READ_NAME}"
+    if DB_READ_HOST else None
+)
+ASYNC_READ_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_READ_USER}:{DB_READ_PASSWORD}@{DB_READ_HOST}:{DB_READ_PORT}/{DB_READ_NAME}"
+    if DB_READ_HOST else None
+)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Пулы с замером ожидания соединения, SQL-запросы считаются через события движка (см. /metrics)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+)
+instrument_engine(engine, "sync")
+
+# Без реплики движок чтения — это основной движок
+if READ_DATABASE_URL:
+    read_engine = create_engine(
+        READ_DATABASE_URL, poolclass=TimedQueuePool, pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_MAX_OVERFLOW
+    )
+    instrument_engine(read_engine, "sync_read")
+else:
+    read_engine = engine
 
 # autocommit=False, чтобы мы могли явно управлять транзакциями
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок создается только в async-режиме, чтобы sync-сборке не был нужен asyncpg.
+# expire_on_commit=False: после commit объекты нельзя лениво дочитывать из event loop
+async_engine = (
+    create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+    ) if DB_MODE == "async" else None
+)
+if async_engine is not None:
+    instrument_engine(async_engine, "async")
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+async_read_engine = async_engine
+if async_engine is not None and ASYNC_READ_DATABASE_URL:
+    async_read_engine = create_async_engine(
+        ASYNC_READ_DATABASE_URL, poolclass=TimedAsyncQueuePool,
+        pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_MAX_OVERFLOW,
+    )
+    instrument_engine(async_read_engine, "async_read")
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
-def get_db():
+
+def _warm_up_engine(sync_engine, size: int):
+    # Держим соединения открытыми одновременно, иначе пул раз за разом выдаст одно и то же
+    connections = [sync_engine.connect() for _ in range(size)]
+    for conn in connections:
+        conn.close()
+
+
+async def _warm_up_async_engine(engine_, size: int):
+    connections = await asyncio.gather(*(engine_.connect() for _ in range(size)))
+    await asyncio.gather(*(conn.close() for conn in connections))
+
+
+async def warm_up_pools():
+    """
+    Заранее открывает DB_POOL_WARMUP соединений в каждом пуле, чтобы первые запросы
+    после старта или масштабирования воркеров не платили за установку соединений.
+    """
+    if DB_POOL_WARMUP <= 0:
+        return
+    await run_in_threadpool(_warm_up_engine, engine, min(DB_POOL_WARMUP, DB_POOL_SIZE))
+    if read_engine is not engine:
+        await run_in_threadpool(_warm_up_engine, read_engine, min(DB_POOL_WARMUP, DB_READ_POOL_SIZE))
+    if async_engine is not None:
+        await _warm_up_async_engine(async_engine, min(DB_POOL_WARMUP, DB_POOL_SIZE))
+        if async_read_engine is not async_engine:
+            await _warm_up_async_engine(async_read_engine, min(DB_POOL_WARMUP, DB_READ_POOL_SIZE))
+
+
+class ThreadedSession:
+    """
+    Синхронная Session с интерфейсом AsyncSession.
+    Каждый обращающийся к БД вызов уходит в пул потоков, поэтому роутеры пишутся
+    один раз через await и одинаково работают в sync- и async-режиме.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+async def get_db():
     """Генератор сессии для Dependency Injection. Гарантирует закрытие соединения."""
-    db = SessionLocal()
+    if DB_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
+    db = ThreadedSession(SessionLocal(expire_on_commit=False))
     try:
         yield db
     finally:
         # Этот блок выполнится после завершения HTTP-запроса
-        db.close()
\ No newline at end of file
+        await db.close()
+
+
+def wrote_recently(request: Request) -> bool:
+    """Клиент недавно писал в БД (см. ReadYourWritesMiddleware), и реплика могла еще не догнать запись."""
+    try:
+        wrote_at = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - wrote_at < READ_YOUR_WRITES_SEC
+
+
+async def get_read_db(request: Request):
+    """
+    Вариант get_db для маршрутов, которые только читают: сессия на реплике.
+    Без реплики и сразу после записи того же клиента отдает сессию основной БД.
+    """
+    if read_engine is engine or wrote_recently(request):
+        async for db in get_db():
+            yield db
+        return
+
+    if DB_MODE == "async":
+        async with AsyncReadSessionLocal() as db:
+            yield db
+        return
+
+    db = ThreadedSession(ReadSessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def is_replica_session(db) -> bool:
+    """Сессия открыта на реплике (get_read_db не перенаправил чтение на основную БД)."""
+    if read_engine is engine:
+        return False
+    bind = db.sync_session.get_bind()
+    return bind is read_engine or bind is getattr(async_read_engine, "sync_engine", None)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Помечает клиента cookie после успешного изменяющего запроса (POST/PUT/PATCH/DELETE):
+    следующие READ_YOUR_WRITES_SEC секунд get_read_db направляет его чтение на основную БД.
+    """
+
+    WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={time.time():.3f}; Max-Age={int(READ_YOUR_WRITES_SEC) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+async def replica_caught_up(db) -> bool:
+    """
+    Реплика уже применила все, что зафиксировано на основной БД к этому моменту.
+    Нужна кэшам, которые сбрасываются по NOTIFY с основной БД: иначе в кэш попадет
+    результат, прочитанный с отстающей реплики уже после сброса.
+    """
+    def primary_lsn():
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+    lsn = await run_in_threadpool(primary_lsn)
+    result = await db.execute(
+        text("SELECT COALESCE(pg_last_wal_replay_lsn() >= CAST(CAST(:lsn AS text) AS pg_lsn), TRUE)"), {"lsn": lsn}
+    )
+    return result.scalar()
+
+
+def replica_lag_seconds() -> float:
+    """Отставание реплики: 0, если все полученное WAL применено, иначе время с последней примененной транзакции."""
+    with read_engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)).scalar()
+
+
+def _collect_replica_lag():
+    try:
+        return [({}, replica_lag_seconds())]
+    except Exception:
+        # Реплика недоступна: метрики не отдаем, а не роняем /metrics
+        return []
+
+
+if read_engine is not engine:
+    register(Gauge("db_replica_lag_seconds", "Replication lag of the read replica.", _collect_replica_lag))
@@ -1,21 +1,79 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.database import engine, Base
-from app.routers import importer, auctions, analytics, items
+from starlette.concurrency import run_in_threadpool
+from app.database import ReadYourWritesMiddleware, warm_up_pools
+from app.migrate import MIGRATE_ON_STARTUP, check_schema, upgrade
+from app.routers import importer, auctions, analytics, items, metrics, admin, export
+from app.services.auction_stream import AUCTION_EVENTS_CHANNEL, auction_streams
+from app.services.bid_archive import bid_archiver
+from app.services.bid_engine import FUNDS_CHANNEL, bid_engine
+from app.services.expiry_scheduler import expiry_scheduler
+from app.services.exposure_reconcile import exposure_reconciler
+from app.services.log_maintenance import log_maintenance
+from app.services.metrics import MetricsMiddleware
+from app.services.pg_listener import pg_listener
+from app.services.response_cache import analytics_cache, NOTIFY_CHANNEL
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схемой владеют миграции (python -m app.migrate): здесь только сверка версии одним запросом
+    if MIGRATE_ON_STARTUP:
+        await run_in_threadpool(upgrade)
+    else:
+        await run_in_threadpool(check_schema)
+    # Соединения пулов открываются до приема трафика, а не на первых запросах
+    await warm_up_pools()
+    # In-memory движок ставок восстанавливает состояние лотов из БД до приема трафика
+    if bid_engine is not None:
+        bid_engine.start()
+    # Записи любого воркера сбрасывают кэш аналитики через NOTIFY из триггеров
+    pg_listener.subscribe(NOTIFY_CHANNEL, analytics_cache.invalidate)
+    # Цены и закрытия лотов для /auctions/{id}/stream: одно LISTEN-соединение на все потоки воркера
+    pg_listener.subscribe(AUCTION_EVENTS_CHANNEL, auction_streams.on_notify)
+    # Средства пользователей в движке перечитываются после пополнений, escrow и сверки реестра
+    if bid_engine is not None:
+        pg_listener.subscribe(FUNDS_CHANNEL, bid_engine.on_funds_changed)
+    pg_listener.start()
+    # Закрытие истекших лотов; работает в одном воркере (лидер по advisory-блокировке)
+    if expiry_scheduler is not None:
+        expiry_scheduler.start()
+    # Месячные секции журналов создаются заранее, старые уходят в архив целиком
+    log_maintenance.start()
+    # Ставки давно закрытых лотов переезжают в архивную секцию, горячая секция bids остается компактной
+    bid_archiver.start()
+    # Реестр обязательств пользователей периодически сверяется с bids/auctions/escrow_accounts
+    exposure_reconciler.start()
+    yield
+    exposure_reconciler.stop()
+    bid_archiver.stop()
+    log_maintenance.stop()
+    if expiry_scheduler is not None:
+        expiry_scheduler.stop()
+    pg_listener.stop()
+    if bid_engine is not None:
+        bid_engine.stop()
 
-# Создаем таблицы при старте (если их нет)
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="BidMaster API",
     description="Система онлайн-аукционов предметов искусства",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Латентность по маршрутам и число/время SQL-запросов на каждый HTTP-запрос
+app.add_middleware(MetricsMiddleware)
+# После записи клиент какое-то время читает с основной БД, а не с отстающей реплики
+app.add_middleware(ReadYourWritesMiddleware)
+
 # Подключаем маршруты
 app.include_router(importer.router)
 app.include_router(auctions.router)
 app.include_router(analytics.router)
 app.include_router(items.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(export.router)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,252 @@
+"""
+Версионные миграции схемы БД.
+
+Схемой (таблицы, индексы, функции, представления, триггеры) владеют файлы
+sql/migrations/NNNN_описание.sql; номер файла — версия. Применяются по возрастанию,
+каждая в своей транзакции вместе с записью в schema_migrations. Примененный файл не
+редактируют: изменение схемы — это новый файл (функции и представления в нем
+пересоздаются через CREATE OR REPLACE).
+
+    python -m app.migrate            # применить новые миграции
+    python -m app.migrate status     # текущая версия, ожидающие и измененные файлы
+
+Параллельные запуски (несколько контейнеров при деплое) сериализуются advisory-блокировкой.
+Воркер приложения при старте только сверяет версию одним запросом (check_schema) и не
+стартует на устаревшей схеме; MIGRATE_ON_STARTUP=1 — вместо этого применить миграции самому.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.database import engine
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "sql" / "migrations"
+MIGRATION_LOCK_KEY = 7_140_023
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0") == "1"
+
+# Базы, созданные до миграций (init_db.sql, functions.sql, views.sql, triggers.sql через
+# docker-entrypoint-initdb.d), уже содержат схему этих версий: они отмечаются примененными без выполнения
+BASELINE_VERSION = 4
+
+# Отпечаток базовой схемы: колонки таблиц и представлений, сигнатуры функций и триггеры схемы public.
+# База из других скриптов (более ранних или уже дополненных вручную) прошла бы check_schema,
+# а следующие миграции легли бы на чужую схему, поэтому без точного совпадения миграции не запускаются
+BASELINE_FINGERPRINT_QUERY = """
+    SELECT string_agg(item, E'\\n' ORDER BY item COLLATE "C") FROM (
+        SELECT format('column %s.%s %s%s', c.relname, a.attname, format_type(a.atttypid, a.atttypmod),
+                      CASE WHEN a.attnotnull THEN ' not null' ELSE '' END) AS item
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm') AND c.relname <> 'schema_migrations'
+        UNION ALL
+        SELECT format('function %s(%s)', p.proname, pg_get_function_identity_arguments(p.oid))
+        FROM pg_proc p
+        JOIN pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname = 'public'
+        UNION ALL
+        SELECT format('trigger %s.%s', c.relname, t.tgname)
+        FROM pg_trigger t
+        JOIN pg_class c ON c.oid = t.tgrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND NOT t.tgisinternal
+    ) s
+"""
+# schema_fingerprint() базы, созданной только файлами 0001-0004 (их содержимое не меняется)
+BASELINE_FINGERPRINT = "c2e2225ab63f1852af8adfadedecdd35262fcec6b8f339d552233a6f9b015cf2"
+
+_FILE_NAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+class UnknownSchema(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = {}
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILE_NAME.match(path.name)
+        if not match:
+            raise ValueError(f"Unexpected migration file name: {path.name}")
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}: {path.name}")
+        migrations[version] = Migration(version, match.group(2), path)
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def latest_version() -> int:
+    migrations = discover()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(conn) -> int:
+    """Версия схемы БД; 0 — миграции еще не применялись."""
+    try:
+        return conn.execute(text("SELECT max(version) FROM schema_migrations")).scalar() or 0
+    except ProgrammingError:
+        conn.rollback()
+        return 0
+
+
+def check_schema(engine_=engine):
+    """Проверка при старте воркера: один запрос к schema_migrations."""
+    expected = latest_version()
+    with engine_.connect() as conn:
+        version = current_version(conn)
+    if version < expected:
+        raise SchemaOutdated(
+            f"Database schema is at version {version}, the application needs {expected}: "
+            f"run `python -m app.migrate`"
+        )
+
+
+def schema_fingerprint(conn) -> str:
+    """sha256 описания схемы public (см. BASELINE_FINGERPRINT_QUERY)."""
+    description = conn.execute(text(BASELINE_FINGERPRINT_QUERY)).scalar() or ""
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def _prepare(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INT NOT NULL,
+            baseline BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    """))
+    applied = conn.execute(text("SELECT count(*) FROM schema_migrations")).scalar()
+    existing_schema = conn.execute(text("SELECT to_regclass('users') IS NOT NULL")).scalar()
+    if not applied and existing_schema:
+        fingerprint = schema_fingerprint(conn)
+        if fingerprint != BASELINE_FINGERPRINT:
+            raise UnknownSchema(
+                f"Database has tables but no schema_migrations, and it is not the version {BASELINE_VERSION} "
+                f"baseline (schema fingerprint {fingerprint}). Migrate it by hand or recreate it from sql/migrations"
+            )
+        for migration in discover():
+            if migration.version > BASELINE_VERSION:
+                break
+            _record(conn, migration, 0, baseline=True)
+
+
+def _record(conn, migration: Migration, duration_ms: int, baseline: bool = False):
+    conn.execute(
+        text("""
+            INSERT INTO schema_migrations (version, name, checksum, duration_ms, baseline)
+            VALUES (:version, :name, :checksum, :duration_ms, :baseline)
+        """),
+        {"version": migration.version, "name": migration.name, "checksum": migration.checksum,
+         "duration_ms": duration_ms, "baseline": baseline},
+    )
+
+
+def upgrade(engine_=engine, target: Optional[int] = None, log=print) -> List[Migration]:
+    """Применяет недостающие миграции (до target включительно). Возвращает примененные."""
+    applied: List[Migration] = []
+    with engine_.connect() as conn:
+        # Сессионная блокировка переживает commit каждой миграции
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            with conn.begin():
+                _prepare(conn)
+            version = current_version(conn)
+            conn.commit()
+            for migration in discover():
+                if migration.version <= version or (target is not None and migration.version > target):
+                    continue
+                started = time.perf_counter()
+                with conn.begin():
+                    # Курсор psycopg2 без параметров отправляет файл как есть, вместе с % и $$
+                    cursor = conn.connection.cursor()
+                    try:
+                        cursor.execute(migration.sql)
+                    finally:
+                        cursor.close()
+                    duration_ms = int((time.perf_counter() - started) * 1000)
+                    _record(conn, migration, duration_ms)
+                log(f"Applied {migration.path.name} ({duration_ms} ms)")
+                applied.append(migration)
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+    return applied
+
+
+def status(engine_=engine, log=print) -> int:
+    """Печатает состояние миграций. Возвращает код выхода: 1 — есть ожидающие или измененные файлы."""
+    with engine_.connect() as conn:
+        try:
+            rows = conn.execute(text("SELECT version, checksum, baseline FROM schema_migrations")).all()
+        except ProgrammingError:
+            rows = []
+    recorded = {row.version: row for row in rows}
+    problems = 0
+    for migration in discover():
+        row = recorded.get(migration.version)
+        if row is None:
+            state = "pending"
+            problems += 1
+        elif row.checksum != migration.checksum:
+            state = "MODIFIED after it was applied"
+            problems += 1
+        else:
+            state = "baseline" if row.baseline else "applied"
+        log(f"{migration.path.name}: {state}")
+    log(f"Schema version: {max(recorded, default=0)}, latest: {latest_version()}")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply BidMaster database migrations")
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    parser.add_argument("--target", type=int, help="upgrade up to this version (inclusive)")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        return status()
+    try:
+        applied = upgrade(target=args.target)
+    except UnknownSchema as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not applied:
+        print("Schema is up to date.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,44 +1,61 @@
-from sqlalchemy import Column, Integer, String, Boolean, DECIMAL, ForeignKey, Text, TIMESTAMP
-from sqlalchemy.sql import func
+from sqlalchemy import BigInteger, Column, Computed, Integer, String, Boolean, DECIMAL, ForeignKey, Text, TIMESTAMP, Index
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import false, func
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
     user_id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    email = Column(String, unique=True, index=True)
-    password_hash = Column(String)
-    role = Column(String, default="user")
+    username = Column(String(50), nullable=False, unique=True, index=True)
+    email = Column(String(100), nullable=False, unique=True, index=True)
+    password_hash = Column(String(255), nullable=False)
+    role = Column(String(20), default="user")
     balance = Column(DECIMAL(15, 2), default=0.0)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
 class Category(Base):
     __tablename__ = "categories"
     category_id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True)
+    name = Column(String(50), nullable=False, unique=True)
     description = Column(Text)
 
 class Item(Base):
     __tablename__ = "items"
     item_id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.user_id"))
-    title = Column(String)
+    title = Column(String(150), nullable=False)
     description = Column(Text)
     year_created = Column(Integer)
     is_verified = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
+    # Заполняется БД (см. sql/migrations/0014_items_search.sql); deferred — чтобы не тянуть вектор в каждый SELECT
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('russian', COALESCE(title, '')), 'A') || "
+        "setweight(to_tsvector('russian', COALESCE(description, '')), 'B')",
+        persisted=True,
+    )))
+
+    __table_args__ = (
+        Index("idx_items_search", "search_vector", postgresql_using="gin"),
+    )
 
 class ItemCategory(Base):
     __tablename__ = "item_categories"
     item_id = Column(Integer, ForeignKey("items.item_id", ondelete="CASCADE"), primary_key=True)
     category_id = Column(Integer, ForeignKey("categories.category_id", ondelete="CASCADE"), primary_key=True)
 
+    # Обратный порядок к первичному ключу: предметы категории для фильтра списков
+    __table_args__ = (
+        Index("idx_item_categories_category", "category_id", "item_id"),
+    )
+
 class ExpertReview(Base):
     __tablename__ = "expert_reviews"
     review_id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.item_id"))
     expert_id = Column(Integer, ForeignKey("users.user_id"))
-    verdict = Column(String)
+    verdict = Column(String(20))
     comments = Column(Text)
     review_date = Column(TIMESTAMP, server_default=func.now())
 
@@ -46,19 +63,36 @@ class Auction(Base):
     __tablename__ = "auctions"
     auction_id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.item_id"), unique=True)
-    start_time = Column(TIMESTAMP)
-    end_time = Column(TIMESTAMP)
-    start_price = Column(DECIMAL(12, 2))
-    current_price = Column(DECIMAL(12, 2), default=0)
-    status = Column(String, default='planned')
+    start_time = Column(TIMESTAMP, nullable=False)
+    end_time = Column(TIMESTAMP, nullable=False)
+    start_price = Column(DECIMAL(12, 2), nullable=False)
+    current_price = Column(DECIMAL(12, 2), nullable=False, default=0)
+    status = Column(String(20), default='planned')
+    # Автор текущей цены; ведется триггерами (см. sql/migrations/0017_user_exposure.sql)
+    leader_id = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL"))
+
+    # Индексы под keyset-пагинацию списка (см. sql/migrations/0008_keyset_indexes.sql)
+    __table_args__ = (
+        Index("idx_auctions_status_end_time", "status", "end_time", "auction_id"),
+        Index("idx_auctions_end_time", "end_time", "auction_id"),
+        Index("idx_auctions_status_price", "status", "current_price", "auction_id"),
+        Index("idx_auctions_price", "current_price", "auction_id"),
+    )
 
 class Bid(Base):
     __tablename__ = "bids"
-    bid_id = Column(Integer, primary_key=True, index=True)
+    bid_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     auction_id = Column(Integer, ForeignKey("auctions.auction_id"))
     user_id = Column(Integer, ForeignKey("users.user_id"))
-    amount = Column(DECIMAL(12, 2))
+    amount = Column(DECIMAL(12, 2), nullable=False)
     bid_time = Column(TIMESTAMP, server_default=func.now())
+    # Ключ секционирования (входит в первичный ключ): новые ставки всегда попадают в горячую секцию bids_hot
+    archived = Column(Boolean, primary_key=True, server_default=false())
+
+    __table_args__ = (
+        Index("idx_bids_auction_amount", "auction_id", amount.desc()),
+        Index("idx_bids_user_amount_time", "user_id", "amount", bid_time.desc()),
+    )
 
 # --- НОВЫЕ ТАБЛИЦЫ ---
 class AutoBid(Base):
@@ -66,32 +100,66 @@ class AutoBid(Base):
     auto_bid_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"))
     auction_id = Column(Integer, ForeignKey("auctions.auction_id"))
-    max_limit = Column(DECIMAL(12, 2))
+    max_limit = Column(DECIMAL(12, 2), nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
 class EscrowAccount(Base):
     __tablename__ = "escrow_accounts"
     escrow_id = Column(Integer, primary_key=True, index=True)
-    auction_id = Column(Integer, ForeignKey("auctions.auction_id"))
+    # Один счет на лот (см. sql/migrations/0024_escrow_unique_auction.sql)
+    auction_id = Column(Integer, ForeignKey("auctions.auction_id"), unique=True)
     buyer_id = Column(Integer, ForeignKey("users.user_id"))
-    amount = Column(DECIMAL(12, 2))
-    status = Column(String)
+    amount = Column(DECIMAL(12, 2), nullable=False)
+    status = Column(String(20))
     updated_at = Column(TIMESTAMP, server_default=func.now())
+
+class UserExposure(Base):
+    # Обязательства пользователя; ведется триггерами на auctions/escrow_accounts, сверяется reconcile_user_exposure()
+    __tablename__ = "user_exposure"
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    leading_amount = Column(DECIMAL(15, 2), nullable=False, default=0)
+    escrow_amount = Column(DECIMAL(15, 2), nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 # ---------------------
 
 class AuditLog(Base):
     __tablename__ = "audit_log"
-    log_id = Column(Integer, primary_key=True, index=True)
-    table_name = Column(String)
-    operation_type = Column(String)
+    log_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    table_name = Column(String(50))
+    operation_type = Column(String(10))
     record_id = Column(Integer)
-    changed_by = Column(String)
-    changed_at = Column(TIMESTAMP, server_default=func.now())
+    old_value = Column(Text)
+    new_value = Column(Text)
+    changed_by = Column(String(50))
+    # Ключ секционирования по месяцам входит в первичный ключ
+    changed_at = Column(TIMESTAMP, primary_key=True, server_default=func.now())
 
 class SystemLog(Base):
     __tablename__ = "system_logs"
-    log_id = Column(Integer, primary_key=True, index=True)
-    level = Column(String)
-    source = Column(String)
+    log_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    level = Column(String(10))
+    source = Column(String(50))
     message = Column(Text)
-    created_at = Column(TIMESTAMP, server_default=func.now())
\ No newline at end of file
+    created_at = Column(TIMESTAMP, primary_key=True, server_default=func.now())
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+    batch_id = Column(String(36), primary_key=True)
+    file_name = Column(String(255), primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    rows_committed = Column(BigInteger, nullable=False, default=0)
+    rows_loaded = Column(BigInteger, nullable=False, default=0)
+    rows_quarantined = Column(BigInteger, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default="in_progress")
+    error = Column(Text)
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+
+class ImportQuarantine(Base):
+    __tablename__ = "import_quarantine"
+    quarantine_id = Column(BigInteger, primary_key=True)
+    batch_id = Column(String(36), nullable=False)
+    file_name = Column(String(255), nullable=False)
+    row_number = Column(BigInteger, nullable=False)
+    raw_row = Column(JSONB, nullable=False)
+    error = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
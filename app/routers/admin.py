@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.database import get_db
+from app.services.bid_archive import run_bid_archive
+from app.services.exposure_reconcile import run_exposure_reconcile
+from app.services.log_maintenance import run_log_maintenance
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.post("/rollups/rebuild")
+async def rebuild_rollups(db: AsyncSession = Depends(get_db)):
+    """Пересчитать агрегаты ставок (user_bid_stats, auction_bid_stats) с нуля"""
+    result = await db.execute(text("SELECT * FROM rebuild_bid_stats()"))
+    counts = result.one()
+    await db.commit()
+    return {"user_rows": counts.user_rows, "auction_rows": counts.auction_rows}
+
+@router.post("/logs/maintenance")
+async def maintain_logs():
+    """Создать секции журналов наперед и применить срок хранения (обычно выполняется фоном раз в час)"""
+    result = await run_in_threadpool(run_log_maintenance)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Log maintenance is already running")
+    return result
+
+
+@router.post("/bids/archive")
+async def archive_bids():
+    """Перенести ставки давно закрытых аукционов в архивную секцию (обычно выполняется фоном раз в час)"""
+    result = await run_in_threadpool(run_bid_archive)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Bid archiving is already running")
+    return result
+
+
+@router.post("/exposure/reconcile")
+async def reconcile_exposure():
+    """Пересчитать реестр обязательств пользователей и вернуть найденные расхождения (обычно выполняется фоном раз в час)"""
+    result = await run_in_threadpool(run_exposure_reconcile)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Exposure reconciliation is already running")
+    return result
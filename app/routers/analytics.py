@@ -1,24 +1,51 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+import json
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from app.database import get_db
+from app.database import get_read_db, is_replica_session, replica_caught_up
+from app.services.pg_listener import pg_listener
+from app.services.response_cache import analytics_cache
 
 router = APIRouter(prefix="/analytics", tags=["Analytics & Reports"])
 
+# Таблицы, от которых зависит каждое представление: их изменение сбрасывает кэш отчета
+ACTIVE_LOTS_TABLES = ("auctions", "items", "users", "auction_bid_stats")
+CATEGORY_SALES_TABLES = ("auctions", "items", "categories", "item_categories")
+TOP_BIDDERS_TABLES = ("users", "user_bid_stats")
+
+async def _cached_report(request: Request, db: AsyncSession, view: str, tables) -> Response:
+    """Отдает отчет из кэша (или 304 по ETag); при промахе выполняет представление и кэширует JSON"""
+    # Без LISTEN-соединения не узнаем о чужих записях, поэтому кэшем не пользуемся
+    use_cache = pg_listener.connected.is_set()
+    entry = analytics_cache.get(view) if use_cache else None
+    if entry is None:
+        generation = analytics_cache.generation
+        if use_cache and is_replica_session(db):
+            # Отстающая реплика вернет данные старше последнего сброса кэша — такие не кэшируем
+            use_cache = await replica_caught_up(db)
+        result = await db.execute(text(f"SELECT * FROM {view}"))
+        body = json.dumps(jsonable_encoder([dict(row._mapping) for row in result])).encode()
+        entry = analytics_cache.put(view, body, tables, generation) if use_cache else None
+        if entry is None:
+            return Response(content=body, media_type="application/json")
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 @router.get("/active-lots")
-def get_active_lots_report(db: Session = Depends(get_db)):
+async def get_active_lots_report(request: Request, db: AsyncSession = Depends(get_read_db)):
     """Список активных лотов (через представление)"""
-    result = db.execute(text("SELECT * FROM v_active_lots_details"))
-    return [dict(row._mapping) for row in result]
+    return await _cached_report(request, db, "v_active_lots_details", ACTIVE_LOTS_TABLES)
 
 @router.get("/category-sales")
-def get_category_sales_report(db: Session = Depends(get_db)):
+async def get_category_sales_report(request: Request, db: AsyncSession = Depends(get_read_db)):
     """Статистика продаж по категориям"""
-    result = db.execute(text("SELECT * FROM v_category_sales"))
-    return [dict(row._mapping) for row in result]
+    return await _cached_report(request, db, "v_category_sales", CATEGORY_SALES_TABLES)
 
 @router.get("/top-bidders")
-def get_top_bidders_report(db: Session = Depends(get_db)):
+async def get_top_bidders_report(request: Request, db: AsyncSession = Depends(get_read_db)):
     """Топ пользователей по активности"""
-    result = db.execute(text("SELECT * FROM v_top_bidders"))
-    return [dict(row._mapping) for row in result]
\ No newline at end of file
+    return await _cached_report(request, db, "v_top_bidders", TOP_BIDDERS_TABLES)
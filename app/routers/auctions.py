@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
-from typing import List
+from decimal import Decimal
+from typing import List, Optional
 
-from app.database import get_db
-from app.models import Auction, Bid, Item, User, EscrowAccount
+from app.database import get_db, get_read_db
+from app.models import Auction, Bid, Item, ItemCategory, EscrowAccount
 from app.schemas import AuctionResponse
+from app.services.auction_stream import STREAM_EVENTS, auction_streams
+from app.services.bid_engine import bid_engine, BidRejected
+from app.services.bid_batch import place_batch
+from app.services.expiry_scheduler import expiry_scheduler
+from app.services.proxy_bidding import proxy_books, resolve
+from app.services.pagination import InvalidCursor, decode_cursor, key_types, keyset_page, split_page
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/auctions")
@@ -20,25 +30,151 @@ class BidCreate(BaseModel):
     user_id: int
     amount: float
 
+class BatchBid(BidCreate):
+    auction_id: int
+
+class BidBatch(BaseModel):
+    bids: List[BatchBid]
+
+MAX_BATCH_BIDS = 10000
+
+# Комментарий-пинг в SSE-потоке: держит соединение через прокси и выявляет отключившихся клиентов
+STREAM_HEARTBEAT_SEC = 15
+
+# Коды отказа функции place_bid_atomic -> HTTP-ответ
+BID_ERRORS = {
+    'auction_not_found': (404, "Auction not found"),
+    'not_active': (400, "Auction is not active"),
+    'finished': (400, "Auction finished"),
+    'user_not_found': (404, "User not found"),
+    'insufficient_funds': (400, "Insufficient funds"),
+}
+
+# Сортировки списка: имя -> (ключ сортировки с первичным ключом в конце, по убыванию?)
+AUCTION_SORTS = {
+    "auction_id": ((Auction.auction_id,), False),
+    "end_time": ((Auction.end_time, Auction.auction_id), False),
+    "-end_time": ((Auction.end_time, Auction.auction_id), True),
+    "price": ((Auction.current_price, Auction.auction_id), False),
+    "-price": ((Auction.current_price, Auction.auction_id), True),
+}
+
 @router.get("/", response_model=List[AuctionResponse], tags=["Auctions"])
-def get_all_auctions(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(Auction).offset(skip).limit(limit).all()
+async def get_all_auctions(
+        response: Response,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = Query(10, ge=1),
+        sort: str = "auction_id",
+        status: Optional[str] = None,
+        ends_after: Optional[datetime] = None,
+        ends_before: Optional[datetime] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        category_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Список аукционов с фильтрами. Страницы листаются курсором из заголовка X-Next-Cursor
+    (например, sort=end_time&status=active — "скоро закончатся"); skip/limit поддерживаются по-прежнему.
+    """
+    if sort not in AUCTION_SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort. Use one of: {', '.join(AUCTION_SORTS)}")
+    columns, descending = AUCTION_SORTS[sort]
+
+    query = select(Auction)
+    if status is not None:
+        query = query.where(Auction.status == status)
+    if ends_after is not None:
+        query = query.where(Auction.end_time >= ends_after)
+    if ends_before is not None:
+        query = query.where(Auction.end_time < ends_before)
+    if min_price is not None:
+        query = query.where(Auction.current_price >= min_price)
+    if max_price is not None:
+        query = query.where(Auction.current_price <= max_price)
+    if category_id is not None:
+        query = query.where(select(ItemCategory.item_id).where(
+            ItemCategory.category_id == category_id, ItemCategory.item_id == Auction.item_id
+        ).exists())
+
+    try:
+        cursor_key = decode_cursor(cursor, sort, key_types(columns)) if cursor else None
+        query = keyset_page(query, columns, descending, cursor_key, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cursor_key is None and skip:
+        # Старые клиенты со skip/limit: тот же порядок, но через OFFSET
+        query = query.offset(skip)
+
+    result = await db.execute(query)
+    auctions, next_cursor = split_page(result.scalars().all(), columns, sort, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return auctions
 
 @router.get("/{auction_id}", response_model=AuctionResponse, tags=["Auctions"])
-def get_auction(auction_id: int, db: Session = Depends(get_db)):
-    auction = db.query(Auction).filter(Auction.auction_id == auction_id).first()
+async def get_auction(auction_id: int, db: AsyncSession = Depends(get_read_db)):
+    auction = await db.get(Auction, auction_id)
     if not auction:
         raise HTTPException(status_code=404, detail="Auction not found")
     return auction
 
+async def _stream_events(request: Request, subscriber, event):
+    try:
+        while True:
+            if event is True:
+                # Слушатель переподключался: перечитываем состояние вместо пропущенных событий
+                event = await auction_streams.snapshot(subscriber.auction_id)
+                if event is None:
+                    break
+            if event is None:
+                yield ": ping\n\n"
+            else:
+                STREAM_EVENTS.inc()
+                yield f"event: {'closed' if event.is_final else 'state'}\ndata: {event.raw}\n\n"
+                if event.is_final:
+                    break
+            if await request.is_disconnected():
+                break
+            event = await subscriber.next(STREAM_HEARTBEAT_SEC)
+    finally:
+        auction_streams.unsubscribe(subscriber)
+
+@router.get("/{auction_id}/stream", tags=["Auctions"])
+async def stream_auction(auction_id: int, request: Request):
+    """
+    Живые события лота (Server-Sent Events) вместо опроса GET /auctions/{id}.
+    Сначала приходит снимок состояния, затем 'state' при каждой новой цене или продлении
+    и 'closed' при закрытии торгов, после которого поток завершается.
+    """
+    # Подписываемся до чтения снимка, чтобы не потерять изменения между ними
+    subscriber = auction_streams.subscribe(auction_id)
+    try:
+        snapshot = await auction_streams.snapshot(auction_id)
+    except Exception:
+        auction_streams.unsubscribe(subscriber)
+        raise
+    if snapshot is None:
+        auction_streams.unsubscribe(subscriber)
+        raise HTTPException(status_code=404, detail="Auction not found")
+
+    return StreamingResponse(
+        _stream_events(request, subscriber, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/", response_model=AuctionResponse, tags=["Auctions"])
-def create_auction(auction: AuctionCreate, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.item_id == auction.item_id).first()
+async def create_auction(auction: AuctionCreate, db: AsyncSession = Depends(get_db)):
+    item = await db.get(Item, auction.item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
     # Нельзя выставить один предмет на два аукциона одновременно
-    existing = db.query(Auction).filter(Auction.item_id == auction.item_id, Auction.status != 'cancelled').first()
+    existing = await db.scalar(
+        select(Auction.auction_id).where(Auction.item_id == auction.item_id, Auction.status != 'cancelled')
+    )
     if existing:
         raise HTTPException(status_code=400, detail="Item is already on auction")
 
@@ -54,74 +190,148 @@ def create_auction(auction: AuctionCreate, db: Session = Depends(get_db)):
         status='active'
     )
     db.add(new_auction)
-    db.commit()
-    db.refresh(new_auction)
+    await db.commit()
+    await db.refresh(new_auction)
+    if expiry_scheduler is not None:
+        expiry_scheduler.schedule(new_auction.auction_id, new_auction.end_time)
     return new_auction
 
 @router.delete("/{auction_id}", tags=["Auctions"])
-def delete_auction(auction_id: int, db: Session = Depends(get_db)):
-    auction = db.query(Auction).filter(Auction.auction_id == auction_id).first()
+async def delete_auction(auction_id: int, db: AsyncSession = Depends(get_db)):
+    auction = await db.get(Auction, auction_id)
     if not auction:
         raise HTTPException(status_code=404, detail="Auction not found")
 
-    db.delete(auction)
-    db.commit()
+    await db.delete(auction)
+    await db.commit()
+    if bid_engine is not None:
+        bid_engine.forget(auction_id)
     return {"detail": "Auction deleted"}
 
 @router.post("/{auction_id}/bid", tags=["Auctions"])
-def place_bid(auction_id: int, bid: BidCreate, db: Session = Depends(get_db)):
-    """Сделать ставку (с проверками баланса и статуса)"""
-    auction = db.query(Auction).filter(Auction.auction_id == auction_id).first()
-    if not auction:
-        raise HTTPException(status_code=404, detail="Auction not found")
+async def place_bid(auction_id: int, bid: BidCreate, db: AsyncSession = Depends(get_db)):
+    """Сделать ставку (с проверками баланса и статуса). Прокси-ставки соперников отвечают сразу."""
+    amount = Decimal(str(bid.amount))
 
-    # Валидация: аукцион должен быть активен и время не истекло
-    if auction.status != 'active':
-        raise HTTPException(status_code=400, detail="Auction is not active")
+    if bid_engine is not None:
+        # Горячий путь: валидация в памяти, запись в БД — фоновыми пачками.
+        # Движок может дочитать лот из БД синхронно, поэтому вызываем его в пуле потоков
+        book = await db.run_sync(proxy_books.get, auction_id)
+        resolver = (lambda value: resolve(book, bid.user_id, value)) if len(book) else None
+        try:
+            state = await run_in_threadpool(bid_engine.place, auction_id, bid.user_id, amount, resolver)
+        except BidRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        return {"status": "success", "new_price": state.current_price,
+                "end_time": state.end_time, "leader_id": state.leader_id}
 
-    if datetime.now() > auction.end_time:
-        auction.status = 'finished'
-        db.commit()
-        raise HTTPException(status_code=400, detail="Auction finished")
+    # Проверка статуса, времени, цены и баланса, вставка ставки и обновление цены —
+    # одним вызовом хранимой функции под блокировкой строки лота
+    result = await _place_bid_atomic(db, auction_id, bid.user_id, amount)
 
-    if bid.amount <= auction.current_price:
-        raise HTTPException(status_code=400, detail=f"Bid must be higher than {auction.current_price}")
+    if result.result == 'too_low':
+        await db.commit()
+        raise HTTPException(status_code=400, detail=f"Bid must be higher than {result.new_price}")
+    if result.result != 'accepted':
+        await db.commit()
+        status_code, detail = BID_ERRORS[result.result]
+        raise HTTPException(status_code=status_code, detail=detail)
 
-    user = db.query(User).filter(User.user_id == bid.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Лот уже заблокирован нашей транзакцией, поэтому ответ роботов не пересечется с чужими ставками
+    leader_id = bid.user_id
+    book = await db.run_sync(proxy_books.get, auction_id)
+    if len(book):
+        for proxy_user_id, proxy_amount in resolve(book, bid.user_id, amount)[1:]:
+            proxy_result = await _place_bid_atomic(db, auction_id, proxy_user_id, proxy_amount)
+            if proxy_result.result != 'accepted':
+                break
+            result, leader_id = proxy_result, proxy_user_id
+    await db.commit()
 
-    # Проверяем платежеспособность
-    if user.balance < bid.amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
+    return {"status": "success", "new_price": result.new_price,
+            "end_time": result.new_end_time, "leader_id": leader_id}
 
-    new_bid = Bid(
-        auction_id=auction_id,
-        user_id=bid.user_id,
-        amount=bid.amount,
-        bid_time=datetime.now()
-    )
-    db.add(new_bid)
-    db.commit()
+@router.post("/bids:batch", tags=["Auctions"])
+async def place_bids_batch(batch: BidBatch, db: AsyncSession = Depends(get_db)):
+    """
+    Пакет ставок по многим лотам. Ставки проверяются в порядке поступления с тем же результатом,
+    что и последовательные вызовы /{auction_id}/bid; ответ — исход по каждой ставке.
+    """
+    if len(batch.bids) > MAX_BATCH_BIDS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {MAX_BATCH_BIDS} bids")
+    bids = [(b.auction_id, b.user_id, Decimal(str(b.amount))) for b in batch.bids]
+
+    if bid_engine is not None:
+        books = await db.run_sync(proxy_books.get_many, [auction_id for auction_id, _, _ in bids])
+        results = await run_in_threadpool(_place_batch_in_engine, bids, books)
+    else:
+        outcomes = await db.run_sync(place_batch, bids)
+        await db.commit()
+        results = [_batch_result(outcome) for outcome in outcomes]
 
-    return {"status": "success", "new_price": bid.amount}
+    accepted = sum(1 for r in results if r["status"] == "accepted")
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+def _batch_result(outcome) -> dict:
+    if outcome.result == 'accepted':
+        return {"status": "accepted", "new_price": outcome.new_price,
+                "end_time": outcome.new_end_time, "leader_id": outcome.leader_id}
+    if outcome.result == 'too_low':
+        status_code, detail = 400, f"Bid must be higher than {outcome.new_price}"
+    else:
+        status_code, detail = BID_ERRORS[outcome.result]
+    return {"status": "rejected", "status_code": status_code, "detail": detail}
+
+def _place_batch_in_engine(bids, books) -> list:
+    # Движок ставок и так держит лоты в памяти: проигрываем пакет через него по одной ставке
+    results = []
+    for auction_id, user_id, amount in bids:
+        book = books.get(auction_id)
+        resolver = (lambda value, b=book, u=user_id: resolve(b, u, value)) if book is not None and len(book) else None
+        try:
+            state = bid_engine.place(auction_id, user_id, amount, resolver)
+        except BidRejected as e:
+            results.append({"status": "rejected", "status_code": e.status_code, "detail": e.detail})
+            continue
+        results.append({"status": "accepted", "new_price": state.current_price,
+                        "end_time": state.end_time, "leader_id": state.leader_id})
+    return results
+
+async def _place_bid_atomic(db: AsyncSession, auction_id: int, user_id: int, amount: Decimal):
+    result = await db.execute(
+        text("SELECT * FROM place_bid_atomic(:auction_id, :user_id, :amount)"),
+        {"auction_id": auction_id, "user_id": user_id, "amount": amount}
+    )
+    return result.one()
 
 @router.post("/{auction_id}/close", tags=["Transactions Demo"])
-def close_auction_transaction(auction_id: int, db: Session = Depends(get_db)):
+async def close_auction_transaction(auction_id: int, db: AsyncSession = Depends(get_db)):
     """
     Транзакционное закрытие аукциона.
     Создает запись в Escrow (депонирование) для победителя.
     """
-    auction = db.query(Auction).filter(Auction.auction_id == auction_id).first()
+    auction = await db.get(Auction, auction_id)
     if not auction:
         raise HTTPException(status_code=404, detail="Auction not found")
 
     if auction.status == 'finished':
         raise HTTPException(status_code=400, detail="Already finished")
 
+    if bid_engine is not None:
+        # Перестаем принимать ставки и дожидаемся записи уже принятых, чтобы победитель был в bids
+        await run_in_threadpool(bid_engine.mark_finished, auction_id)
+
+    # Блокируем строку лота и перепроверяем статус: параллельное закрытие или планировщик
+    # (settle_auctions) могли закрыть лот после первого чтения, и второй счет escrow не создается
+    auction = await db.get(Auction, auction_id, with_for_update=True, populate_existing=True)
+    if auction.status == 'finished':
+        raise HTTPException(status_code=400, detail="Already finished")
+
     # Ищем последнюю (максимальную) ставку
-    winner_bid = db.query(Bid).filter(Bid.auction_id == auction_id) \
-        .order_by(Bid.amount.desc()).first()
+    result = await db.execute(
+        select(Bid).where(Bid.auction_id == auction_id).order_by(Bid.amount.desc()).limit(1)
+    )
+    winner_bid = result.scalars().first()
 
     try:
         # Обновляем статус и создаем счет в рамках одной транзакции
@@ -137,10 +347,10 @@ def close_auction_transaction(auction_id: int, db: Session = Depends(get_db)):
             )
             db.add(escrow)
 
-        db.commit() # Фиксируем изменения, если не было ошибок
+        await db.commit() # Фиксируем изменения, если не было ошибок
 
         return {"message": "Auction closed and funds escrowed", "winner_id": winner_bid.user_id if winner_bid else None}
 
     except Exception as e:
-        db.rollback() # Откат при любой ошибке
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await db.rollback() # Откат при любой ошибке
+        raise HTTPException(status_code=500, detail=str(e))
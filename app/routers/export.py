@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.database import engine, read_engine, wrote_recently
+from app.services.export import EXPORT_EXCLUDED_COLUMNS, EXPORT_SOURCES, FORMATS, copy_chunks, ndjson_chunks
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+FILE_EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "binary": "bin"}
+
+
+async def _iterate(chunks):
+    """
+    Отдает порции синхронного генератора, вызывая его в пуле потоков (соединение psycopg2 блокирующее).
+    Генератор закрывается и при обрыве соединения клиентом: курсор и соединение освобождаются сразу.
+    """
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        chunks.close()
+
+
+@router.get("")
+async def list_exports():
+    """Таблицы и представления, доступные для выгрузки, и колонки, которые в выгрузку не попадают"""
+    return {
+        "sources": list(EXPORT_SOURCES),
+        "formats": list(FORMATS),
+        "excluded_columns": {name: list(columns) for name, columns in EXPORT_EXCLUDED_COLUMNS.items()},
+    }
+
+
+@router.get("/{name}")
+async def export_source(
+        name: str,
+        request: Request,
+        format: str = Query("ndjson", pattern="^(ndjson|csv|binary)$")
+):
+    """
+    Потоковая выгрузка таблицы или представления целиком: NDJSON, CSV (с заголовком) или
+    бинарный формат COPY PostgreSQL. Память сервера не зависит от объема выгрузки.
+    """
+    if name not in EXPORT_SOURCES:
+        raise HTTPException(status_code=404, detail="Unknown table or view")
+    # Выгрузка читает с реплики, кроме клиента, который только что писал
+    source_engine = engine if wrote_recently(request) else read_engine
+    if format == "ndjson":
+        chunks = ndjson_chunks(source_engine, name)
+    else:
+        chunks = copy_chunks(source_engine, name, format)
+    return StreamingResponse(
+        _iterate(chunks),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{FILE_EXTENSIONS[format]}"'},
+    )
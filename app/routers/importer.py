@@ -1,123 +1,291 @@
-import csv
-import io
+import asyncio
+import os
+import time
 import uuid
-from typing import List
-from fastapi import APIRouter, UploadFile, File, Depends
-from sqlalchemy.orm import Session
-from app.database import get_db
+from collections import defaultdict
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Response
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.database import get_db, SessionLocal
 from app.models import (
     User, Category, Item, ItemCategory, Auction, Bid,
     ExpertReview, AuditLog, SystemLog,
-    AutoBid, EscrowAccount
+    AutoBid, EscrowAccount, ImportCheckpoint, ImportQuarantine
 )
+from app.services.copy_import import RowConverter, copy_chunk, iter_chunks, open_csv, worker_peak_rss_mb
+from app.services.pagination import InvalidCursor, decode_cursor, key_types, keyset_page, split_page
+from app.services.import_scheduler import dependency_levels
 
 router = APIRouter(prefix="/import", tags=["Import"])
 
-# Маппинг: имя файла -> (Модель БД, Приоритет загрузки)
-# Приоритет важен, чтобы не нарушить Foreign Key (сначала создаем User, потом Bid)
+# Строк CSV в одной транзакции (порция — единица фиксации и возобновления)
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+
+# Маппинг: имя файла -> Модель БД
+# Порядок загрузки не задается вручную: он выводится из ForeignKey моделей
 CSV_MAPPING = {
-    "users.csv": (User, 1),
-    "categories.csv": (Category, 2),
-    "items.csv": (Item, 3),
-    "item_categories.csv": (ItemCategory, 4),
-    "auctions.csv": (Auction, 5),
-    "bids.csv": (Bid, 6),
-    "auto_bids.csv": (AutoBid, 7),
-    "escrow_accounts.csv": (EscrowAccount, 8),
-    "expert_reviews.csv": (ExpertReview, 9),
-    "audit_log.csv": (AuditLog, 10)
+    "users.csv": User,
+    "categories.csv": Category,
+    "items.csv": Item,
+    "item_categories.csv": ItemCategory,
+    "auctions.csv": Auction,
+    "bids.csv": Bid,
+    "auto_bids.csv": AutoBid,
+    "escrow_accounts.csv": EscrowAccount,
+    "expert_reviews.csv": ExpertReview,
+    "audit_log.csv": AuditLog
 }
 
 
+def _lock_checkpoint(db, batch_id: str, file_name: str, rows_committed: int) -> ImportCheckpoint:
+    """
+    Блокирует контрольную точку файла до конца транзакции порции.
+    Если ее продвинул кто-то еще (тот же пакет возобновили параллельно), порцию не грузим.
+    """
+    checkpoint = db.get(ImportCheckpoint, (batch_id, file_name), with_for_update=True, populate_existing=True)
+    if checkpoint.rows_committed != rows_committed:
+        raise RuntimeError("File is being imported concurrently in the same batch")
+    return checkpoint
+
+
+def _import_file(batch_id: str, model, file: UploadFile, bulk_load: bool = False,
+                 chunk_rows: int = IMPORT_CHUNK_ROWS) -> str:
+    """
+    Загружает один файл на собственном соединении из пула. Возвращает строку отчета.
+    COPY идет через psycopg2 в пуле потоков в обоих режимах DB_MODE: event loop не блокируется.
+
+    Файл грузится порциями по chunk_rows строк; каждая порция фиксируется в одной транзакции
+    с контрольной точкой (batch_id, имя файла), поэтому после сбоя пакет продолжается с первой
+    незафиксированной строки. Строки, не прошедшие конвертацию или отвергнутые БД, уходят
+    в import_quarantine, остальные строки порции загружаются.
+    В режиме bulk_load построчные триггеры (аудит, антиснайпинг) отключены в транзакции каждой порции,
+    а производные данные пересчитывает finish_bulk_load в транзакции, завершающей файл.
+    """
+    db = SessionLocal()
+    file_name = file.filename
+    text_stream = None
+    try:
+        started = time.perf_counter()
+        checkpoint = db.get(ImportCheckpoint, (batch_id, file_name))
+        if checkpoint is None:
+            checkpoint = ImportCheckpoint(batch_id=batch_id, file_name=file_name, table_name=model.__tablename__,
+                                          rows_committed=0, rows_loaded=0, rows_quarantined=0)
+            db.add(checkpoint)
+            db.commit()
+        elif checkpoint.status == "done":
+            return (
+                f"Success: already imported in this batch "
+                f"({checkpoint.rows_loaded} records loaded, {checkpoint.rows_quarantined} quarantined)."
+            )
+        resumed_from = checkpoint.rows_committed
+
+        reader, header, text_stream = open_csv(file)
+        if not header:
+            checkpoint.status = "done"
+            db.commit()
+            return "Empty file warning"
+        converter = RowConverter(model, header)
+
+        loaded = quarantined = 0
+        rows_committed = resumed_from
+        for chunk in iter_chunks(reader, converter, chunk_rows, skip_rows=resumed_from):
+            if bulk_load:
+                db.execute(text("SET LOCAL bidmaster.bulk_load = 'on'"))
+            checkpoint = _lock_checkpoint(db, batch_id, file_name, rows_committed)
+            rejected = copy_chunk(db, converter, chunk)
+            if rejected:
+                db.execute(insert(ImportQuarantine), [
+                    {"batch_id": batch_id, "file_name": file_name, "row_number": row.number,
+                     "raw_row": row.raw, "error": row.error}
+                    for row in rejected
+                ])
+            rows_committed = chunk[-1].number
+            loaded += len(chunk) - len(rejected)
+            quarantined += len(rejected)
+            checkpoint.rows_committed = rows_committed
+            checkpoint.rows_loaded += len(chunk) - len(rejected)
+            checkpoint.rows_quarantined += len(rejected)
+            checkpoint.status = "in_progress"
+            checkpoint.error = None
+            db.commit()
+
+        checkpoint = _lock_checkpoint(db, batch_id, file_name, rows_committed)
+        if bulk_load and checkpoint.rows_loaded:
+            db.execute(
+                text("SELECT finish_bulk_load(:table, :rows)"),
+                {"table": model.__tablename__, "rows": checkpoint.rows_loaded}
+            )
+        checkpoint.status = "done"
+        checkpoint.error = None
+
+        elapsed = time.perf_counter() - started
+        if not checkpoint.rows_loaded and not checkpoint.rows_quarantined:
+            msg = "Empty file warning"
+        else:
+            msg = (
+                f"Success: {loaded} records loaded "
+                f"({loaded / max(elapsed, 1e-6):.0f} rows/sec, "
+                f"worker peak RSS {worker_peak_rss_mb():.1f} MB)"
+            )
+            if quarantined:
+                msg += f", {quarantined} rows quarantined"
+            if resumed_from:
+                msg += f", resumed after row {resumed_from}"
+            msg += "."
+        # Лог фиксируется в одной транзакции с последней контрольной точкой файла
+        db.add(SystemLog(
+            level="WARNING" if quarantined else "INFO",
+            source="BATCH_IMPORT",
+            message=f"Batch {batch_id}: File {file_name} - {msg}"
+        ))
+        db.commit()
+        return msg
+
+    except Exception as e:
+        # Откатывается только незафиксированная порция: загруженные порции остаются,
+        # пакет можно возобновить с тем же batch_id
+        db.rollback()
+        error_msg = f"Error: {str(e)}"
+        db.query(ImportCheckpoint).filter_by(batch_id=batch_id, file_name=file_name).update(
+            {"status": "failed", "error": str(e)}
+        )
+        db.add(SystemLog(
+            level="ERROR",
+            source="BATCH_IMPORT",
+            message=f"Batch {batch_id}: File {file_name} failed. {error_msg}"
+        ))
+        db.commit()
+        return error_msg
+    finally:
+        if text_stream is not None:
+            # Не даем TextIOWrapper закрыть файл UploadFile при сборке мусора
+            text_stream.detach()
+        db.close()
+
+
 @router.post("/batch-import")
 async def batch_import_data(
         files: List[UploadFile],
-        db: Session = Depends(get_db)
+        bulk_load: bool = False,
+        batch_id: Optional[uuid.UUID] = None,
+        chunk_rows: int = Query(IMPORT_CHUNK_ROWS, ge=1, le=1_000_000),
+        db: AsyncSession = Depends(get_db)
 ):
+    """
+    Пакетная загрузка CSV. Чтобы продолжить прерванный или упавший пакет, передайте его batch_id
+    и те же файлы: завершенные файлы пропускаются, остальные продолжаются с последней зафиксированной порции.
+    """
     # Генерируем ID пакета, чтобы в логах отследить конкретную загрузку
-    batch_id = str(uuid.uuid4())
+    if batch_id is None:
+        batch_id = str(uuid.uuid4())
+        action = "Started uploading"
+    else:
+        batch_id = str(batch_id)
+        action = "Resumed with"
 
     log_start = SystemLog(
         level="INFO",
         source="BATCH_IMPORT",
-        message=f"Batch {batch_id}: Started uploading {len(files)} files."
+        message=f"Batch {batch_id}: {action} {len(files)} files."
     )
     db.add(log_start)
-    db.commit()
-
-    # Сортируем файлы по приоритету из CSV_MAPPING
-    sorted_files = sorted(
-        files,
-        key=lambda f: CSV_MAPPING.get(f.filename, (None, 99))[1]
-    )
+    await db.commit()
 
     report = {}
 
-    for file in sorted_files:
+    files_by_model = defaultdict(list)
+    for file in files:
         if file.filename not in CSV_MAPPING:
             report[file.filename] = "Skipped (Unknown file)"
             continue
+        files_by_model[CSV_MAPPING[file.filename]].append(file)
 
-        model, _ = CSV_MAPPING[file.filename]
-
-        try:
-            content = await file.read()
-            try:
-                decoded_content = content.decode("utf-8")
-            except UnicodeDecodeError:
-                decoded_content = content.decode("cp1251")
-
-            csv_file = io.StringIO(decoded_content)
-
-            # Пытаемся автоматически определить разделитель (запятая или точка с запятой)
-            try:
-                dialect = csv.Sniffer().sniff(decoded_content[:1024])
-                csv_reader = csv.DictReader(csv_file, dialect=dialect)
-            except:
-                csv_file.seek(0)
-                csv_reader = csv.DictReader(csv_file)
-
-            rows = []
-            for row in csv_reader:
-                clean_row = {}
-                for k, v in row.items():
-                    if not k: continue
-                    key = k.strip()
-                    value = v.strip() if v else None
-
-                    # Ручная конвертация булевых значений из CSV
-                    if key == "is_verified" and value:
-                        clean_row[key] = (value == "True")
-                    else:
-                        clean_row[key] = value
-
-                rows.append(clean_row)
-
-            if rows:
-                # Используем bulk_insert для скорости (вставка пачкой)
-                db.bulk_insert_mappings(model, rows)
-                db.commit()
-
-                msg = f"Success: {len(rows)} records loaded."
-                db.add(SystemLog(
-                    level="INFO",
-                    source="BATCH_IMPORT",
-                    message=f"Batch {batch_id}: File {file.filename} - {msg}"
-                ))
-                report[file.filename] = msg
-            else:
-                report[file.filename] = "Empty file warning"
-
-        except Exception as e:
-            # Если ошибка в конкретном файле — откатываем только его
-            db.rollback()
-            error_msg = f"Error: {str(e)}"
-            report[file.filename] = error_msg
-            db.add(SystemLog(
-                level="ERROR",
-                source="BATCH_IMPORT",
-                message=f"Batch {batch_id}: File {file.filename} failed. {error_msg}"
-            ))
-            db.commit()
+    # Уровни графа внешних ключей грузим по очереди, а файлы внутри уровня — параллельно,
+    # поэтому общее время ограничено самой длинной цепочкой зависимостей (users -> items -> auctions -> bids)
+    for level in dependency_levels(files_by_model):
+        level_files = [file for model in level for file in files_by_model[model]]
+        results = await asyncio.gather(*(
+            run_in_threadpool(_import_file, batch_id, CSV_MAPPING[file.filename], file, bulk_load, chunk_rows)
+            for file in level_files
+        ))
+        for file, result in zip(level_files, results):
+            report[file.filename] = result
+
+    return {"batch_id": batch_id, "report": report}
+
+
+@router.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """Контрольные точки файлов пакета: сколько строк зафиксировано, загружено и отправлено в карантин"""
+    result = await db.execute(
+        select(ImportCheckpoint)
+        .where(ImportCheckpoint.batch_id == str(batch_id))
+        .order_by(ImportCheckpoint.file_name)
+    )
+    checkpoints = result.scalars().all()
+    if not checkpoints:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {
+        "batch_id": str(batch_id),
+        "status": _batch_status(checkpoints),
+        "files": [
+            {
+                "file_name": c.file_name,
+                "table_name": c.table_name,
+                "status": c.status,
+                "rows_committed": c.rows_committed,
+                "rows_loaded": c.rows_loaded,
+                "rows_quarantined": c.rows_quarantined,
+                "error": c.error,
+                "updated_at": c.updated_at,
+            }
+            for c in checkpoints
+        ],
+    }
+
+
+def _batch_status(checkpoints) -> str:
+    statuses = {c.status for c in checkpoints}
+    if "failed" in statuses:
+        return "failed"
+    if "in_progress" in statuses:
+        return "in_progress"
+    return "done"
+
+
+@router.get("/batches/{batch_id}/quarantine")
+async def get_batch_quarantine(
+        batch_id: uuid.UUID,
+        response: Response,
+        file_name: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_db)
+):
+    """Отклоненные строки пакета с причиной. Страницы листаются курсором из заголовка X-Next-Cursor."""
+    columns = (ImportQuarantine.quarantine_id,)
+    query = select(ImportQuarantine).where(ImportQuarantine.batch_id == str(batch_id))
+    if file_name is not None:
+        query = query.where(ImportQuarantine.file_name == file_name)
+    try:
+        cursor_key = decode_cursor(cursor, "quarantine", key_types(columns)) if cursor else None
+        query = keyset_page(query, columns, False, cursor_key, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return {"batch_id": batch_id, "report": report}
\ No newline at end of file
+    result = await db.execute(query)
+    rows, next_cursor = split_page(result.scalars().all(), columns, "quarantine", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        {
+            "file_name": r.file_name,
+            "row_number": r.row_number,
+            "raw_row": r.raw_row,
+            "error": r.error,
+            "created_at": r.created_at,
+        }
+        for r in rows
+    ]
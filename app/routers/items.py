@@ -1,35 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.models import Item
-from app.schemas import ItemCreate, ItemUpdate, ItemResponse
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_db, get_read_db
+from app.models import Item, ItemCategory
+from app.schemas import ItemCreate, ItemUpdate, ItemResponse, ItemSearchResponse
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, key_types, keyset_page, split_page
 
 router = APIRouter(prefix="/items", tags=["Items (CRUD Demo)"])
 
 @router.post("/", response_model=ItemResponse)
-def create_item(item: ItemCreate, db: Session = Depends(get_db)):
+async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_db)):
     db_item = Item(**item.dict())
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
+ITEM_SORT_COLUMNS = (Item.item_id,)
+
 @router.get("/", response_model=List[ItemResponse])
-def read_items(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    # Простая пагинация через offset/limit
-    return db.query(Item).offset(skip).limit(limit).all()
+async def read_items(
+        response: Response,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = Query(10, ge=1),
+        category_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_read_db)
+):
+    # Keyset-пагинация по item_id: курсор следующей страницы — в заголовке X-Next-Cursor.
+    # skip/limit без курсора работают как раньше (OFFSET)
+    query = select(Item)
+    if category_id is not None:
+        query = query.join(ItemCategory, ItemCategory.item_id == Item.item_id).where(
+            ItemCategory.category_id == category_id
+        )
+
+    try:
+        cursor_key = decode_cursor(cursor, "item_id", key_types(ITEM_SORT_COLUMNS)) if cursor else None
+        query = keyset_page(query, ITEM_SORT_COLUMNS, False, cursor_key, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cursor_key is None and skip:
+        query = query.offset(skip)
+
+    result = await db.execute(query)
+    items, next_cursor = split_page(result.scalars().all(), ITEM_SORT_COLUMNS, "item_id", limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+# Поиск: предметы, подходящие под запрос и фильтры (кроме категории), — из них считаются фасеты;
+# страница — с фильтром категории, по убыванию релевантности. Все — одним запросом.
+# Совпадение ищется по GIN-индексу idx_items_search, ранг считается только для найденных строк.
+# Категории найденных предметов читаются по первичному ключу item_categories через = ANY(ARRAY(...)):
+# с обычным JOIN планировщик на тысячах совпадений выбирает hash join с полным чтением таблицы.
+SEARCH_SQL = """
+WITH matched AS (
+    SELECT i.item_id, ts_rank_cd(i.search_vector, q.query)::float8 AS rank
+    FROM items i, websearch_to_tsquery('russian', :q) AS q(query)
+    WHERE i.search_vector @@ q.query {filters}
+), filtered AS (
+    SELECT m.item_id, m.rank FROM matched m {category_filter}
+), page AS (
+    SELECT f.item_id, f.rank FROM filtered f
+    {after}
+    ORDER BY f.rank DESC, f.item_id DESC
+    LIMIT :limit_plus
+)
+SELECT
+    (SELECT COUNT(*) FROM filtered) AS total,
+    (SELECT COALESCE(json_agg(json_build_object(
+                'category_id', c.category_id, 'name', c.name, 'count', fc.n
+            ) ORDER BY fc.n DESC, c.category_id), '[]')::text
+     FROM (SELECT ic.category_id, COUNT(*) AS n
+           FROM item_categories ic
+           WHERE ic.item_id = ANY(ARRAY(SELECT item_id FROM matched))
+           GROUP BY ic.category_id) fc
+     JOIN categories c ON c.category_id = fc.category_id) AS categories,
+    (SELECT COALESCE(json_agg(json_build_object(
+                'item_id', i.item_id, 'owner_id', i.owner_id, 'title', i.title,
+                'description', i.description, 'year_created', i.year_created,
+                'is_verified', i.is_verified, 'created_at', i.created_at, 'rank', p.rank
+            ) ORDER BY p.rank DESC, p.item_id DESC), '[]')::text
+     FROM page p JOIN items i ON i.item_id = p.item_id) AS items
+"""
+
+@router.get("/search", response_model=ItemSearchResponse)
+async def search_items(
+        response: Response,
+        q: str = Query(..., min_length=1, description="Слова из названия или описания (синтаксис websearch)"),
+        category_id: Optional[int] = None,
+        year_from: Optional[int] = None,
+        year_to: Optional[int] = None,
+        is_verified: Optional[bool] = None,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Полнотекстовый поиск по предметам с фильтрами и фасетами по категориям.
+    Результаты упорядочены по релевантности; следующая страница — по курсору из X-Next-Cursor.
+    """
+    params = {"q": q, "limit_plus": limit + 1}
+    filters = []
+    if year_from is not None:
+        filters.append("i.year_created >= :year_from")
+        params["year_from"] = year_from
+    if year_to is not None:
+        filters.append("i.year_created <= :year_to")
+        params["year_to"] = year_to
+    if is_verified is not None:
+        filters.append("i.is_verified = :is_verified")
+        params["is_verified"] = is_verified
+
+    category_filter = ""
+    if category_id is not None:
+        category_filter = (
+            "WHERE EXISTS (SELECT 1 FROM item_categories ic "
+            "WHERE ic.item_id = m.item_id AND ic.category_id = :category_id)"
+        )
+        params["category_id"] = category_id
+
+    after = ""
+    if cursor:
+        try:
+            cursor_key = decode_cursor(cursor, "rank", (float, int))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        after = "WHERE (f.rank, f.item_id) < (:after_rank, :after_id)"
+        params["after_rank"], params["after_id"] = float(cursor_key[0]), int(cursor_key[1])
+
+    sql = SEARCH_SQL.format(
+        filters="".join(f" AND {f}" for f in filters), category_filter=category_filter, after=after
+    )
+    row = (await db.execute(text(sql), params)).one()
+
+    items = json.loads(row.items)
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor("rank", [items[-1]["rank"], items[-1]["item_id"]])
+    return {"total": row.total, "items": items, "categories": json.loads(row.categories)}
 
 @router.get("/{item_id}", response_model=ItemResponse)
-def read_item(item_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(Item).filter(Item.item_id == item_id).first()
+async def read_item(item_id: int, db: AsyncSession = Depends(get_read_db)):
+    db_item = await db.get(Item, item_id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return db_item
 
 @router.put("/{item_id}", response_model=ItemResponse)
-def update_item(item_id: int, item_update: ItemUpdate, db: Session = Depends(get_db)):
-    db_item = db.query(Item).filter(Item.item_id == item_id).first()
+async def update_item(item_id: int, item_update: ItemUpdate, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(Item, item_id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
@@ -38,16 +161,16 @@ def update_item(item_id: int, item_update: ItemUpdate, db: Session = Depends(get
     for key, value in item_update.dict(exclude_unset=True).items():
         setattr(db_item, key, value)
 
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 @router.delete("/{item_id}")
-def delete_item(item_id: int, db: Session = Depends(get_db)):
-    db_item = db.query(Item).filter(Item.item_id == item_id).first()
+async def delete_item(item_id: int, db: AsyncSession = Depends(get_db)):
+    db_item = await db.get(Item, item_id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    db.delete(db_item)
-    db.commit()
-    return {"detail": "Item deleted successfully"}
\ No newline at end of file
+    await db.delete(db_item)
+    await db.commit()
+    return {"detail": "Item deleted successfully"}
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import render
+
+router = APIRouter(tags=["Monitoring"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Схемы для предметов (CRUD)
@@ -35,6 +35,24 @@ class AuctionResponse(BaseModel):
     status: str
     start_time: datetime
     end_time: datetime
+    leader_id: Optional[int] = None
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# Полнотекстовый поиск предметов (GET /items/search)
+class ItemSearchHit(ItemResponse):
+    rank: float
+
+
+class CategoryFacet(BaseModel):
+    category_id: int
+    name: str
+    count: int
+
+
+class ItemSearchResponse(BaseModel):
+    total: int
+    items: List[ItemSearchHit]
+    # Число найденных предметов по категориям (без учета фильтра category_id)
+    categories: List[CategoryFacet]
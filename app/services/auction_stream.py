@@ -0,0 +1,189 @@
+"""
+Живые события аукционов для /auctions/{id}/stream.
+
+Триггер notify_auction_events шлет NOTIFY 'auction_events' с полным состоянием лота
+(цена, время окончания, статус) при каждом его изменении. Процесс слушает канал через общий
+pg_listener (одно соединение на воркер) и раздает события подписчикам в памяти, поэтому
+нагрузка на БД не зависит от числа зрителей: снимок при подключении берется из последнего
+известного состояния лота, а из БД читается только для лота, за которым еще никто не следил.
+
+Противодавление: у подписчика хранится не очередь, а одно последнее непрочитанное состояние.
+Медленный клиент пропускает промежуточные цены, но всегда получает актуальную и событие закрытия;
+память на подписчика ограничена одним событием.
+"""
+import asyncio
+import json
+import threading
+from decimal import Decimal
+from typing import Dict, Optional, Set
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.services.metrics import Counter, Gauge, register
+
+AUCTION_EVENTS_CHANNEL = "auction_events"
+
+STREAM_EVENTS = register(Counter("auction_stream_events_total", "Auction events delivered to stream subscribers."))
+STREAM_COALESCED = register(Counter(
+    "auction_stream_coalesced_total", "Auction events replaced by a newer one before a slow subscriber read them."))
+
+
+class AuctionEvent:
+    """Состояние лота: JSON в том виде, в каком его отправил триггер, и разобранные поля."""
+
+    __slots__ = ("raw", "auction_id", "status", "current_price")
+
+    def __init__(self, raw: str):
+        data = json.loads(raw, parse_float=Decimal)
+        self.raw = raw
+        self.auction_id = data["auction_id"]
+        self.status = data["status"]
+        self.current_price = Decimal(data["current_price"])
+
+    @property
+    def is_final(self) -> bool:
+        return self.status != "active"
+
+    def is_older_than(self, other: "AuctionEvent") -> bool:
+        # Цена идущего лота не уменьшается, а закрытый лот не открывается снова:
+        # так отбрасываем уведомление, обогнанное снимком из БД
+        if self.status == "active" and other.status != "active":
+            return True
+        return self.status == other.status and self.current_price < other.current_price
+
+
+class Subscriber:
+    def __init__(self, auction_id: int, loop: asyncio.AbstractEventLoop):
+        self.auction_id = auction_id
+        self._loop = loop
+        self._pending: Optional[AuctionEvent] = None
+        self._resync = False
+        self._ready = asyncio.Event()
+
+    def push(self, event: Optional[AuctionEvent]):
+        """Вызывается из потока слушателя. None — события могли потеряться, нужен новый снимок."""
+        self._loop.call_soon_threadsafe(self._set, event)
+
+    def _set(self, event: Optional[AuctionEvent]):
+        if event is None:
+            self._resync = True
+        else:
+            if self._pending is not None:
+                STREAM_COALESCED.inc()
+            self._pending = event
+        self._ready.set()
+
+    async def next(self, timeout: float):
+        """
+        Ждет следующее событие не дольше timeout.
+        Возвращает AuctionEvent, None (таймаут) или True, если нужно перечитать снимок.
+        """
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._ready.clear()
+        if self._resync:
+            self._resync = False
+            self._pending = None
+            return True
+        event, self._pending = self._pending, None
+        return event
+
+
+class AuctionStreams:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        # Последнее известное состояние лотов, у которых есть подписчики
+        self._state: Dict[int, AuctionEvent] = {}
+
+    def on_notify(self, payload: Optional[str]):
+        """Обработчик pg_listener (поток слушателя)."""
+        if payload is None:
+            # Переподключение: за время обрыва могли пропустить изменения
+            with self._lock:
+                self._state.clear()
+                subscribers = [s for subs in self._subscribers.values() for s in subs]
+            for subscriber in subscribers:
+                subscriber.push(None)
+            return
+
+        event = AuctionEvent(payload)
+        with self._lock:
+            subscribers = self._subscribers.get(event.auction_id)
+            if not subscribers:
+                return
+            known = self._state.get(event.auction_id)
+            if known is not None and event.is_older_than(known):
+                return
+            self._state[event.auction_id] = event
+            subscribers = list(subscribers)
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def subscribe(self, auction_id: int) -> Subscriber:
+        subscriber = Subscriber(auction_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(auction_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.auction_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.auction_id]
+                self._state.pop(subscriber.auction_id, None)
+
+    async def snapshot(self, auction_id: int) -> Optional[AuctionEvent]:
+        """Текущее состояние лота. Вызывать после subscribe(), чтобы не пропустить изменения."""
+        with self._lock:
+            event = self._state.get(auction_id)
+        if event is not None:
+            return event
+
+        raw = await run_in_threadpool(self._load, auction_id)
+        if raw is None:
+            return None
+        event = AuctionEvent(raw)
+        with self._lock:
+            known = self._state.get(auction_id)
+            if known is not None and not known.is_older_than(event):
+                # Пока читали, пришло уведомление не старее снимка
+                return known
+            if auction_id in self._subscribers:
+                self._state[auction_id] = event
+        return event
+
+    def _load(self, auction_id: int) -> Optional[str]:
+        # Тот же JSON, что строит триггер notify_auction_events
+        db = self._session_factory()
+        try:
+            return db.execute(text("""
+                SELECT json_build_object(
+                    'auction_id', auction_id,
+                    'status', status,
+                    'current_price', current_price,
+                    'end_time', end_time
+                )::text
+                FROM auctions WHERE auction_id = :id
+            """), {"id": auction_id}).scalar()
+        finally:
+            db.close()
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+auction_streams = AuctionStreams()
+
+register(Gauge("auction_stream_subscribers", "Open /auctions/{id}/stream connections.",
+               lambda: [({}, auction_streams.subscriber_count())]))
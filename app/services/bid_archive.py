@@ -0,0 +1,71 @@
+"""
+Перенос ставок закрытых аукционов в архивную секцию bids_archive.
+
+Ставки лота, закрытого больше BIDS_ARCHIVE_AFTER_DAYS назад, больше не читаются горячими путями
+(place_bid, пакетный прием, закрытие торгов), но раздувают индексы bids. Задача порциями
+переносит их функцией archive_finished_bids (каждая порция — отдельная транзакция), после чего
+VACUUM возвращает место в горячей секции, а архивная секция замораживается и больше не
+требует внимания autovacuum.
+
+VACUUM не выполняется внутри транзакции, поэтому задача работает на AUTOCOMMIT-соединении,
+а от параллельного запуска в других воркерах защищается сессионной advisory-блокировкой.
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, engine
+from app.models import SystemLog
+from app.services.periodic import PeriodicJob
+
+ARCHIVE_INTERVAL = float(os.getenv("BIDS_ARCHIVE_INTERVAL_SEC", "3600"))
+# Сколько дней после окончания торгов ставки лота остаются в горячей секции
+ARCHIVE_AFTER_DAYS = int(os.getenv("BIDS_ARCHIVE_AFTER_DAYS", "7"))
+# Лотов в одной транзакции переноса
+ARCHIVE_BATCH_AUCTIONS = int(os.getenv("BIDS_ARCHIVE_BATCH_AUCTIONS", "500"))
+
+ARCHIVE_LOCK_KEY = 7_140_015
+
+
+def run_bid_archive(session_factory=SessionLocal) -> Optional[dict]:
+    """Один проход архивации. None — если его прямо сейчас выполняет другой процесс."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ARCHIVE_LOCK_KEY}).scalar():
+            return None
+        try:
+            auctions = bids = 0
+            while True:
+                moved = conn.execute(
+                    text("SELECT * FROM archive_finished_bids(make_interval(days => :days), :batch)"),
+                    {"days": ARCHIVE_AFTER_DAYS, "batch": ARCHIVE_BATCH_AUCTIONS},
+                ).one()
+                auctions += moved.auctions_moved
+                bids += moved.bids_moved
+                if moved.auctions_moved < ARCHIVE_BATCH_AUCTIONS:
+                    break
+
+            if bids:
+                conn.execute(text("VACUUM (ANALYZE) bids_hot"))
+                conn.execute(text("VACUUM (FREEZE, ANALYZE) bids_archive"))
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+
+    if bids:
+        db = session_factory()
+        try:
+            db.add(SystemLog(
+                level="INFO",
+                source="BID_ARCHIVE",
+                message=f"Archived {bids} bids of {auctions} finished auctions."
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+        finally:
+            db.close()
+    return {"auctions": auctions, "bids": bids}
+
+
+# Перенесенные порции фиксируются сразу: после ошибки остальное доделает следующий проход
+bid_archiver = PeriodicJob("bid-archive", run_bid_archive, ARCHIVE_INTERVAL)
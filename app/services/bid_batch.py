@@ -0,0 +1,149 @@
+"""
+Пакетный прием ставок (POST /auctions/bids:batch).
+
+Вместо place_bid_atomic на каждую ставку: затронутые лоты читаются одним запросом
+под блокировкой строк, пользователи — другим, затем ставки проигрываются в памяти
+в порядке поступления по тем же правилам, что и последовательные вызовы place_bid
+(проверки, свободные средства по реестру user_exposure, прокси-ставки, антиснайпинг).
+Принятые ставки вставляются многострочным INSERT (по INSERT_CHUNK строк) в том же порядке,
+поэтому триггеры на bids приходят к той же цене, лидеру и времени окончания, что и симуляция.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+
+from app.models import Bid
+from app.services.bid_engine import SNIPING_EXTENSION, SNIPING_WINDOW
+from app.services.proxy_bidding import ProxyBook, proxy_books, resolve
+
+CENT = Decimal("0.01")
+
+# Строк в одном INSERT ... VALUES: держимся ниже лимита параметров драйвера (asyncpg — 32767)
+INSERT_CHUNK = 1000
+
+
+@dataclass
+class LotState:
+    status: str
+    end_time: datetime
+    current_price: Decimal
+    leader_id: Optional[int] = None
+
+
+@dataclass
+class BidOutcome:
+    result: str  # 'accepted' или код отказа place_bid_atomic
+    new_price: Optional[Decimal] = None
+    new_end_time: Optional[datetime] = None
+    leader_id: Optional[int] = None
+
+
+def simulate(bids: List[Tuple[int, int, Decimal]], lots: Dict[int, LotState], funds: Dict[int, Decimal],
+             books: Dict[int, ProxyBook], now: datetime):
+    """
+    Проигрывает ставки (auction_id, user_id, amount) по порядку, изменяя lots и funds
+    (свободные средства: баланс минус обязательства из user_exposure).
+    Возвращает (исходы по ставкам, строки для вставки в bids).
+    """
+    outcomes, rows = [], []
+
+    def accept(auction_id: int, lot: LotState, user_id: int, amount: Decimal):
+        rows.append({"auction_id": auction_id, "user_id": user_id, "amount": amount, "bid_time": now})
+        # Прежний лидер освобождает цену лота, новый ее резервирует (как триггер реестра)
+        if lot.leader_id in funds:
+            funds[lot.leader_id] += lot.current_price
+        funds[user_id] -= amount
+        lot.current_price = amount
+        lot.leader_id = user_id
+        # Правило триггера trg_apply_bids (одно продление на оператор: у всех ставок пакета одно время)
+        if lot.end_time - now < SNIPING_WINDOW:
+            lot.end_time += SNIPING_EXTENSION
+
+    def check(lot: Optional[LotState], user_id: int, amount: Decimal) -> Optional[str]:
+        # Порядок проверок — как в place_bid_atomic
+        if lot is None:
+            return 'auction_not_found'
+        if lot.status != 'active':
+            return 'not_active'
+        if lot.end_time < now:
+            return 'finished'
+        if amount <= lot.current_price:
+            return 'too_low'
+        if user_id not in funds:
+            return 'user_not_found'
+        # Повышая свою же лидирующую ставку, пользователь заменяет обязательство, а не добавляет
+        available = funds[user_id] + (lot.current_price if lot.leader_id == user_id else 0)
+        if available < amount:
+            return 'insufficient_funds'
+        return None
+
+    for auction_id, user_id, amount in bids:
+        lot = lots.get(auction_id)
+        reason = check(lot, user_id, amount)
+        if reason is not None:
+            outcomes.append(BidOutcome(reason, lot.current_price if lot else None, lot.end_time if lot else None))
+            continue
+
+        accept(auction_id, lot, user_id, amount)
+        book = books.get(auction_id)
+        if book is not None and len(book):
+            for proxy_user_id, proxy_amount in resolve(book, user_id, amount)[1:]:
+                if check(lot, proxy_user_id, proxy_amount) is not None:
+                    break
+                accept(auction_id, lot, proxy_user_id, proxy_amount)
+        outcomes.append(BidOutcome('accepted', lot.current_price, lot.end_time, lot.leader_id))
+
+    return outcomes, rows
+
+
+def place_batch(db, bids: List[Tuple[int, int, Decimal]]) -> List[BidOutcome]:
+    """Принимает пакет ставок в текущей транзакции сессии db. Commit делает вызывающий."""
+    # Округляем как DECIMAL(12, 2) в БД, иначе сравнения в симуляции разойдутся с place_bid_atomic
+    bids = [(auction_id, user_id, amount.quantize(CENT, ROUND_HALF_UP)) for auction_id, user_id, amount in bids]
+    auction_ids = sorted({auction_id for auction_id, _, _ in bids})
+
+    # Блокируем строки лотов в порядке id: параллельные пакеты не зациклятся на блокировках,
+    # а одиночные place_bid подождут окончания пакета
+    lot_rows = db.execute(text("""
+        SELECT auction_id, status, end_time, COALESCE(current_price, 0) AS current_price, leader_id,
+               LOCALTIMESTAMP AS db_now
+        FROM auctions
+        WHERE auction_id = ANY(:ids)
+        ORDER BY auction_id
+        FOR UPDATE
+    """), {"ids": auction_ids}).all()
+    if not lot_rows:
+        return [BidOutcome('auction_not_found') for _ in bids]
+
+    now = lot_rows[0].db_now
+    lots = {row.auction_id: LotState(row.status, row.end_time, row.current_price, row.leader_id) for row in lot_rows}
+
+    books = proxy_books.get_many(db, list(lots))
+    user_ids = {user_id for _, user_id, _ in bids}
+    user_ids.update(lot.leader_id for lot in lots.values() if lot.leader_id is not None)
+    for book in books.values():
+        user_ids.update(proxy.user_id for proxy in book.top(len(book)))
+    # Строки реестра блокируются после лотов и в порядке user_id — как в place_bid_atomic
+    funds = {
+        row.user_id: row.funds
+        for row in db.execute(
+            text("""
+                SELECT u.user_id, COALESCE(u.balance, 0) - e.leading_amount - e.escrow_amount AS funds
+                FROM users u
+                JOIN user_exposure e ON e.user_id = u.user_id
+                WHERE u.user_id = ANY(:ids)
+                ORDER BY u.user_id
+                FOR UPDATE OF e
+            """),
+            {"ids": sorted(user_ids)},
+        )
+    }
+
+    # Истекшие лоты только отклоняют ставки: закрывает их с победителем и escrow settle_auctions
+    outcomes, rows = simulate(bids, lots, funds, books, now)
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(Bid).values(rows[start:start + INSERT_CHUNK]))
+    return outcomes
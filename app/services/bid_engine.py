@@ -0,0 +1,403 @@
+"""
+In-memory движок ставок для "горячих" аукционов.
+
+Состояние активных лотов (цена, лидер, время окончания, статус) и свободные средства
+пользователей (баланс минус обязательства из user_exposure) живут в памяти процесса,
+ставки валидируются и упорядочиваются под локом конкретного аукциона,
+а принятые ставки пишутся в БД фоновым потоком небольшими пачками (write-behind).
+При старте состояние восстанавливается из таблиц auctions/bids.
+
+Средства пользователя перечитываются из БД раз в BID_ENGINE_FUNDS_TTL_SEC и сразу по NOTIFY
+'user_funds_changed' (баланс, escrow, сверка реестра). Реестр в БД не знает о еще не записанных
+ставках, поэтому к прочитанному значению добавляются их изменения, которые движок ведет сам.
+
+Движок включается переменной BID_ENGINE_ENABLED=1 и рассчитан на один процесс
+uvicorn: при нескольких воркерах у каждого было бы свое состояние лотов.
+"""
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional
+
+from sqlalchemy import insert, text
+
+from app.database import SessionLocal
+from app.models import Bid, SystemLog
+
+# Правило антиснайпинга — то же, что в триггере trg_apply_bids
+SNIPING_WINDOW = timedelta(minutes=5)
+SNIPING_EXTENSION = timedelta(minutes=10)
+
+BID_ENGINE_ENABLED = os.getenv("BID_ENGINE_ENABLED", "0") == "1"
+FLUSH_BATCH_SIZE = int(os.getenv("BID_ENGINE_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("BID_ENGINE_FLUSH_MS", "20")) / 1000
+FLUSH_RETRIES = 3
+FUNDS_TTL = float(os.getenv("BID_ENGINE_FUNDS_TTL_SEC", "30"))
+
+# Канал NOTIFY триггеров на users и escrow_accounts (см. 0021_user_funds_notify.sql)
+FUNDS_CHANNEL = "user_funds_changed"
+
+
+class BidRejected(Exception):
+    """Ставка отклонена. Несет HTTP-код и текст ошибки для роутера."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class AuctionState:
+    auction_id: int
+    current_price: Decimal
+    end_time: datetime
+    status: str
+    leader_id: Optional[int] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+@dataclass
+class PendingBid:
+    auction_id: int
+    user_id: int
+    amount: Decimal
+    bid_time: datetime
+    # Прежний лидер лота и цена, которую ставка ему освобождает
+    released_to: Optional[int] = None
+    released: Decimal = Decimal(0)
+
+
+class BidEngine:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._auctions: Dict[int, AuctionState] = {}
+        # Свободные средства меняются ставками в разных лотах, поэтому у них свой лок
+        self._funds: Dict[int, Decimal] = {}
+        # Когда средства пользователя читались из БД (time.monotonic())
+        self._funds_loaded: Dict[int, float] = {}
+        # Изменения средств от принятых, но еще не записанных ставок: в реестре БД их пока нет
+        self._unwritten: Dict[int, Decimal] = {}
+        self._funds_lock = threading.Lock()
+        # Commit пачки и учет ее в _unwritten — одно действие для читающего средства из БД
+        self._commit_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stopped = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        self.recover()
+        self._stopped.clear()
+        self._writer = threading.Thread(target=self._run_writer, name="bid-engine-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Останавливает фоновую запись, дописав все принятые ставки."""
+        self._stopped.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def recover(self):
+        """Восстанавливает состояние активных аукционов из таблиц auctions/bids."""
+        db = self._session_factory()
+        try:
+            rows = db.execute(text("""
+                SELECT a.auction_id, a.current_price, a.end_time, a.status, a.leader_id, MAX(b.amount) AS max_bid
+                FROM auctions a
+                LEFT JOIN bids b ON b.auction_id = a.auction_id
+                WHERE a.status = 'active'
+                GROUP BY a.auction_id
+            """)).all()
+        finally:
+            db.close()
+
+        self._auctions = {
+            row.auction_id: AuctionState(
+                auction_id=row.auction_id,
+                current_price=max(row.current_price or Decimal(0), row.max_bid or Decimal(0)),
+                end_time=row.end_time,
+                status=row.status,
+                leader_id=row.leader_id,
+            )
+            for row in rows
+        }
+        self._funds = {}
+        self._funds_loaded = {}
+
+    # --- Ставки ---
+
+    def place(self, auction_id: int, user_id: int, amount, resolver=None) -> AuctionState:
+        """
+        Принимает или отклоняет ставку (BidRejected) без обращения к БД,
+        если лот и пользователь уже в памяти. Возвращает новое состояние лота.
+        resolver(amount) -> [(user_id, amount), ...] — ответные прокси-ставки,
+        они применяются под тем же локом, что и ручная ставка.
+        """
+        amount = Decimal(str(amount))
+        state = self._get_auction(auction_id)
+        funds = self._get_funds(user_id)
+
+        with state.lock:
+            now = datetime.now()
+            # Проверки в том же порядке, что и в синхронном place_bid
+            if state.status != 'active':
+                raise BidRejected(400, "Auction is not active")
+
+            # Лот не закрываем сами: это сделает планировщик через settle_auctions (победитель и escrow)
+            if now > state.end_time:
+                raise BidRejected(400, "Auction finished")
+
+            if amount <= state.current_price:
+                raise BidRejected(400, f"Bid must be higher than {state.current_price}")
+
+            if funds is None:
+                raise BidRejected(404, "User not found")
+
+            if not self._reserve(state, user_id, amount):
+                raise BidRejected(400, "Insufficient funds")
+
+            self._accept(state, user_id, amount, now)
+
+            if resolver is not None:
+                for proxy_user_id, proxy_amount in resolver(amount)[1:]:
+                    if proxy_amount <= state.current_price or self._get_funds(proxy_user_id) is None:
+                        break
+                    if not self._reserve(state, proxy_user_id, proxy_amount):
+                        break
+                    self._accept(state, proxy_user_id, proxy_amount, now)
+
+            return AuctionState(auction_id, state.current_price, state.end_time, state.status, state.leader_id)
+
+    def _reserve(self, state: AuctionState, user_id: int, amount: Decimal) -> bool:
+        """
+        Проверяет и списывает свободные средства под новую лидирующую ставку (вызывается под state.lock).
+        Прежний лидер лота получает цену лота обратно — так же реестр меняет триггер на auctions.
+        """
+        with self._funds_lock:
+            available = self._funds[user_id]
+            if state.leader_id == user_id:
+                available += state.current_price
+            if available < amount:
+                return False
+            if state.leader_id is not None:
+                if state.leader_id in self._funds:
+                    self._funds[state.leader_id] += state.current_price
+                self._add_unwritten(state.leader_id, state.current_price)
+            self._funds[user_id] -= amount
+            self._add_unwritten(user_id, -amount)
+            return True
+
+    def _accept(self, state: AuctionState, user_id: int, amount: Decimal, now: datetime):
+        pending = PendingBid(state.auction_id, user_id, amount, now, state.leader_id, state.current_price)
+        state.current_price = amount
+        state.leader_id = user_id
+        if state.end_time - now < SNIPING_WINDOW:
+            state.end_time += SNIPING_EXTENSION
+
+        # Очередь общая, но ставки одного лота попадают в нее строго в порядке принятия
+        self._queue.put(pending)
+
+    def mark_finished(self, auction_id: int):
+        """Закрывает лот для новых ставок и дожидается записи уже принятых."""
+        state = self._auctions.get(auction_id)
+        if state is not None:
+            with state.lock:
+                state.status = 'finished'
+        self.flush()
+
+    def expire(self, auction_ids) -> Dict[int, datetime]:
+        """
+        Закрывает для ставок лоты, время которых вышло (вызывается планировщиком закрытия),
+        и дожидается записи принятых ставок. Возвращает лоты, продленные антиснайпингом
+        в памяти, но еще не записанные в БД: {auction_id: новое end_time}.
+        """
+        now = datetime.now()
+        extended = {}
+        for auction_id in auction_ids:
+            state = self._auctions.get(auction_id)
+            if state is None:
+                continue
+            with state.lock:
+                if state.status == 'active' and state.end_time > now:
+                    extended[auction_id] = state.end_time
+                else:
+                    state.status = 'finished'
+        self.flush()
+        return extended
+
+    def forget(self, auction_id: int):
+        """Выбрасывает лот из памяти: при следующей ставке он будет перечитан из БД вместе со средствами лидера."""
+        state = self._auctions.pop(auction_id, None)
+        if state is not None and state.leader_id is not None:
+            self._expire_funds([state.leader_id])
+
+    def on_funds_changed(self, payload: Optional[str]):
+        """Обработчик pg_listener: средства изменились не ставками. Пустой payload — у всех пользователей."""
+        if payload:
+            self._expire_funds(int(user_id) for user_id in payload.split(","))
+        else:
+            self._expire_funds(None)
+
+    def _expire_funds(self, user_ids):
+        """Помечает средства пользователей (None — всех) устаревшими: они перечитаются при следующей ставке."""
+        with self._funds_lock:
+            for user_id in list(self._funds_loaded) if user_ids is None else user_ids:
+                if user_id in self._funds_loaded:
+                    self._funds_loaded[user_id] = float("-inf")
+
+    def _add_unwritten(self, user_id: int, delta: Decimal):
+        # Вызывается под _funds_lock
+        total = self._unwritten.get(user_id, Decimal(0)) + delta
+        if total:
+            self._unwritten[user_id] = total
+        else:
+            self._unwritten.pop(user_id, None)
+
+    def _drop_unwritten(self, batch: list):
+        """Ставки пачки записаны в БД (или не будут записаны никогда): реестр БД больше не отстает на них."""
+        with self._funds_lock:
+            for entry in batch:
+                self._add_unwritten(entry.user_id, entry.amount)
+                if entry.released_to is not None:
+                    self._add_unwritten(entry.released_to, -entry.released)
+
+    def flush(self):
+        """Блокируется, пока фоновый поток не запишет все принятые ставки."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def _get_auction(self, auction_id: int) -> AuctionState:
+        state = self._auctions.get(auction_id)
+        if state is not None:
+            return state
+
+        db = self._session_factory()
+        try:
+            row = db.execute(
+                text("SELECT auction_id, current_price, end_time, status, leader_id FROM auctions WHERE auction_id = :id"),
+                {"id": auction_id},
+            ).first()
+        finally:
+            db.close()
+        if row is None:
+            raise BidRejected(404, "Auction not found")
+
+        loaded = AuctionState(row.auction_id, row.current_price or Decimal(0), row.end_time, row.status, row.leader_id)
+        # Если параллельный запрос успел загрузить лот раньше — используем его состояние
+        return self._auctions.setdefault(auction_id, loaded)
+
+    def _get_funds(self, user_id: int) -> Optional[Decimal]:
+        with self._funds_lock:
+            if user_id in self._funds and time.monotonic() - self._funds_loaded[user_id] < FUNDS_TTL:
+                return self._funds[user_id]
+
+        # Пока читаем, писатель не фиксирует пачки: иначе прочитанное значение могло бы уже включать
+        # ставки, которые еще числятся в _unwritten, и они учлись бы дважды
+        with self._commit_lock:
+            db = self._session_factory()
+            try:
+                row = db.execute(
+                    text("""
+                        SELECT COALESCE(u.balance, 0) - COALESCE(e.leading_amount + e.escrow_amount, 0) AS funds
+                        FROM users u
+                        LEFT JOIN user_exposure e ON e.user_id = u.user_id
+                        WHERE u.user_id = :id
+                    """),
+                    {"id": user_id},
+                ).first()
+            finally:
+                db.close()
+            if row is None:
+                return None
+
+            with self._funds_lock:
+                self._funds[user_id] = row.funds + self._unwritten.get(user_id, Decimal(0))
+                self._funds_loaded[user_id] = time.monotonic()
+                return self._funds[user_id]
+
+    # --- Фоновая запись ---
+
+    def _run_writer(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._drain()
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _drain(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+        while len(batch) < FLUSH_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list):
+        for attempt in range(FLUSH_RETRIES):
+            db = self._session_factory()
+            try:
+                self._write(db, batch)
+                with self._commit_lock:
+                    db.commit()
+                    self._drop_unwritten(batch)
+                return
+            except Exception:
+                db.rollback()
+                time.sleep(FLUSH_INTERVAL * (attempt + 1))
+            finally:
+                db.close()
+
+        # Пачка не записалась целиком — пишем по одной, чтобы не потерять остальные ставки
+        for entry in batch:
+            db = self._session_factory()
+            try:
+                self._write(db, [entry])
+                with self._commit_lock:
+                    db.commit()
+                    self._drop_unwritten([entry])
+            except Exception as e:
+                db.rollback()
+                # Состояние лота и средства участников в памяти разошлись с БД — перечитаем их при следующей ставке
+                self._drop_unwritten([entry])
+                self._expire_funds([entry.user_id, entry.released_to])
+                self.forget(entry.auction_id)
+                self._log_error(f"Auction {entry.auction_id}: failed to persist {entry}. {str(e)}")
+            finally:
+                db.close()
+
+    def _log_error(self, message: str):
+        db = self._session_factory()
+        try:
+            db.add(SystemLog(level="ERROR", source="BID_ENGINE", message=message))
+            db.commit()
+        except Exception:
+            # БД недоступна — поток записи не должен падать из-за лога
+            db.rollback()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write(db, batch: list):
+        # Порядок сохраняется: ставки уходят одним многострочным INSERT в порядке принятия
+        db.execute(insert(Bid), [
+            {"auction_id": entry.auction_id, "user_id": entry.user_id, "amount": entry.amount, "bid_time": entry.bid_time}
+            for entry in batch
+        ])
+
+
+bid_engine = BidEngine() if BID_ENGINE_ENABLED else None
@@ -0,0 +1,245 @@
+"""
+Загрузка CSV через COPY порциями.
+
+Значения разбираются конвертерами, построенными по типам колонок модели; строки, которые
+не разбираются или отвергаются БД, возвращаются вызывающему (карантин), а остальные
+строки порции загружаются. Транзакциями и контрольными точками управляет вызывающий код.
+"""
+import codecs
+import csv
+import io
+import resource
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterator, List, Optional
+
+import psycopg2
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, String
+
+# Размер порции, которой читаем загруженный файл с диска
+READ_CHUNK_SIZE = 64 * 1024
+# Размер порции, которую psycopg2 запрашивает у потока при COPY
+COPY_BUFFER_SIZE = 256 * 1024
+
+# Экранирование спецсимволов для текстового формата COPY
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_COPY_NULL = "\\N"
+
+# Ошибки в данных строк (SQLSTATE классов 22 и 23): только их ищем делением порции. Взаимоблокировка,
+# таймаут или обрыв соединения к строкам отношения не имеют — порция повторяется от контрольной точки
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+def detect_encoding(raw) -> str:
+    """Определяет кодировку по первой порции файла (utf-8, иначе cp1251)."""
+    head = raw.read(READ_CHUNK_SIZE)
+    raw.seek(0)
+    try:
+        # final=False: порция может оборваться посреди многобайтового символа
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def _sniff_dialect(raw, encoding: str):
+    """Пытаемся определить разделитель (запятая или точка с запятой) по началу файла."""
+    sample = raw.read(READ_CHUNK_SIZE).decode(encoding, errors="ignore")[:1024]
+    raw.seek(0)
+    try:
+        return csv.Sniffer().sniff(sample)
+    except csv.Error:
+        return csv.excel
+
+
+class ConversionError(ValueError):
+    pass
+
+
+_TRUE = {"true", "t", "1", "yes", "y", "on", "да"}
+_FALSE = {"false", "f", "0", "no", "n", "off", "нет"}
+
+
+def _to_bool(value: str) -> bool:
+    lowered = value.lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ConversionError(f"not a boolean: {value!r}")
+
+
+def _to_str(length: Optional[int]):
+    def convert(value: str) -> str:
+        if length is not None and len(value) > length:
+            raise ConversionError(f"longer than {length} characters")
+        return value
+    return convert
+
+
+def build_converter(column) -> Callable[[str], Any]:
+    """Функция разбора строкового значения CSV по типу колонки SQLAlchemy."""
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return _to_bool
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, Numeric):
+        return Decimal
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column_type, Date):
+        return date.fromisoformat
+    if isinstance(column_type, String):
+        return _to_str(column_type.length)
+    return _to_str(None)
+
+
+def _format_value(value) -> str:
+    """Значение Python -> поле текстового формата COPY"""
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class RowConverter:
+    """
+    Сопоставляет заголовок CSV с колонками модели и разбирает строки.
+    Конвертеры строятся один раз на файл по типам колонок модели. Вычисляемые колонки
+    (например, items.search_vector) и неизвестные колонки файла пропускаются.
+    """
+
+    def __init__(self, model, header: List[str]):
+        table = model.__table__
+        self.table_name = table.name
+        self.indices, self.columns, self.converters = [], [], []
+        for idx, name in enumerate(header):
+            key = name.strip() if name else ""
+            if key in table.columns and table.columns[key].computed is None:
+                self.indices.append(idx)
+                self.columns.append(key)
+                self.converters.append(build_converter(table.columns[key]))
+        if not self.columns:
+            raise ValueError("File has no columns matching table " + table.name)
+
+    def to_copy_line(self, row: List[str]) -> str:
+        """Строка CSV -> строка COPY. ConversionError с именем колонки, если значение не разбирается."""
+        values = []
+        for idx, column, convert in zip(self.indices, self.columns, self.converters):
+            raw = row[idx].strip() if idx < len(row) else ""
+            try:
+                values.append(_format_value(convert(raw) if raw else None))
+            except ConversionError as e:
+                raise ConversionError(f"{column}: {e}") from None
+            except (ValueError, ArithmeticError):
+                raise ConversionError(f"{column}: invalid value {raw!r}") from None
+        return "\t".join(values) + "\n"
+
+    def copy_sql(self) -> str:
+        column_list = ", ".join(f'"{c}"' for c in self.columns)
+        return f'COPY "{self.table_name}" ({column_list}) FROM STDIN'
+
+
+@dataclass
+class ChunkRow:
+    number: int  # номер строки данных в файле, с 1 (без заголовка)
+    raw: List[str]
+    line: Optional[str] = None  # строка COPY; None — не прошла конвертацию
+    error: Optional[str] = None
+
+
+def open_csv(upload):
+    """
+    Открывает CSV из UploadFile: (reader, header, text_stream).
+    text_stream нужно отсоединить (detach) после чтения, иначе он закроет файл UploadFile.
+    """
+    raw = upload.file
+    raw.seek(0)
+    encoding = detect_encoding(raw)
+    dialect = _sniff_dialect(raw, encoding)
+    text_stream = io.TextIOWrapper(raw, encoding=encoding, newline="")
+    reader = csv.reader(text_stream, dialect=dialect)
+    return reader, next(reader, None), text_stream
+
+
+def iter_chunks(reader, converter: RowConverter, chunk_rows: int, skip_rows: int = 0) -> Iterator[List[ChunkRow]]:
+    """Порции по chunk_rows строк данных; первые skip_rows строк (уже загруженные) пропускаются."""
+    number = 0
+    chunk = []
+    for row in reader:
+        if not row:
+            continue
+        number += 1
+        if number <= skip_rows:
+            continue
+        item = ChunkRow(number, row)
+        try:
+            item.line = converter.to_copy_line(row)
+        except ConversionError as e:
+            item.error = str(e)
+        chunk.append(item)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_lines(db, sql: str, rows: List[ChunkRow]):
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(sql, io.StringIO("".join(r.line for r in rows)), size=COPY_BUFFER_SIZE)
+    finally:
+        cursor.close()
+
+
+def copy_chunk(db, converter: RowConverter, rows: List[ChunkRow]) -> List[ChunkRow]:
+    """
+    Загружает порцию в текущей транзакции сессии db. Возвращает отклоненные строки с ошибками.
+    Если COPY падает из-за данных (тип, внешний ключ, CHECK, NOT NULL), порция делится пополам
+    и каждая половина грузится в своей точке сохранения, пока ошибка не сузится до одной строки:
+    k плохих строк стоят O(k * log(размер порции)) повторов COPY, остальные строки порции загружаются.
+    Прочие ошибки БД пробрасываются вызывающему.
+    """
+    rejected = [r for r in rows if r.line is None]
+    pending = [r for r in rows if r.line is not None]
+    sql = converter.copy_sql()
+
+    def load(part: List[ChunkRow]):
+        if not part:
+            return
+        savepoint = db.begin_nested()
+        try:
+            _copy_lines(db, sql, part)
+            savepoint.commit()
+            return
+        except ROW_ERRORS as e:
+            savepoint.rollback()
+            if len(part) == 1:
+                # CONTEXT ссылается на строку внутри повтора COPY, а не файла: оставляем суть и DETAIL
+                diag = e.diag
+                part[0].error = diag.message_primary or str(e).strip()
+                if diag.message_detail:
+                    part[0].error += " " + diag.message_detail
+                rejected.append(part[0])
+                return
+        middle = len(part) // 2
+        load(part[:middle])
+        load(part[middle:])
+
+    load(pending)
+    rejected.sort(key=lambda r: r.number)
+    return rejected
+
+
+def worker_peak_rss_mb() -> float:
+    """
+    Максимальный RSS процесса воркера за все время его жизни (ru_maxrss), МБ.
+    Это не память одного файла: значение только растет, а файлы пакета грузятся параллельно в том же процессе.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
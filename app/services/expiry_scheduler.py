@@ -0,0 +1,227 @@
+"""
+Фоновое закрытие истекших аукционов.
+
+Ближайшие окончания лотов держатся в куче (end_time, auction_id). Поток спит до ближайшего
+окончания, затем закрывает пачку наступивших лотов функцией settle_auctions: один SQL-оператор
+переводит лоты в finished и создает счета escrow для победителей.
+
+Продления антиснайпинга не отслеживаются отдельно: settle_auctions пропускает лоты, у которых
+end_time уже сдвинулся, и планировщик переставляет их на новое время. Раз в EXPIRY_REFRESH_SEC
+куча перечитывается из БД — так подхватываются лоты, созданные другими воркерами.
+
+Работает только в одном процессе: лидер держит сессионную advisory-блокировку на отдельном
+соединении. Если лидер умирает, соединение закрывается, и блокировку забирает другой воркер.
+"""
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, engine
+from app.models import SystemLog
+from app.services.bid_engine import bid_engine
+from app.services.metrics import Counter, Gauge, register
+
+EXPIRY_SCHEDULER_ENABLED = os.getenv("EXPIRY_SCHEDULER_ENABLED", "1") == "1"
+BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+REFRESH_INTERVAL = float(os.getenv("EXPIRY_REFRESH_SEC", "10"))
+# Куча хранит только лоты, заканчивающиеся в этом окне: остальные подхватит следующее перечитывание
+HORIZON = timedelta(seconds=REFRESH_INTERVAL * 3)
+# Если часы приложения и БД расходятся, не закрытый лот повторяем не чаще раза в секунду
+RETRY_DELAY = timedelta(seconds=1)
+
+# Ключ advisory-блокировки лидера (произвольная константа приложения)
+LEADER_LOCK_KEY = 7_140_011
+
+AUCTIONS_SETTLED = register(Counter("auctions_settled_total", "Auctions closed by the expiry scheduler."))
+
+
+class ExpiryScheduler:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.is_leader = False
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="expiry-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def schedule(self, auction_id: int, end_time: datetime):
+        """Добавляет (или переносит) закрытие лота. Без лидерства вызов ничего не меняет."""
+        if not self.is_leader or end_time - datetime.now() > HORIZON:
+            return
+        with self._lock:
+            self._push(auction_id, end_time)
+        self._wake.set()
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    # --- Фоновый поток ---
+
+    def _run(self):
+        while not self._stopped.is_set():
+            leader_conn = engine.raw_connection()
+            leading = False
+            try:
+                leading = self._try_lead(leader_conn)
+                if leading:
+                    self.is_leader = True
+                    self._serve(leader_conn)
+            except Exception as e:
+                self._log("ERROR", f"Expiry scheduler failed: {str(e)}")
+            finally:
+                self.is_leader = False
+                if leading:
+                    # Закрываем, а не возвращаем в пул: вместе с сессией отпускается advisory-блокировка
+                    leader_conn.invalidate()
+                else:
+                    leader_conn.close()
+            self._stopped.wait(REFRESH_INTERVAL)
+
+    @staticmethod
+    def _try_lead(conn) -> bool:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (LEADER_LOCK_KEY,))
+        acquired = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+        return acquired
+
+    def _serve(self, leader_conn):
+        refresh_at = datetime.now()
+        while not self._stopped.is_set():
+            now = datetime.now()
+            if now >= refresh_at:
+                # Проверяем соединение с блокировкой: если оно оборвалось, лидерство уже потеряно
+                cursor = leader_conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                leader_conn.commit()
+                self._reload()
+                refresh_at = now + timedelta(seconds=REFRESH_INTERVAL)
+
+            due = self._pop_due(now)
+            if due:
+                self._settle(due)
+                continue
+
+            with self._lock:
+                next_at = min(self._heap[0][0], refresh_at) if self._heap else refresh_at
+            self._wake.clear()
+            self._wake.wait(max((next_at - datetime.now()).total_seconds(), 0))
+
+    def _reload(self):
+        db = self._session_factory()
+        try:
+            rows = db.execute(
+                text("""
+                    SELECT auction_id, end_time FROM auctions
+                    WHERE status = 'active' AND end_time <= :horizon
+                    ORDER BY end_time
+                """),
+                {"horizon": datetime.now() + HORIZON},
+            ).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._heap = [(row.end_time, row.auction_id) for row in rows]
+            heapq.heapify(self._heap)
+            self._scheduled = {row.auction_id: row.end_time for row in rows}
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < BATCH_SIZE:
+                end_time, auction_id = heapq.heappop(self._heap)
+                # Запись устарела: лот уже перенесен через schedule()
+                if self._scheduled.get(auction_id) != end_time:
+                    continue
+                del self._scheduled[auction_id]
+                due.append(auction_id)
+        return due
+
+    def _push(self, auction_id: int, end_time: datetime):
+        self._scheduled[auction_id] = end_time
+        heapq.heappush(self._heap, (end_time, auction_id))
+
+    def _settle(self, auction_ids: List[int]):
+        if bid_engine is not None:
+            # В режиме движка ставок время окончания в памяти главнее: продленные лоты переносим,
+            # остальные закрываем для ставок и дожидаемся записи уже принятых
+            extended = bid_engine.expire(auction_ids)
+            with self._lock:
+                for auction_id, end_time in extended.items():
+                    self._push(auction_id, end_time)
+            auction_ids = [a for a in auction_ids if a not in extended]
+            if not auction_ids:
+                return
+
+        db = self._session_factory()
+        try:
+            closed = db.execute(
+                text("SELECT * FROM settle_auctions(:ids)"), {"ids": auction_ids}
+            ).all()
+            closed_ids = {row.auction_id for row in closed}
+            if closed:
+                winners = sum(1 for row in closed if row.winner_id is not None)
+                db.add(SystemLog(
+                    level="INFO",
+                    source="EXPIRY_SCHEDULER",
+                    message=f"Closed {len(closed)} auctions, {winners} escrow accounts created."
+                ))
+
+            # Лоты, которые settle_auctions пропустил: продлены антиснайпингом или уже закрыты вручную
+            skipped = [a for a in auction_ids if a not in closed_ids]
+            rows = db.execute(
+                text("SELECT auction_id, end_time FROM auctions WHERE auction_id = ANY(:ids) AND status = 'active'"),
+                {"ids": skipped},
+            ).all() if skipped else []
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        AUCTIONS_SETTLED.inc(len(closed_ids))
+        retry_at = datetime.now() + RETRY_DELAY
+        with self._lock:
+            for row in rows:
+                self._push(row.auction_id, max(row.end_time, retry_at))
+
+    def _log(self, level: str, message: str):
+        db = self._session_factory()
+        try:
+            db.add(SystemLog(level=level, source="EXPIRY_SCHEDULER", message=message))
+            db.commit()
+        except Exception:
+            db.rollback()
+        finally:
+            db.close()
+
+
+expiry_scheduler = ExpiryScheduler() if EXPIRY_SCHEDULER_ENABLED else None
+
+if expiry_scheduler is not None:
+    register(Gauge("expiry_scheduler_pending", "Auctions scheduled to close within the horizon.",
+                   lambda: [({"leader": str(expiry_scheduler.is_leader).lower()}, len(expiry_scheduler))]))
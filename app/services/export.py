@@ -0,0 +1,167 @@
+"""
+Потоковая выгрузка таблиц и представлений для BI (/export/{name}).
+
+Результат никогда не собирается в памяти целиком:
+- NDJSON читается серверным курсором (stream_results) порциями по EXPORT_BATCH_ROWS строк,
+  каждая порция сериализуется orjson и сразу уходит клиенту;
+- CSV и binary отдает сам PostgreSQL через COPY (...) TO STDOUT. psycopg2 пишет вывод COPY
+  в файлоподобный объект, поэтому COPY выполняется в отдельном потоке, а данные передаются
+  через ограниченную очередь: медленный клиент притормаживает COPY, а не копит буфер.
+Память на выгрузку ограничена одной порцией (NDJSON) или очередью (COPY) независимо от объема.
+"""
+import os
+import queue
+import threading
+from decimal import Decimal
+from typing import Dict, Iterator, List
+
+import orjson
+from sqlalchemy import literal_column, select, table
+from sqlalchemy.dialects import postgresql
+
+from app import models
+
+# Строк в одной порции серверного курсора (NDJSON)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+# Размер порции вывода COPY и число порций в очереди между потоком COPY и ответом
+EXPORT_CHUNK_BYTES = 256 * 1024
+EXPORT_QUEUE_CHUNKS = 8
+
+EXPORT_VIEWS = ("v_active_lots_details", "v_category_sales", "v_top_bidders")
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "binary": "application/octet-stream",
+}
+
+
+# Колонки, которые не покидают БД ни в одном формате: секреты пользователей.
+# Список отдается в GET /export, чтобы потребитель знал, чего в выгрузке нет
+EXPORT_EXCLUDED_COLUMNS = {
+    "users": ("password_hash",),
+}
+
+
+def _model_query(model):
+    # Вычисляемые колонки (items.search_vector) не выгружаем: CSV выгрузки снова принимает /import
+    excluded = EXPORT_EXCLUDED_COLUMNS.get(model.__tablename__, ())
+    return select(*(c for c in model.__table__.columns if c.computed is None and c.name not in excluded))
+
+
+def _build_sources() -> Dict[str, object]:
+    sources = {}
+    for mapper in models.Base.registry.mappers:
+        model = mapper.class_
+        sources[model.__tablename__] = _model_query(model)
+    for view in EXPORT_VIEWS:
+        sources[view] = select(literal_column("*")).select_from(table(view))
+    return dict(sorted(sources.items()))
+
+
+EXPORT_SOURCES = _build_sources()
+
+
+def _json_default(value):
+    # Деньги отдаем числом, как и остальные JSON-ответы API
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+def ndjson_chunks(engine, name: str) -> Iterator[bytes]:
+    """NDJSON порциями по EXPORT_BATCH_ROWS строк: одна порция серверного курсора — один кусок ответа."""
+    with engine.connect().execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS) as conn:
+        result = conn.execute(EXPORT_SOURCES[name])
+        keys = list(result.keys())
+        for rows in result.partitions():
+            yield b"".join(
+                orjson.dumps(dict(zip(keys, row)), default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+                for row in rows
+            )
+
+
+class _QueueWriter:
+    """Файлоподобный приемник для copy_expert: склеивает мелкие записи COPY в порции и кладет в очередь."""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer: List[bytes] = []
+        self._size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= EXPORT_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk = b"".join(self._buffer)
+        self._buffer, self._size = [], 0
+        if not _put(self._chunks, self._cancelled, chunk):
+            # Клиент ушел: исключение прерывает copy_expert
+            raise ConnectionAbortedError("Export cancelled")
+
+
+def _put(chunks: queue.Queue, cancelled: threading.Event, item) -> bool:
+    """Кладет в очередь, пока выгрузку не отменили. False — отменили."""
+    while not cancelled.is_set():
+        try:
+            chunks.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+_DONE = object()
+
+
+def copy_chunks(engine, name: str, fmt: str) -> Iterator[bytes]:
+    """Вывод COPY (...) TO STDOUT в формате csv (с заголовком) или binary."""
+    query = str(EXPORT_SOURCES[name].compile(dialect=postgresql.dialect()))
+    options = "FORMAT csv, HEADER" if fmt == "csv" else "FORMAT binary"
+    sql = f"COPY ({query}) TO STDOUT WITH ({options})"
+
+    chunks: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+
+    def produce():
+        result = _DONE
+        try:
+            with engine.connect() as conn:
+                try:
+                    cursor = conn.connection.cursor()
+                    try:
+                        writer = _QueueWriter(chunks, cancelled)
+                        cursor.copy_expert(sql, writer, size=EXPORT_CHUNK_BYTES)
+                        writer.flush()
+                    finally:
+                        cursor.close()
+                    conn.rollback()
+                except BaseException:
+                    # Прерванный COPY оставляет соединение в неопределенном состоянии: в пул его не возвращаем
+                    conn.invalidate()
+                    raise
+        except BaseException as e:
+            result = e
+        _put(chunks, cancelled, result)
+
+    producer = threading.Thread(target=produce, name=f"export-{name}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        producer.join()
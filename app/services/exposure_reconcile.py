@@ -0,0 +1,68 @@
+"""
+Сверка реестра обязательств user_exposure.
+
+Реестр ведут триггеры на auctions и escrow_accounts приращениями, поэтому любая запись
+в обход них (отключенные триггеры при загрузке, ручные правки, ошибка в логике) оставляет
+его неверным навсегда. Периодический проход сначала исправляет лидеров лотов по bids
+(reconcile_auction_leaders), затем обязательства по auctions/escrow_accounts
+(reconcile_user_exposure) и пишет расхождения в system_logs.
+
+Обе функции ищут расхождения по снимку и блокируют только найденные строки, поэтому ставки
+сверку не ждут. Шаги выполняются в отдельных транзакциях (AUTOCOMMIT-соединение), а от параллельного
+запуска в других воркерах проход защищается сессионной advisory-блокировкой.
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, engine
+from app.models import SystemLog
+from app.services.bid_engine import FUNDS_CHANNEL
+from app.services.periodic import PeriodicJob
+
+RECONCILE_INTERVAL = float(os.getenv("EXPOSURE_RECONCILE_INTERVAL_SEC", "3600"))
+
+RECONCILE_LOCK_KEY = 7_140_024
+
+
+def run_exposure_reconcile(session_factory=SessionLocal) -> Optional[dict]:
+    """Один проход сверки. None — если его прямо сейчас выполняет другой процесс."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RECONCILE_LOCK_KEY}).scalar():
+            return None
+        try:
+            leaders_fixed = conn.execute(text("SELECT reconcile_auction_leaders()")).scalar()
+            row = conn.execute(text("SELECT * FROM reconcile_user_exposure()")).one()
+            if leaders_fixed or row.users_drifted:
+                # Движок ставок держит средства в памяти: после исправлений пусть перечитает их у всех
+                conn.execute(text("SELECT pg_notify(:channel, '')"), {"channel": FUNDS_CHANNEL})
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RECONCILE_LOCK_KEY})
+
+    report = {
+        "leaders_fixed": leaders_fixed,
+        "users_drifted": row.users_drifted,
+        "drift_total": float(row.drift_total),
+    }
+    db = session_factory()
+    try:
+        db.add(SystemLog(
+            level="WARNING" if leaders_fixed or row.users_drifted else "INFO",
+            source="EXPOSURE_LEDGER",
+            message=(
+                f"Exposure ledger reconciled: {row.users_drifted} users drifted by {row.drift_total} in total, "
+                f"{leaders_fixed} auction leaders fixed."
+            )
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+    finally:
+        db.close()
+    return report
+
+
+# Первый проход — через интервал: сразу после старта реестр только что сверила миграция или прошлый запуск.
+# Пропущенная сверка не страшна: реестр продолжают вести триггеры
+exposure_reconciler = PeriodicJob("exposure-reconcile", run_exposure_reconcile, RECONCILE_INTERVAL, run_at_start=False)
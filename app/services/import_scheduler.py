@@ -0,0 +1,29 @@
+from typing import Dict, List, Set
+
+
+def dependency_levels(models) -> List[list]:
+    """
+    Раскладывает модели по уровням графа внешних ключей.
+    Модели одного уровня не ссылаются друг на друга и могут загружаться параллельно,
+    каждый следующий уровень зависит только от предыдущих.
+    Учитываются только связи между переданными моделями.
+    """
+    by_table = {model.__table__.name: model for model in models}
+
+    pending: Dict[str, Set[str]] = {}
+    for name, model in by_table.items():
+        pending[name] = {
+            fk.column.table.name
+            for fk in model.__table__.foreign_keys
+            if fk.column.table.name in by_table and fk.column.table.name != name
+        }
+
+    levels = []
+    while pending:
+        ready = sorted(name for name, deps in pending.items() if not deps & pending.keys())
+        if not ready:
+            raise ValueError(f"Foreign key cycle between tables: {sorted(pending)}")
+        levels.append([by_table[name] for name in ready])
+        for name in ready:
+            del pending[name]
+    return levels
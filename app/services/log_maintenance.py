@@ -0,0 +1,61 @@
+"""
+Обслуживание секционированных журналов audit_log и system_logs.
+
+Периодически создает месячные секции заранее (ensure_log_partitions) и применяет
+срок хранения (apply_log_retention): старые месяцы отсоединяются целиком и переносятся
+в схему archive или удаляются. Задачу запускают все воркеры, но выполняет только тот,
+кто взял транзакционную advisory-блокировку; обе SQL-функции идемпотентны.
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.models import SystemLog
+from app.services.periodic import PeriodicJob
+
+MAINTENANCE_INTERVAL = float(os.getenv("LOG_MAINTENANCE_INTERVAL_SEC", "3600"))
+PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD_MONTHS", "2"))
+# 0 — хранить бессрочно
+RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", "12"))
+# 1 — переносить старые секции в схему archive, 0 — удалять
+ARCHIVE_OLD_PARTITIONS = os.getenv("LOG_ARCHIVE_OLD_PARTITIONS", "1") == "1"
+
+MAINTENANCE_LOCK_KEY = 7_140_014
+
+
+def run_log_maintenance(session_factory=SessionLocal) -> Optional[dict]:
+    """Один проход обслуживания. None — если его прямо сейчас выполняет другой процесс."""
+    db = session_factory()
+    try:
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}).scalar():
+            db.rollback()
+            return None
+
+        created = db.execute(text("SELECT ensure_log_partitions(:ahead)"), {"ahead": PARTITIONS_AHEAD}).scalar()
+        removed = 0
+        if RETENTION_MONTHS > 0:
+            removed = db.execute(
+                text("SELECT apply_log_retention(:keep, :archive)"),
+                {"keep": RETENTION_MONTHS, "archive": ARCHIVE_OLD_PARTITIONS},
+            ).scalar()
+
+        if created or removed:
+            action = "archived" if ARCHIVE_OLD_PARTITIONS else "dropped"
+            db.add(SystemLog(
+                level="INFO",
+                source="LOG_MAINTENANCE",
+                message=f"Created {created} log partitions, {action} {removed} expired partitions."
+            ))
+        db.commit()
+        return {"created": created, "removed": removed}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# Секции созданы с запасом на месяцы вперед: пропущенный проход повторится через интервал
+log_maintenance = PeriodicJob("log-maintenance", run_log_maintenance, MAINTENANCE_INTERVAL)
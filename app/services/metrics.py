@@ -0,0 +1,285 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+- время ответа по маршрутам (гистограмма);
+- число SQL-запросов и суммарное время SQL на HTTP-запрос (через события движка SQLAlchemy);
+- ожидание соединения из пула и загрузка пула;
+- опциональный лог медленных запросов (SLOW_REQUEST_MS) со списком SQL и пометкой N+1.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import Counter as _Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+# 0 — лог медленных запросов выключен
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Сколько одинаковых запросов в рамках одного HTTP-запроса считаем признаком N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+MAX_LOGGED_STATEMENTS = 20
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [счетчики по корзинам..., сумма, количество]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {count}")
+            le_inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(key, le_inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(snapshot.items()))
+        return lines
+
+
+class Gauge:
+    """Значение вычисляется в момент чтения /metrics: collect() -> [(labels, value), ...]."""
+
+    def __init__(self, name: str, doc: str, collect: Callable[[], List[Tuple[dict, float]]]):
+        self.name = name
+        self.doc = doc
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for labels, value in self._collect():
+            lines.append(f"{self.name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route.")
+REQUEST_SQL_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements issued per HTTP request.", COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram("http_request_sql_seconds", "Total SQL time per HTTP request.")
+SQL_STATEMENTS = Counter("sql_statements_total", "SQL statements executed by engine.")
+POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.")
+
+_pools: Dict[str, object] = {}
+
+
+def _collect_pools() -> List[Tuple[dict, float]]:
+    values = []
+    for name, pool in _pools.items():
+        values.append(({"pool": name, "state": "in_use"}, pool.checkedout()))
+        values.append(({"pool": name, "state": "idle"}, pool.checkedin()))
+    return values
+
+
+def _collect_saturation() -> List[Tuple[dict, float]]:
+    values = []
+    for name, pool in _pools.items():
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        values.append(({"pool": name}, round(pool.checkedout() / capacity, 4) if capacity else 0))
+    return values
+
+
+POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled connections by state.", _collect_pools)
+POOL_SATURATION = Gauge("db_pool_saturation", "Checked out connections / (pool_size + max_overflow).", _collect_saturation)
+
+REGISTRY: list = [
+    REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, REQUEST_SQL_TIME, SQL_STATEMENTS,
+    POOL_CHECKOUT_WAIT, POOL_CONNECTIONS, POOL_SATURATION,
+]
+
+
+def register(metric):
+    """Подключает метрику другого модуля к выдаче /metrics."""
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Пул соединений ---
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, замеряющий ожидание свободного соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, pool=self.metrics_name)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, pool=self.metrics_name)
+
+
+# --- SQL на HTTP-запрос ---
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    sql_time: float = 0.0
+    captured: Optional[List[str]] = None
+
+
+_request_stats: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    SQL_STATEMENTS.inc()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_time += elapsed
+        if stats.captured is not None:
+            stats.captured.append(statement)
+
+
+def instrument_engine(engine, name: str):
+    """Вешает счетчики SQL на движок и регистрирует его пул для метрик."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    sync_engine.pool.metrics_name = name
+    _pools[name] = sync_engine.pool
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по маршрутам и SQL-статистика на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(captured=[] if SLOW_REQUEST_MS > 0 else None)
+        token = _request_stats.set(stats)
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+
+            # Шаблон маршрута (/auctions/{auction_id}), а не конкретный путь — иначе метки не ограничены
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.observe(elapsed, method=scope["method"], route=route_path, status=status["code"])
+            REQUEST_SQL_STATEMENTS.observe(stats.statements, route=route_path)
+            REQUEST_SQL_TIME.observe(stats.sql_time, route=route_path)
+
+            if stats.captured is not None:
+                await _log_if_slow(scope["method"], route_path, scope.get("path", ""), elapsed, stats)
+
+
+def find_n_plus_one(statements: List[str], threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+    """Одинаковые SELECT-ы, повторенные в рамках запроса не меньше threshold раз."""
+    counts = _Counter(s for s in statements if s.lstrip().upper().startswith("SELECT"))
+    return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+
+async def _log_if_slow(method: str, route: str, path: str, elapsed: float, stats: RequestStats):
+    suspects = find_n_plus_one(stats.captured)
+    if elapsed * 1000 < SLOW_REQUEST_MS and not suspects:
+        return
+
+    lines = [
+        f"{method} {path} ({route}): {elapsed * 1000:.1f} ms, "
+        f"{stats.statements} SQL statements, {stats.sql_time * 1000:.1f} ms in SQL."
+    ]
+    for statement, count in suspects:
+        lines.append(f"Possible N+1: {count}x {' '.join(statement.split())[:300]}")
+    lines.extend(" ".join(s.split())[:300] for s in stats.captured[:MAX_LOGGED_STATEMENTS])
+    await run_in_threadpool(_write_slow_log, "\n".join(lines))
+
+
+def _write_slow_log(message: str):
+    # Импорт здесь: database импортирует классы пулов из этого модуля
+    from app.database import SessionLocal
+    from app.models import SystemLog
+
+    db = SessionLocal()
+    try:
+        db.add(SystemLog(level="WARNING", source="SLOW_REQUEST", message=message))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,104 @@
+"""
+Keyset-пагинация (по курсору) для списков.
+
+Страница продолжается с последней увиденной строки: WHERE (sort_key, pk) > (:last_key, :last_pk)
+ORDER BY sort_key, pk — по составному индексу это стоит одинаково на любой глубине, в отличие от OFFSET.
+
+Курсор непрозрачен для клиента: base64 от JSON с именем сортировки и ключом последней строки.
+Курсор, выданный для одной сортировки, не принимается с другой. Ключ курсора сверяется с типами
+колонок сортировки: подделанный или испорченный курсор — это 400, а не ошибка драйвера или БД.
+"""
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def _valid_value(value: Any, expected: type) -> bool:
+    # bool — подкласс int, а None в ключе не бывает: колонки сортировки NOT NULL
+    if value is None or isinstance(value, bool):
+        return False
+    if expected is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    if expected is Decimal:
+        return isinstance(value, Decimal) and value.is_finite()
+    if expected is datetime:
+        # Колонки TIMESTAMP без зоны: время со смещением драйвер не сравнит с ними
+        return isinstance(value, datetime) and value.tzinfo is None
+    return isinstance(value, expected)
+
+
+def key_types(columns: Sequence) -> List[type]:
+    """Python-типы колонок сортировки — для проверки ключа в decode_cursor."""
+    return [c.type.python_type for c in columns]
+
+
+def encode_cursor(sort: str, key: Sequence[Any]) -> str:
+    payload = json.dumps({"s": sort, "k": [_encode_value(v) for v in key]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, types: Sequence[type]) -> List[Any]:
+    """Ключ последней строки из курсора; types — ожидаемые типы значений ключа (см. key_types)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = [_decode_value(v) for v in payload["k"]]
+    # Decimal("abc") бросает InvalidOperation — это ArithmeticError, а не ValueError
+    except (binascii.Error, ValueError, ArithmeticError, KeyError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if payload.get("s") != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    if len(key) != len(types) or not all(_valid_value(v, t) for v, t in zip(key, types)):
+        raise InvalidCursor("Invalid cursor")
+    return key
+
+
+def keyset_page(query, columns: Sequence, descending: bool, cursor_key: Optional[Sequence[Any]], limit: int):
+    """
+    Добавляет к запросу условие продолжения и сортировку.
+    columns — ключ сортировки, последним идет первичный ключ (для однозначного порядка).
+    Запрашивается limit + 1 строк: лишняя строка показывает, что следующая страница есть.
+    """
+    if cursor_key is not None:
+        if len(cursor_key) != len(columns):
+            raise InvalidCursor("Invalid cursor")
+        row = tuple_(*columns)
+        query = query.where(row < tuple_(*cursor_key) if descending else row > tuple_(*cursor_key))
+    order = [c.desc() for c in columns] if descending else list(columns)
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows: list, columns: Sequence, sort: str, limit: int):
+    """Отрезает лишнюю строку и возвращает (строки страницы, курсор следующей страницы или None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort, [getattr(last, c.key) for c in columns])
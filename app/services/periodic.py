@@ -0,0 +1,58 @@
+"""
+Фоновый поток, который периодически вызывает задачу обслуживания.
+
+Задачи (обслуживание журналов, архивация ставок, сверка реестра) сами защищаются
+advisory-блокировками от параллельного запуска в других воркерах, поэтому поток только
+вызывает их раз в интервал и переживает их ошибки: ошибка пишется в system_logs
+(source — имя задачи), проход повторится через интервал.
+"""
+import threading
+from typing import Callable, Optional
+
+from app.database import SessionLocal
+from app.models import SystemLog
+
+
+class PeriodicJob:
+    def __init__(self, name: str, job: Callable[[], object], interval: float, run_at_start: bool = True,
+                 session_factory=SessionLocal):
+        self._name = name
+        self._session_factory = session_factory
+        self._job = job
+        self._interval = interval
+        # False — первый проход через интервал, а не сразу после старта
+        self._run_at_start = run_at_start
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        if not self._run_at_start and self._stopped.wait(self._interval):
+            return
+        while not self._stopped.is_set():
+            try:
+                self._job()
+            except Exception as e:
+                self._log_error(f"{self._name} failed: {type(e).__name__}: {e}")
+            self._stopped.wait(self._interval)
+
+    def _log_error(self, message: str):
+        db = self._session_factory()
+        try:
+            db.add(SystemLog(level="ERROR", source=self._name.upper().replace("-", "_"), message=message))
+            db.commit()
+        except Exception:
+            # БД недоступна — поток не должен падать из-за лога
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,121 @@
+"""
+Общий слушатель LISTEN/NOTIFY PostgreSQL.
+
+Одно выделенное соединение на процесс и фоновый поток, который раздает уведомления
+подписчикам по каналам. Через него воркеры uvicorn узнают об изменениях,
+сделанных другими процессами (сброс кэшей, события аукционов).
+
+Обработчики вызываются в потоке слушателя и должны быть быстрыми. При переподключении
+каждый обработчик получает payload=None: уведомления за время обрыва могли потеряться.
+"""
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.services.metrics import Counter, register
+
+POLL_INTERVAL = 1.0
+RECONNECT_DELAY = float(os.getenv("PG_LISTENER_RECONNECT_SEC", "2"))
+
+LISTENER_RECONNECTS = register(Counter("pg_listener_reconnects_total", "LISTEN connection (re)establishments."))
+LISTENER_NOTIFICATIONS = register(Counter("pg_listener_notifications_total", "NOTIFY messages received."))
+
+
+class PgListener:
+    def __init__(self, dsn: str = SQLALCHEMY_DATABASE_URL):
+        self.dsn = dsn
+        self._handlers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._listening = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = threading.Event()
+
+    def subscribe(self, channel: str, handler: Callable[[Optional[str]], None]):
+        """Подписка на канал; можно вызывать и до, и после start()."""
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+    def unsubscribe(self, channel: str, handler):
+        with self._lock:
+            if handler in self._handlers.get(channel, []):
+                self._handlers[channel].remove(handler)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_INTERVAL * 2)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                self._listening = set()
+                self._listen_new_channels(conn)
+                LISTENER_RECONNECTS.inc()
+                self.connected.set()
+                self._dispatch_all(None)
+                self._loop(conn)
+            except psycopg2.Error:
+                self.connected.clear()
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+        self.connected.clear()
+
+    def _loop(self, conn):
+        while not self._stop.is_set():
+            self._listen_new_channels(conn)
+            if select.select([conn], [], [], POLL_INTERVAL) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                LISTENER_NOTIFICATIONS.inc()
+                self._dispatch(notify.channel, notify.payload)
+
+    def _listen_new_channels(self, conn):
+        with self._lock:
+            channels = set(self._handlers) - self._listening
+        if not channels:
+            return
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f'LISTEN "{channel}"')
+        self._listening |= channels
+
+    def _dispatch(self, channel: str, payload: Optional[str]):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, []))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception:
+                # Ошибка одного подписчика не должна останавливать доставку остальным
+                pass
+
+    def _dispatch_all(self, payload: Optional[str]):
+        with self._lock:
+            channels = list(self._handlers)
+        for channel in channels:
+            self._dispatch(channel, payload)
+
+
+pg_listener = PgListener()
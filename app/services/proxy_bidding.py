@@ -0,0 +1,170 @@
+"""
+Прокси-ставки (авто-биддинг) по таблице auto_bids.
+
+Для каждого аукциона держим упорядоченную книгу лимитов (max-heap по max_limit).
+Когда приходит ручная ставка, все конкурирующие лимиты разрешаются за один проход:
+побеждает старший лимит по цене "второй лимит + шаг", а в bids попадает только
+минимальный набор ставок (ручная, лимит второго участника, финальная ставка лидера)
+вместо имитации перебивания по одному шагу.
+"""
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+BID_INCREMENT = Decimal(os.getenv("PROXY_BID_INCREMENT", "1.00"))
+# Книги кэшируются в процессе; TTL ограничивает устаревание при загрузке auto_bids извне
+BOOK_TTL = float(os.getenv("PROXY_BOOK_TTL_SEC", "5"))
+
+# Ручная ставка всегда "позже" любой прокси-ставки: при равных лимитах выигрывает прокси
+_MANUAL_SEQ = (float("inf"),)
+
+
+@dataclass(frozen=True)
+class Proxy:
+    user_id: int
+    limit: Decimal
+    seq: tuple
+
+
+class ProxyBook:
+    """Упорядоченная книга прокси-ставок одного аукциона."""
+
+    def __init__(self, proxies=()):
+        self._heap: List[Tuple[Decimal, tuple, int]] = []
+        self._active: Dict[int, Proxy] = {}
+        for proxy in proxies:
+            self.add(proxy)
+
+    def __len__(self):
+        return len(self._active)
+
+    def add(self, proxy: Proxy):
+        # Старая запись пользователя остается в куче и отбрасывается лениво при чтении
+        self._active[proxy.user_id] = proxy
+        heapq.heappush(self._heap, (-proxy.limit, proxy.seq, proxy.user_id))
+
+    def remove(self, user_id: int):
+        self._active.pop(user_id, None)
+
+    def get(self, user_id: int) -> Optional[Proxy]:
+        return self._active.get(user_id)
+
+    def top(self, n: int) -> List[Proxy]:
+        """n старших лимитов за O(n log m): снимаем с кучи и возвращаем обратно."""
+        taken, result = [], []
+        while self._heap and len(result) < n:
+            entry = heapq.heappop(self._heap)
+            neg_limit, seq, user_id = entry
+            proxy = self._active.get(user_id)
+            if proxy is None or proxy.seq != seq or proxy.limit != -neg_limit:
+                continue  # устаревшая запись
+            taken.append(entry)
+            result.append(proxy)
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return result
+
+
+def resolve(book: ProxyBook, bidder_id: int, amount: Decimal,
+            increment: Decimal = BID_INCREMENT) -> List[Tuple[int, Decimal]]:
+    """
+    Разрешает конкуренцию лимитов после ручной ставки amount от bidder_id.
+    Возвращает ставки (user_id, amount) в порядке вставки, первая — сама ручная ставка.
+    """
+    # Собственный лимит участника защищает его ручную ставку
+    candidates = [p for p in book.top(3) if p.user_id != bidder_id][:2]
+    own = book.get(bidder_id)
+    if own is not None and own.limit > amount:
+        candidates.append(own)
+    else:
+        candidates.append(Proxy(bidder_id, amount, _MANUAL_SEQ))
+    candidates.sort(key=lambda p: (-p.limit, p.seq))
+
+    winner = candidates[0]
+    second = candidates[1] if len(candidates) > 1 else None
+
+    # Итоговая цена: второй лимит + шаг, но не выше лимита победителя (при равенстве — сам лимит)
+    if second is None:
+        price = amount
+    elif second.limit == winner.limit:
+        price = winner.limit
+    else:
+        price = min(winner.limit, second.limit + increment)
+    price = max(price, amount)
+
+    bids = [(bidder_id, amount)]
+    leader, last = bidder_id, amount
+
+    # Лимит второго участника фиксируем ставкой — он объясняет итоговую цену
+    if second is not None and second.user_id != leader and last < second.limit < price:
+        bids.append((second.user_id, second.limit))
+        leader, last = second.user_id, second.limit
+
+    if price > last:
+        bids.append((winner.user_id, price))
+    return bids
+
+
+class ProxyBooks:
+    """Кэш книг по аукционам. Книги загружаются из auto_bids одним запросом."""
+
+    def __init__(self, ttl: float = BOOK_TTL):
+        self._ttl = ttl
+        self._books: Dict[int, Tuple[float, ProxyBook]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, auction_id: int) -> ProxyBook:
+        return self.get_many(db, [auction_id])[auction_id]
+
+    def get_many(self, db, auction_ids) -> Dict[int, ProxyBook]:
+        """Книги нескольких аукционов; отсутствующие в кэше дочитываются одним запросом."""
+        now = time.monotonic()
+        books, missing = {}, []
+        for auction_id in set(auction_ids):
+            cached = self._books.get(auction_id)
+            if cached is not None and now - cached[0] < self._ttl:
+                books[auction_id] = cached[1]
+            else:
+                missing.append(auction_id)
+        if not missing:
+            return books
+
+        # Лимит не может превышать свободные средства владельца (баланс минус обязательства,
+        # не считая собственного лидерства в этом лоте) — иначе ставка робота все равно будет отклонена
+        rows = db.execute(text("""
+            SELECT ab.auction_id, ab.user_id,
+                   LEAST(ab.max_limit, COALESCE(u.balance, 0) - COALESCE(e.leading_amount + e.escrow_amount, 0)
+                         + CASE WHEN a.leader_id = ab.user_id THEN a.current_price ELSE 0 END) AS max_limit,
+                   ab.created_at, ab.auto_bid_id
+            FROM auto_bids ab
+            JOIN users u ON u.user_id = ab.user_id
+            JOIN auctions a ON a.auction_id = ab.auction_id
+            LEFT JOIN user_exposure e ON e.user_id = ab.user_id
+            WHERE ab.auction_id = ANY(:ids)
+        """), {"ids": missing})
+        loaded = {auction_id: ProxyBook() for auction_id in missing}
+        for row in rows:
+            loaded[row.auction_id].add(
+                Proxy(row.user_id, row.max_limit, (row.created_at.timestamp() if row.created_at else 0, row.auto_bid_id))
+            )
+        with self._lock:
+            for auction_id, book in loaded.items():
+                self._books[auction_id] = (now, book)
+        books.update(loaded)
+        return books
+
+    def invalidate(self, auction_id: Optional[int] = None):
+        with self._lock:
+            if auction_id is None:
+                self._books.clear()
+            else:
+                self._books.pop(auction_id, None)
+
+
+proxy_books = ProxyBooks()
@@ -0,0 +1,95 @@
+"""
+Кэш готовых JSON-ответов (аналитика) с TTL, LRU-вытеснением и ограничением по памяти.
+
+Записи привязаны к таблицам, из которых они построены. Сбрасываются по NOTIFY из триггеров БД
+(канал analytics_changed, payload — имя таблицы), поэтому все воркеры видят запись любого из них.
+ETag — хэш тела ответа: поллеры с If-None-Match получают 304 без запроса к БД и сериализации.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, Optional
+
+from app.services.metrics import Counter, register
+
+CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL_SEC", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "64"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYTICS_CACHE_MAX_MB", "32")) * 1024 * 1024
+
+NOTIFY_CHANNEL = "analytics_changed"
+
+CACHE_REQUESTS = register(Counter("response_cache_requests_total", "Response cache lookups by result."))
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    tables: FrozenSet[str]
+    expires_at: float
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._size = 0
+        # Счетчик поколений: ответ, посчитанный до сброса, не должен попасть в кэш после него
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            CACHE_REQUESTS.inc(result="hit")
+            return entry
+
+    def put(self, key: str, body: bytes, tables: Iterable[str], generation: int) -> CachedResponse:
+        entry = CachedResponse(body, make_etag(body), frozenset(tables), time.monotonic() + self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, table: Optional[str] = None):
+        """Сбросить записи, зависящие от таблицы; без аргумента — все."""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if table is None or table in entry.tables]
+            for key in stale:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+
+analytics_cache = ResponseCache()
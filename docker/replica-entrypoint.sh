@@ -0,0 +1,26 @@
+#!/bin/sh
+# Потоковая реплика основной БД (сервис db_replica).
+# При первом запуске копирует основную БД через pg_basebackup и включает режим standby:
+# standby.signal + primary_conninfo. Дальше реплика догоняет основную БД по WAL сама.
+set -e
+
+PRIMARY_HOST="${PRIMARY_HOST:-db}"
+PRIMARY_PORT="${PRIMARY_PORT:-5432}"
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    mkdir -p "$PGDATA"
+    chown postgres:postgres "$PGDATA"
+    chmod 0700 "$PGDATA"
+    # Основная БД при первом старте compose еще может инициализироваться
+    until su-exec postgres pg_basebackup -h "$PRIMARY_HOST" -p "$PRIMARY_PORT" -U "$DB_USER" \
+            -D "$PGDATA" -X stream -c fast; do
+        echo "Waiting for the primary at $PRIMARY_HOST:$PRIMARY_PORT..."
+        rm -rf "${PGDATA:?}"/*
+        sleep 2
+    done
+    su-exec postgres touch "$PGDATA/standby.signal"
+    echo "primary_conninfo = 'host=$PRIMARY_HOST port=$PRIMARY_PORT user=$DB_USER password=$PGPASSWORD application_name=db_replica'" \
+        >> "$PGDATA/postgresql.auto.conf"
+fi
+
+exec su-exec postgres postgres -c hot_standby=on
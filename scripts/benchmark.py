@@ -0,0 +1,373 @@
+"""
+Сквозной бенчмарк BidMaster: импорт, ставки, аналитика и списки через HTTP API.
+
+Сценарий:
+  1. генерирует CSV уровня нагрузки (scripts/generate_data.py с масштабированными объемами)
+     и загружает их через POST /import/batch-import — пропускная способность импорта;
+  2. параллельно шлет ставки в POST /auctions/{id}/bid на "горячие" лоты (все потоки бьются
+     за несколько лотов) и на "холодные" (каждая ставка — в случайный из многих лотов):
+     ставки в секунду, p50/p99 латентности;
+  3. замеряет /analytics/* (первый запрос после сброса кэша и повторные) и постраничный
+     обход /auctions/ и /items/ по курсору.
+
+Результаты пишутся в JSON. С --baseline сравниваются с сохраненным прогоном: если метрика
+хуже базовой больше чем на --threshold, скрипт завершается с кодом 1.
+
+Нужны запущенный API (--url) и переменные окружения DB_* той же БД: через них
+очищаются таблицы (--reset) и выбираются лоты и участники для ставок.
+
+Запуск:
+    python -m scripts.benchmark --tier small --reset --output bench.json
+    python -m scripts.benchmark --tier small --reset --baseline bench.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+# Уровни нагрузки: множитель объемов generate_data.py (1.0 — объемы по умолчанию)
+TIERS = {
+    "tiny": 0.05,
+    "small": 0.25,
+    "medium": 1.0,
+    "large": 5.0,
+}
+
+CSV_FILES = [
+    "users", "categories", "items", "item_categories", "auctions",
+    "bids", "auto_bids", "escrow_accounts", "expert_reviews", "audit_log",
+]
+
+# Таблицы, которые очищает --reset (агрегаты и журналы тоже, иначе прогоны не сравнимы)
+RESET_TABLES = [
+    "users", "categories", "items", "item_categories", "expert_reviews", "auctions", "bids",
+    "auto_bids", "escrow_accounts", "audit_log", "system_logs", "user_bid_stats", "auction_bid_stats",
+]
+
+# Шаг цены между ставками бенчмарка
+BID_STEP = Decimal(10)
+
+ANALYTICS_ENDPOINTS = ["/analytics/active-lots", "/analytics/category-sales", "/analytics/top-bidders"]
+
+
+# --- HTTP ---
+
+def request(url: str, method: str = "GET", body: bytes = None, headers: dict = None):
+    """Возвращает (код ответа, тело, заголовки, секунды). Ошибки HTTP не считаются исключением."""
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as resp:
+            data = resp.read()
+            status, resp_headers = resp.status, resp.headers
+    except urllib.error.HTTPError as e:
+        data = e.read()
+        status, resp_headers = e.code, e.headers
+    return status, data, resp_headers, time.perf_counter() - started
+
+
+def post_json(url: str, payload: dict):
+    return request(url, "POST", json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+
+def post_files(url: str, paths):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: text/csv\r\n\r\n".encode()
+            + content + b"\r\n"
+        )
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+    return request(url, "POST", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+# --- Статистика ---
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_metrics(prefix: str, latencies, elapsed: float = None) -> dict:
+    metrics = {
+        f"{prefix}.p50_ms": (percentile(latencies, 0.50) * 1000, "lower"),
+        f"{prefix}.p99_ms": (percentile(latencies, 0.99) * 1000, "lower"),
+    }
+    if elapsed:
+        metrics[f"{prefix}.throughput_rps"] = (len(latencies) / elapsed, "higher")
+    return metrics
+
+
+# --- Данные ---
+
+def generate_csv(tier: str, seed: int, output_dir: str):
+    """CSV уровня tier через scripts/generate_data.py."""
+    from scripts.generate_data import generate
+
+    generate(scale=TIERS[tier], seed=seed, output_dir=output_dir, workers=os.cpu_count() or 1)
+
+
+def reset_database():
+    db = SessionLocal()
+    try:
+        db.execute(text(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def csv_rows(path: str) -> int:
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f) - 1
+
+
+# --- Фазы ---
+
+def bench_import(base_url: str, data_dir: str, bulk_load: bool) -> dict:
+    paths = [os.path.join(data_dir, f"{name}.csv") for name in CSV_FILES]
+    rows = sum(csv_rows(path) for path in paths)
+    query = "?bulk_load=true" if bulk_load else ""
+    status, body, _, elapsed = post_files(f"{base_url}/import/batch-import{query}", paths)
+    if status != 200:
+        raise RuntimeError(f"Import failed: HTTP {status} {body[:300]!r}")
+    report = json.loads(body)["report"]
+    failed = {name: result for name, result in report.items() if not str(result).startswith("Success")}
+    if failed:
+        raise RuntimeError(f"Import failed: {failed}")
+    return {
+        "import.seconds": (elapsed, "lower"),
+        "import.rows_per_sec": (rows / elapsed, "higher"),
+    }
+
+
+def pick_bid_targets(hot_lots: int, cold_lots: int):
+    """Идущие лоты с запасом времени и платежеспособные участники."""
+    db = SessionLocal()
+    try:
+        lots = db.execute(text("""
+            SELECT auction_id, current_price FROM auctions
+            WHERE status = 'active' AND end_time > LOCALTIMESTAMP + INTERVAL '1 hour'
+            ORDER BY auction_id
+            LIMIT :n
+        """), {"n": hot_lots + cold_lots}).all()
+        users = db.execute(text("""
+            SELECT user_id FROM users WHERE balance > 500000 ORDER BY user_id LIMIT 200
+        """)).scalars().all()
+    finally:
+        db.close()
+    if len(lots) <= hot_lots or not users:
+        raise RuntimeError("Not enough active auctions or funded users for the bid benchmark")
+    return lots[:hot_lots], lots[hot_lots:], users
+
+
+def run_bids(base_url: str, lots, users, total: int, concurrency: int, seed: int):
+    """
+    Шлет total ставок из concurrency потоков. Каждая ставка на BID_STEP выше последней
+    известной цены лота; цена из ответа (с учетом прокси-ставок) поднимает ее дальше.
+    """
+    prices = {lot.auction_id: Decimal(lot.current_price) for lot in lots}
+    # Все потоки делят один поток случайностей: выбор лота и участника зависит только от seed
+    rnd = random.Random(seed)
+    lock = threading.Lock()
+
+    def one(_):
+        with lock:
+            auction_id = rnd.choice(lots).auction_id
+            user_id = rnd.choice(users)
+            prices[auction_id] += BID_STEP
+            amount = prices[auction_id]
+        status, body, _, elapsed = post_json(
+            f"{base_url}/auctions/{auction_id}/bid", {"user_id": user_id, "amount": float(amount)}
+        )
+        if status == 200:
+            new_price = Decimal(str(json.loads(body)["new_price"]))
+            with lock:
+                prices[auction_id] = max(prices[auction_id], new_price)
+        return status, elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for _, seconds in results]
+    accepted = sum(1 for status, _ in results if status == 200)
+    errors = sum(1 for status, _ in results if status >= 500)
+    return latencies, elapsed, accepted, errors
+
+
+def bench_bids(base_url: str, total: int, concurrency: int, seed: int) -> dict:
+    hot, cold, users = pick_bid_targets(hot_lots=2, cold_lots=200)
+    metrics = {}
+    for name, lots in (("hot", hot), ("cold", cold)):
+        latencies, elapsed, accepted, errors = run_bids(base_url, lots, users, total, concurrency, seed)
+        if errors:
+            raise RuntimeError(f"{errors} bids failed with HTTP 5xx on {name} auctions")
+        metrics.update(latency_metrics(f"bids.{name}", latencies, elapsed))
+        metrics[f"bids.{name}.accepted_ratio"] = (accepted / total, "higher")
+    return metrics
+
+
+def bench_analytics(base_url: str, repeats: int) -> dict:
+    # Любая запись сбрасывает кэш отчетов, поэтому первый запрос после фазы ставок — холодный
+    metrics = {}
+    for path in ANALYTICS_ENDPOINTS:
+        name = path.rsplit("/", 1)[-1].replace("-", "_")
+        status, _, _, first = request(base_url + path)
+        if status != 200:
+            raise RuntimeError(f"{path}: HTTP {status}")
+        warm = [request(base_url + path)[3] for _ in range(repeats)]
+        metrics[f"analytics.{name}.first_ms"] = (first * 1000, "lower")
+        metrics.update(latency_metrics(f"analytics.{name}", warm))
+    return metrics
+
+
+def bench_listing(base_url: str, path: str, pages: int, page_size: int) -> list:
+    latencies, cursor = [], None
+    for _ in range(pages):
+        query = f"?limit={page_size}" + (f"&cursor={cursor}" if cursor else "")
+        status, _, headers, elapsed = request(f"{base_url}{path}{query}")
+        if status != 200:
+            raise RuntimeError(f"{path}: HTTP {status}")
+        latencies.append(elapsed)
+        cursor = headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    return latencies
+
+
+def bench_listings(base_url: str, pages: int, page_size: int) -> dict:
+    metrics = {}
+    for name, path in (("auctions", "/auctions/"), ("items", "/items/")):
+        metrics.update(latency_metrics(f"listing.{name}", bench_listing(base_url, path, pages, page_size)))
+    return metrics
+
+
+# --- Результаты ---
+
+def compare(results: dict, baseline: dict, threshold: float, noise_floor_ms: float):
+    """
+    Список регрессий: метрики, которые хуже базовых больше чем на threshold (доля).
+    Латентности, изменившиеся меньше чем на noise_floor_ms, не считаются: на миллисекундных
+    запросах относительный разброс между прогонами сам по себе превышает любой разумный порог.
+    """
+    regressions = []
+    for name, current in results["metrics"].items():
+        base = baseline.get("metrics", {}).get(name)
+        if base is None or not base["value"]:
+            continue
+        if name.endswith("_ms") and abs(current["value"] - base["value"]) < noise_floor_ms:
+            continue
+        change = (current["value"] - base["value"]) / base["value"]
+        worse = change > threshold if current["better"] == "lower" else change < -threshold
+        if worse:
+            regressions.append((name, base["value"], current["value"], change))
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end BidMaster benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="truncate all tables before the import")
+    parser.add_argument("--skip-import", action="store_true", help="benchmark the data already in the database")
+    parser.add_argument("--bulk-load", action="store_true", help="import with ?bulk_load=true")
+    parser.add_argument("--bids", type=int, default=2000, help="bids per scenario (hot and cold)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=50, help="requests per analytics endpoint")
+    parser.add_argument("--pages", type=int, default=50, help="pages per listing")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--noise-floor-ms", type=float, default=5.0,
+                        help="latency changes smaller than this are never regressions")
+    args = parser.parse_args()
+    base_url = args.url.rstrip("/")
+
+    metrics = {}
+    if not args.skip_import:
+        if args.reset:
+            reset_database()
+        with tempfile.TemporaryDirectory(prefix="bidmaster_bench_") as data_dir:
+            print(f"Generating tier '{args.tier}' data...")
+            generate_csv(args.tier, args.seed, data_dir)
+            print("Importing...")
+            metrics.update(bench_import(base_url, data_dir, args.bulk_load))
+
+    print("Placing bids...")
+    metrics.update(bench_bids(base_url, args.bids, args.concurrency, args.seed))
+    print("Timing analytics...")
+    metrics.update(bench_analytics(base_url, args.repeats))
+    print("Timing listings...")
+    metrics.update(bench_listings(base_url, args.pages, args.page_size))
+
+    results = {
+        "meta": {
+            "tier": args.tier,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "bids": args.bids,
+            "revision": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        "metrics": {
+            name: {"value": round(value, 3), "better": better}
+            for name, (value, better) in sorted(metrics.items())
+        },
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    width = max(len(name) for name in results["metrics"])
+    for name, metric in results["metrics"].items():
+        print(f"{name:<{width}}  {metric['value']:>12.3f}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("tier") != args.tier:
+            print(f"WARNING: baseline tier {baseline.get('meta', {}).get('tier')} != {args.tier}")
+        regressions = compare(results, baseline, args.threshold, args.noise_floor_ms)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION: {name} {before:.3f} -> {after:.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"OK: no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
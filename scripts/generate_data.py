@@ -1,183 +1,440 @@
-import csv
-import random
+"""
+Генератор синтетических данных BidMaster.
+
+Объемы задаются одним множителем --scale (1.0 — 200 тыс. ставок, 1500 аукционов, 1000 пользователей).
+Значения генерируются векторно (NumPy) порциями; порции раздаются процессам (--workers).
+Каждая порция получает собственный генератор случайных чисел из (seed, таблица, номер порции),
+поэтому результат зависит только от --seed и --now, а не от числа процессов.
+
+Данные согласованы между таблицами:
+  - ставки лота лежат внутри окна торгов и строго возрастают по времени и сумме,
+    current_price аукциона равна последней ставке;
+  - прокси-ставки уникальны по (пользователь, аукцион), escrow заводится только на закрытые
+    лоты с победителем (покупатель и сумма — последняя ставка);
+  - экспертизы пишут пользователи с ролью expert.
+
+Вывод — CSV в формате /import/batch-import (по умолчанию) или сразу в БД через COPY (--copy).
+В режиме --copy процессы грузят порции параллельно с явными id и с session_replication_role = replica:
+триггеры (в том числе проверки внешних ключей) не выполняются — данные согласованы по построению.
+После загрузки выставляются последовательности и пересчитываются агрегаты ставок.
+Для этого нужны права суперпользователя (или владельца БД с правом менять session_replication_role).
+
+Запуск:
+    python -m scripts.generate_data --scale 0.25 --seed 7
+    python -m scripts.generate_data --scale 250 --workers 8 --copy --truncate
+"""
+import argparse
+import io
 import os
-from datetime import datetime, timedelta
+import shutil
+import sys
+import zlib
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
 from faker import Faker
 
-fake = Faker()
-
-# Настройки количества генерируемых записей
-NUM_USERS = 1000
-NUM_CATEGORIES = 10
-NUM_ITEMS = 2000
-NUM_AUCTIONS = 1500
-NUM_BIDS = 200000
-NUM_REVIEWS = 500
-NUM_LOGS = 1000
-NUM_AUTO_BIDS = 3000
-NUM_ESCROWS = 400
-
-output_dir = "data_import"
-os.makedirs(output_dir, exist_ok=True)
-
-
-def generate_users():
-    print("Generating Users...")
-    with open(f"{output_dir}/users.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["username", "email", "password_hash", "role", "balance"])
-        for i in range(NUM_USERS):
-            username = f"{fake.user_name()}_{i}"
-            email = f"{username}@example.com"
-            # 5% пользователей — эксперты
-            role = "expert" if random.random() < 0.05 else "user"
-            balance = round(random.uniform(0, 1000000), 2)
-            writer.writerow([username, email, "hashed_secret", role, balance])
-
-
-def generate_categories():
-    print("Generating Categories...")
-    with open(f"{output_dir}/categories.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["name", "description"])
-        cats = ["Живопись", "Скульптура", "Графика", "Фотография", "Нумизматика",
-                "Мебель", "Ювелирка", "Керамика", "Книги", "Часы"]
-        for c in cats:
-            writer.writerow([c, fake.sentence()])
-
-
-def generate_items():
-    print("Generating Items...")
-    with open(f"{output_dir}/items.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["owner_id", "title", "description", "year_created", "is_verified"])
-        for _ in range(NUM_ITEMS):
-            owner_id = random.randint(1, NUM_USERS)
-            title = fake.catch_phrase()
-            desc = fake.text(max_nb_chars=100).replace("\n", " ")
-            year = random.randint(1800, 2023)
-            is_ver = random.choice([True, False])
-            writer.writerow([owner_id, title, desc, year, is_ver])
-
-
-def generate_item_categories():
-    print("Generating Item Categories...")
-    with open(f"{output_dir}/item_categories.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["item_id", "category_id"])
-        for item_id in range(1, NUM_ITEMS + 1):
-            cat_id = random.randint(1, NUM_CATEGORIES)
-            writer.writerow([item_id, cat_id])
-
-
-def generate_auctions():
-    print("Generating Auctions...")
-    with open(f"{output_dir}/auctions.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["item_id", "start_time", "end_time", "start_price", "current_price", "status"])
-        for i in range(1, NUM_AUCTIONS + 1):
-            item_id = i
-            start_time = fake.date_time_between(start_date='-60d', end_date='now')
-            end_time = start_time + timedelta(days=random.randint(1, 14))
-
-            # Вычисляем статус в зависимости от текущего времени
-            if end_time < datetime.now():
-                status = 'finished'
-            else:
-                status = 'active'
-
-            price = round(random.uniform(100, 5000), 2)
-            writer.writerow([item_id, start_time, end_time, price, price, status])
-
-
-def generate_bids():
-    print("Generating Bids...")
-    with open(f"{output_dir}/bids.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["auction_id", "user_id", "amount", "bid_time"])
-        for _ in range(NUM_BIDS):
-            auc_id = random.randint(1, NUM_AUCTIONS)
-            u_id = random.randint(1, NUM_USERS)
-            amt = round(random.uniform(100, 50000), 2)
-            created = fake.date_time_between(start_date='-30d', end_date='now')
-            writer.writerow([auc_id, u_id, amt, created])
-
-
-def generate_expert_reviews():
-    print("Generating Expert Reviews...")
-    with open(f"{output_dir}/expert_reviews.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["item_id", "expert_id", "verdict", "comments", "review_date"])
-        for _ in range(NUM_REVIEWS):
-            item_id = random.randint(1, NUM_ITEMS)
-            expert_id = random.randint(1, NUM_USERS)
-            verdict = random.choice(["authentic", "fake", "suspicious"])
-            comments = fake.sentence()
-            created_at = fake.date_time_between(start_date='-60d', end_date='now')
-            writer.writerow([item_id, expert_id, verdict, comments, created_at])
-
-
-def generate_auto_bids():
-    print("Generating Auto Bids...")
-    # Используем set для контроля уникальности пар (user, auction),
-    # иначе БД вернет ошибку при вставке
-    seen_pairs = set()
-    with open(f"{output_dir}/auto_bids.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["user_id", "auction_id", "max_limit", "created_at"])
-
-        count = 0
-        while count < NUM_AUTO_BIDS:
-            u_id = random.randint(1, NUM_USERS)
-            auc_id = random.randint(1, NUM_AUCTIONS)
-
-            if (u_id, auc_id) in seen_pairs:
-                continue  # Пропускаем дубликаты
-
-            seen_pairs.add((u_id, auc_id))
-            max_limit = round(random.uniform(5000, 100000), 2)
-            created = fake.date_time_between(start_date='-30d', end_date='now')
-            writer.writerow([u_id, auc_id, max_limit, created])
-            count += 1
-
-
-def generate_escrow_accounts():
-    print("Generating Escrow Accounts...")
-    with open(f"{output_dir}/escrow_accounts.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["auction_id", "buyer_id", "amount", "status", "updated_at"])
-        for _ in range(NUM_ESCROWS):
-            auc_id = random.randint(1, NUM_AUCTIONS)
-            buyer_id = random.randint(1, NUM_USERS)
-            amount = round(random.uniform(1000, 50000), 2)
-            status = random.choice(['held', 'released', 'refunded'])
-            updated = fake.date_time_between(start_date='-10d', end_date='now')
-            writer.writerow([auc_id, buyer_id, amount, status, updated])
-
-
-def generate_audit_log():
-    print("Generating Audit Log...")
-    with open(f"{output_dir}/audit_log.csv", "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["table_name", "operation_type", "record_id", "changed_at", "changed_by"])
-        for _ in range(NUM_LOGS):
-            tbl = random.choice(["users", "items", "auctions"])
-            op = random.choice(["INSERT", "UPDATE"])
-            rec_id = random.randint(1, 1000)
-            at = fake.date_time_between(start_date='-10d', end_date='now')
-            by = str(random.randint(1, NUM_USERS))
-            writer.writerow([tbl, op, rec_id, at, by])
+# Объемы при --scale 1.0
+BASE_COUNTS = {
+    "users": 1000,
+    "items": 2000,
+    "auctions": 1500,
+    "bids": 200000,
+    "expert_reviews": 500,
+    "audit_log": 1000,
+    "auto_bids": 3000,
+}
+
+CATEGORIES = ["Живопись", "Скульптура", "Графика", "Фотография", "Нумизматика",
+              "Мебель", "Ювелирка", "Керамика", "Книги", "Часы"]
+
+# Колонки CSV (как ожидает /import/batch-import). В режиме --copy перед ними идет явный id
+COLUMNS = {
+    "users": ["username", "email", "password_hash", "role", "balance"],
+    "categories": ["name", "description"],
+    "items": ["owner_id", "title", "description", "year_created", "is_verified"],
+    "item_categories": ["item_id", "category_id"],
+    "auctions": ["item_id", "start_time", "end_time", "start_price", "current_price", "status"],
+    "bids": ["auction_id", "user_id", "amount", "bid_time"],
+    "expert_reviews": ["item_id", "expert_id", "verdict", "comments", "review_date"],
+    "auto_bids": ["user_id", "auction_id", "max_limit", "created_at"],
+    "escrow_accounts": ["auction_id", "buyer_id", "amount", "status", "updated_at"],
+    "audit_log": ["table_name", "operation_type", "record_id", "changed_at", "changed_by"],
+}
+ID_COLUMNS = {"users": "user_id", "categories": "category_id", "items": "item_id", "auctions": "auction_id"}
+
+# Строк в порции плоских таблиц и аукционов в порции (вместе с их ставками, прокси и escrow)
+CHUNK_ROWS = 100_000
+AUCTION_CHUNK = 2_000
+
+# Каждый 20-й пользователь — эксперт (5%), роль вычисляется по id без обращения к другим порциям
+EXPERT_EVERY = 20
+# Ставки не ближе 5 минут к концу: иначе импорт продлит лот по правилу антиснайпинга
+SNIPING_WINDOW = np.timedelta64(5, "m")
+# Размер словарей текстов Faker (тексты выбираются из них индексами)
+TEXT_POOL_SIZE = 4096
+
+_pools = None
+
+
+# --- Вспомогательное ---
+
+def counts_for(scale: float) -> dict:
+    counts = {table: max(1, int(round(n * scale))) for table, n in BASE_COUNTS.items()}
+    # Каждый аукцион торгует своим предметом
+    counts["items"] = max(counts["items"], counts["auctions"])
+    return counts
+
+
+def chunk_rng(seed: int, table: str, chunk: int) -> np.random.Generator:
+    return np.random.default_rng([seed, zlib.crc32(table.encode()), chunk])
+
+
+def csv_quote(value: str) -> str:
+    if any(c in value for c in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def text_pools(seed: int) -> dict:
+    """Словари текстов Faker, уже экранированные для CSV. Строятся один раз на процесс."""
+    global _pools
+    if _pools is None:
+        fake = Faker()
+        fake.seed_instance(seed)
+        _pools = {
+            "user_name": np.array([fake.user_name() for _ in range(TEXT_POOL_SIZE)]),
+            "title": np.array([csv_quote(fake.catch_phrase()) for _ in range(TEXT_POOL_SIZE)]),
+            "text": np.array([csv_quote(fake.text(max_nb_chars=100).replace("\n", " "))
+                              for _ in range(TEXT_POOL_SIZE)]),
+            "sentence": np.array([csv_quote(fake.sentence()) for _ in range(TEXT_POOL_SIZE)]),
+        }
+    return _pools
+
+
+def pick(rng, pool: np.ndarray, n: int) -> np.ndarray:
+    return pool[rng.integers(0, len(pool), n)]
+
+
+def money(cents: np.ndarray) -> np.ndarray:
+    """Целые копейки -> строки вида 123.45"""
+    cents = cents.astype(np.int64)
+    return np.char.add(np.char.add((cents // 100).astype(str), "."), np.char.zfill((cents % 100).astype(str), 2))
+
+
+def timestamps(values: np.ndarray) -> np.ndarray:
+    return np.datetime_as_string(values.astype("datetime64[us]"), unit="us")
+
+
+def random_times(rng, start: np.datetime64, end: np.datetime64, n: int) -> np.ndarray:
+    span = (end - start).astype("timedelta64[us]").astype(np.int64)
+    return start + rng.integers(0, span, n).astype("timedelta64[us]")
+
+
+def to_csv(columns) -> str:
+    """Колонки (массивы строк одинаковой длины) -> строки CSV без заголовка."""
+    columns = [np.asarray(c).astype(str) for c in columns]
+    if not len(columns[0]):
+        return ""
+    return "\n".join(",".join(row) for row in zip(*columns)) + "\n"
+
+
+# --- Порции таблиц ---
+# Каждая функция получает номер порции и возвращает {таблица: (первый id, [колонки])}
+
+def gen_users(ctx, chunk):
+    rng = chunk_rng(ctx["seed"], "users", chunk)
+    start, n = chunk * CHUNK_ROWS, min(CHUNK_ROWS, ctx["counts"]["users"] - chunk * CHUNK_ROWS)
+    ids = np.arange(start + 1, start + n + 1)
+    names = np.char.add(np.char.add(pick(rng, text_pools(ctx["seed"])["user_name"], n), "_"), ids.astype(str))
+    role = np.where(ids % EXPERT_EVERY == 0, "expert", "user")
+    balance = rng.integers(0, 100_000_000, n)
+    return {"users": (start + 1, [names, np.char.add(names, "@example.com"), np.full(n, "hashed_secret"),
+                                  role, money(balance)])}
+
+
+def gen_categories(ctx, chunk):
+    rng = chunk_rng(ctx["seed"], "categories", chunk)
+    names = np.array(CATEGORIES)
+    return {"categories": (1, [names, pick(rng, text_pools(ctx["seed"])["sentence"], len(names))])}
+
+
+def gen_items(ctx, chunk):
+    rng = chunk_rng(ctx["seed"], "items", chunk)
+    counts, pools = ctx["counts"], text_pools(ctx["seed"])
+    start, n = chunk * CHUNK_ROWS, min(CHUNK_ROWS, counts["items"] - chunk * CHUNK_ROWS)
+    ids = np.arange(start + 1, start + n + 1)
+    return {
+        "items": (start + 1, [
+            rng.integers(1, counts["users"] + 1, n), pick(rng, pools["title"], n), pick(rng, pools["text"], n),
+            rng.integers(1800, 2024, n), np.where(rng.random(n) < 0.5, "True", "False"),
+        ]),
+        "item_categories": (None, [ids, rng.integers(1, len(CATEGORIES) + 1, n)]),
+    }
+
+
+def gen_auctions(ctx, chunk):
+    """Аукционы порции вместе с их ставками, прокси-ставками и escrow."""
+    rng = chunk_rng(ctx["seed"], "auctions", chunk)
+    counts, now = ctx["counts"], ctx["now"]
+    start, n = chunk * AUCTION_CHUNK, min(AUCTION_CHUNK, counts["auctions"] - chunk * AUCTION_CHUNK)
+    ids = np.arange(start + 1, start + n + 1)
+
+    start_time = random_times(rng, now - np.timedelta64(60, "D"), now, n)
+    end_time = start_time + rng.integers(1, 15, n).astype("timedelta64[D]").astype("timedelta64[us]")
+    finished = end_time < now
+    start_price = rng.integers(10_000, 500_000, n)  # копейки
+
+    # Число ставок лота; ставки идут от начала торгов до min(конец - 5 минут, сейчас)
+    window_end = np.minimum(end_time - SNIPING_WINDOW, now)
+    window = np.maximum((window_end - start_time).astype(np.int64), 0)
+    per_lot = rng.poisson(counts["bids"] / counts["auctions"], n)
+    per_lot[window == 0] = 0
+    total = int(per_lot.sum())
+
+    lot = np.repeat(np.arange(n), per_lot)
+    group_start = np.repeat(np.cumsum(per_lot) - per_lot, per_lot)
+    # Время: равномерно в окне лота, отсортировано внутри лота
+    offsets = (rng.random(total) * window[lot]).astype(np.int64)
+    order = np.lexsort((offsets, lot))
+    offsets = offsets[order]
+    bid_time = start_time[lot] + offsets.astype("timedelta64[us]")
+    # Сумма: стартовая цена плюс нарастающий итог положительных шагов внутри лота
+    steps = (rng.exponential(0.05, total) * start_price[lot]).astype(np.int64) + 100
+    running = np.cumsum(steps)
+    amount = start_price[lot] + running - (running[group_start] - steps[group_start])
+    bidder = rng.integers(1, counts["users"] + 1, total)
+
+    last = np.cumsum(per_lot) - 1
+    has_bids = per_lot > 0
+    current_price = start_price.copy()
+    current_price[has_bids] = amount[last[has_bids]]
+    winner = np.zeros(n, dtype=np.int64)
+    winner[has_bids] = bidder[last[has_bids]]
+
+    # Прокси-ставки: различные пользователи внутри лота
+    proxies_per_lot = rng.poisson(counts["auto_bids"] / counts["auctions"], n)
+    proxy_lot, proxy_user = [], []
+    for i in np.nonzero(proxies_per_lot)[0]:
+        k = min(int(proxies_per_lot[i]), counts["users"])
+        proxy_lot.append(np.full(k, i))
+        proxy_user.append(rng.choice(counts["users"], k, replace=False) + 1)
+    proxy_lot = np.concatenate(proxy_lot) if proxy_lot else np.zeros(0, dtype=np.int64)
+    proxy_user = np.concatenate(proxy_user) if proxy_user else np.zeros(0, dtype=np.int64)
+    proxy_limit = (current_price[proxy_lot] * rng.uniform(1.0, 2.0, len(proxy_lot))).astype(np.int64)
+    proxy_created = start_time[proxy_lot] + (
+        rng.random(len(proxy_lot)) * window[proxy_lot]).astype(np.int64).astype("timedelta64[us]")
+
+    # Escrow: закрытые лоты с победителем
+    won = np.nonzero(finished & has_bids)[0]
+    settled = np.minimum(end_time[won] + (rng.random(len(won)) * 2 * 86_400e6).astype(np.int64)
+                         .astype("timedelta64[us]"), now)
+
+    return {
+        "auctions": (start + 1, [
+            ids, timestamps(start_time), timestamps(end_time), money(start_price), money(current_price),
+            np.where(finished, "finished", "active"),
+        ]),
+        "bids": (None, [ids[lot], bidder, money(amount), timestamps(bid_time)]),
+        "auto_bids": (None, [proxy_user, ids[proxy_lot], money(proxy_limit), timestamps(proxy_created)]),
+        "escrow_accounts": (None, [
+            ids[won], winner[won], money(current_price[won]),
+            rng.choice(np.array(["held", "released", "refunded"]), len(won)), timestamps(settled),
+        ]),
+    }
+
+
+def gen_expert_reviews(ctx, chunk):
+    rng = chunk_rng(ctx["seed"], "expert_reviews", chunk)
+    counts, now = ctx["counts"], ctx["now"]
+    start, n = chunk * CHUNK_ROWS, min(CHUNK_ROWS, counts["expert_reviews"] - chunk * CHUNK_ROWS)
+    experts = max(1, counts["users"] // EXPERT_EVERY)
+    return {"expert_reviews": (None, [
+        rng.integers(1, counts["items"] + 1, n), rng.integers(1, experts + 1, n) * EXPERT_EVERY,
+        rng.choice(np.array(["authentic", "fake", "suspicious"]), n),
+        pick(rng, text_pools(ctx["seed"])["sentence"], n),
+        timestamps(random_times(rng, now - np.timedelta64(60, "D"), now, n)),
+    ])}
+
+
+def gen_audit_log(ctx, chunk):
+    rng = chunk_rng(ctx["seed"], "audit_log", chunk)
+    counts, now = ctx["counts"], ctx["now"]
+    start, n = chunk * CHUNK_ROWS, min(CHUNK_ROWS, counts["audit_log"] - chunk * CHUNK_ROWS)
+    return {"audit_log": (None, [
+        rng.choice(np.array(["users", "items", "auctions"]), n), rng.choice(np.array(["INSERT", "UPDATE"]), n),
+        rng.integers(1, 1001, n), timestamps(random_times(rng, now - np.timedelta64(10, "D"), now, n)),
+        rng.integers(1, counts["users"] + 1, n),
+    ])}
+
+
+GENERATORS = {
+    "users": gen_users,
+    "categories": gen_categories,
+    "items": gen_items,
+    "auctions": gen_auctions,
+    "expert_reviews": gen_expert_reviews,
+    "audit_log": gen_audit_log,
+}
+
+# Фазы загрузки в режиме --copy: родительские таблицы раньше дочерних
+PHASES = [["users", "categories", "items"], ["auctions", "expert_reviews", "audit_log"]]
+
+
+def chunks_of(table: str, counts: dict) -> int:
+    if table == "categories":
+        return 1
+    if table == "auctions":
+        return -(-counts["auctions"] // AUCTION_CHUNK)
+    return -(-counts[table] // CHUNK_ROWS)
+
+
+# --- Выполнение порции (в процессе пула) ---
+
+def run_chunk(task):
+    ctx, table, chunk = task
+    output = GENERATORS[table](ctx, chunk)
+    if ctx["dsn"]:
+        return copy_chunk(ctx["dsn"], output)
+
+    parts = []
+    for name, (_, columns) in output.items():
+        path = os.path.join(ctx["parts_dir"], f"{name}.{table}.{chunk:06d}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(to_csv(columns))
+        parts.append((name, path))
+    return parts
+
+
+def copy_chunk(dsn: str, output: dict):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET session_replication_role = replica")
+            for name, (first_id, columns) in output.items():
+                names = COLUMNS[name]
+                if first_id is not None:
+                    names = [ID_COLUMNS[name]] + names
+                    columns = [np.arange(first_id, first_id + len(columns[0]))] + list(columns)
+                cursor.copy_expert(
+                    f"COPY {name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", io.StringIO(to_csv(columns))
+                )
+        conn.commit()
+    finally:
+        conn.close()
+    return []
+
+
+def finish_copy(dsn: str):
+    """Последовательности после загрузки с явными id, агрегаты ставок, реестр обязательств и статистика планировщика."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for table, column in ID_COLUMNS.items():
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                    f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)"
+                )
+            cursor.execute("SELECT * FROM rebuild_bid_stats()")
+            # Триггеры при загрузке отключены: лидеры лотов и user_exposure строятся сверкой
+            cursor.execute("SELECT reconcile_auction_leaders()")
+            cursor.execute("SELECT * FROM reconcile_user_exposure()")
+            cursor.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def truncate(dsn: str):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {', '.join(COLUMNS)}, user_bid_stats, auction_bid_stats RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def assemble(output_dir: str, parts):
+    """Склеивает части в CSV с заголовками в порядке порций."""
+    by_table = {}
+    for name, path in sorted(parts, key=lambda p: p[1]):
+        by_table.setdefault(name, []).append(path)
+    for name, columns in COLUMNS.items():
+        with open(os.path.join(output_dir, f"{name}.csv"), "w", encoding="utf-8", newline="") as out:
+            out.write(",".join(columns) + "\n")
+            for path in by_table.get(name, []):
+                with open(path, encoding="utf-8") as part:
+                    shutil.copyfileobj(part, out)
+
+
+def generate(scale: float = 1.0, seed: int = 42, output_dir: str = "data_import", workers: int = 1,
+             now: datetime = None, dsn: str = None) -> dict:
+    """
+    Генерирует данные: CSV в output_dir или (если задан dsn) сразу в БД через COPY.
+    Возвращает объемы по таблицам (для ставок, прокси и escrow — ожидаемые).
+    """
+    counts = counts_for(scale)
+    ctx = {
+        "seed": seed,
+        "counts": counts,
+        "now": np.datetime64(now or datetime.now().replace(microsecond=0), "us"),
+        "dsn": dsn,
+        "parts_dir": None if dsn else os.path.join(output_dir, ".parts"),
+    }
+    if ctx["parts_dir"]:
+        os.makedirs(ctx["parts_dir"], exist_ok=True)
+
+    parts = []
+    with Pool(workers) as pool:
+        # В CSV-режиме фазы можно не разделять, но одинаковый порядок проще сопровождать
+        for phase in PHASES:
+            tasks = [(ctx, table, chunk) for table in phase for chunk in range(chunks_of(table, counts))]
+            for result in pool.imap_unordered(run_chunk, tasks):
+                parts.extend(result)
+                print(".", end="", flush=True)
+    print()
+
+    if dsn:
+        finish_copy(dsn)
+    else:
+        assemble(output_dir, parts)
+        shutil.rmtree(ctx["parts_dir"])
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic BidMaster data")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = 200k bids, 1500 auctions, 1000 users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default="data_import", help="directory for CSV files")
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        help="reference time (ISO); fix it to reproduce the same data byte for byte")
+    parser.add_argument("--copy", action="store_true", help="load straight into the database (DB_* env) via COPY")
+    parser.add_argument("--truncate", action="store_true", help="with --copy: empty the tables first")
+    args = parser.parse_args()
+
+    dsn = None
+    if args.copy:
+        from app.database import SQLALCHEMY_DATABASE_URL
+        dsn = SQLALCHEMY_DATABASE_URL
+        if args.truncate:
+            truncate(dsn)
+
+    started = datetime.now()
+    counts = generate(args.scale, args.seed, args.output, args.workers, args.now, dsn)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"~{counts['bids']} bids, {counts['auctions']} auctions, {counts['users']} users in {elapsed:.1f}s -> "
+          + ("database" if dsn else f"{args.output}/"))
 
 
 if __name__ == "__main__":
-    generate_users()
-    generate_categories()
-    generate_items()
-    generate_item_categories()
-    generate_auctions()
-    generate_bids()
-    generate_expert_reviews()
-    generate_auto_bids()
-    generate_escrow_accounts()
-    generate_audit_log()
-    print(f"\nФайлы обновлены в {output_dir}/. Все 11 таблиц")
\ No newline at end of file
+    sys.exit(main())
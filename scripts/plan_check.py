@@ -0,0 +1,583 @@
+"""
+Регрессионная проверка планов запросов BidMaster.
+
+Сценарий вызывает все эндпоинты API внутри процесса (TestClient, без lifespan и фоновых задач),
+а событие before_cursor_execute движка перехватывает каждый SQL-оператор приложения. Перед
+выполнением оператор прогоняется через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) на том же
+соединении под SAVEPOINT, который сразу откатывается: план снимается в настоящем контексте
+(данные и блокировки текущей транзакции, SET LOCAL), а изменения EXPLAIN ANALYZE не остаются.
+Операторы внутри функций и триггеров (place_bid_atomic, get_auction_stats, trg_apply_bids...)
+видны через auto_explain (contrib): роль должна иметь право на LOAD 'auto_explain', без него
+проверка не запускается — снимки без вложенных операторов неполны.
+
+Проверки:
+  - нет Seq Scan по bids, auctions, items (и их секциям) для точечных и диапазонных выборок:
+    из просмотренных строк (не меньше MIN_SCANNED_ROWS) нужна малая доля (меньше LOOKUP_FRACTION) —
+    отобранная фильтром или соединением. Полные проходы (выгрузка, агрегаты по всей таблице) разрешены;
+  - форма плана (узлы, таблицы, индексы — без стоимостей, строк и времени) совпадает со снимком
+    в scripts/plan_snapshots/: регрессия плана видна как diff файла.
+
+На маленьких данных PostgreSQL законно выбирает Seq Scan, поэтому проверять нужно на объемах
+не меньше --scale 5 (снимки в репозитории сняты на нем). Прогон меняет данные (ставки, новые
+лоты, импорт) — запускать на отдельной БД. Нужны переменные окружения DB_*.
+
+    python -m scripts.plan_check --scale 5      # сгенерировать данные (COPY) и проверить
+    python -m scripts.plan_check                # проверить на данных, уже лежащих в БД
+    python -m scripts.plan_check --update       # перезаписать снимки планов
+"""
+import os
+
+# Снимаем планы sync-режима (psycopg2): SQL эндпоинтов в обоих режимах одинаков, а синхронный
+# курсор позволяет выполнить EXPLAIN на том же соединении прямо из события движка.
+# In-memory движок ставок выключен: иначе ставки пишутся в БД фоновым потоком вне сценария.
+os.environ["DB_MODE"] = "sync"
+os.environ["BID_ENGINE_ENABLED"] = "0"
+
+import argparse
+import difflib
+import hashlib
+import json
+import re
+import sys
+import textwrap
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import psycopg2
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+from app.database import SQLALCHEMY_DATABASE_URL, engine, read_engine
+from app.main import app
+from app.services.log_maintenance import run_log_maintenance
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / "plan_snapshots"
+
+# Таблицы, по которым точечные и диапазонные выборки обязаны идти по индексу
+GUARDED_TABLES = ("bids", "auctions", "items")
+# Seq Scan считается выборкой, если просмотрел не меньше MIN_SCANNED_ROWS строк, а нужна из них
+# меньшая доля, чем LOOKUP_FRACTION
+MIN_SCANNED_ROWS = 1000
+LOOKUP_FRACTION = 0.1
+
+# Осознанные Seq Scan: файл снимка оператора -> причина
+ALLOWED_SEQ_SCANS = {
+    "select_v_active_lots_details_2870611dc3.plan":
+        "отчет по всем активным лотам (около 10% предметов): хеш-соединение с items дешевле проб по индексу",
+}
+
+# Эндпоинты, которые сценарий не вызывает: маршрут -> причина
+SKIPPED_ROUTES = {
+    ("GET", "/auctions/{auction_id}/stream"): "SSE-поток не завершается; SQL у него тот же, что у GET /auctions/{id}",
+}
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_AUTO_EXPLAIN_SETTINGS = (
+    "SET LOCAL auto_explain.log_min_duration = 0",
+    "SET LOCAL auto_explain.log_analyze = on",
+    "SET LOCAL auto_explain.log_buffers = on",
+    "SET LOCAL auto_explain.log_format = json",
+    "SET LOCAL auto_explain.log_nested_statements = on",
+    "SET LOCAL client_min_messages = log",
+)
+
+
+# --- Отпечатки и форма плана ---
+
+def normalize(sql: str) -> str:
+    """Текст оператора без значений параметров, комментариев и переменной длины списков."""
+    sql = re.sub(r"--[^\n]*", " ", sql)
+    sql = re.sub(r"%\(\w+\)s|\$\d+", "?", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    # IN (?, ?, ?) и многострочные VALUES зависят от числа значений, а не от запроса
+    sql = re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+    sql = re.sub(r"(\((?:\?, \.\.\.|\?)\))(?:, \((?:\?, \.\.\.|\?)\))+", r"\1, ...", sql)
+    return sql
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:10]
+
+
+def snapshot_name(normalized: str) -> str:
+    verb = normalized.split(" ", 1)[0].lower()
+    match = re.search(r"\b(?:FROM|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)", normalized, re.IGNORECASE)
+    table = match.group(1).lower() if match else "expr"
+    return f"{verb}_{table}_{fingerprint(normalized)}.plan"
+
+
+def plan_shape(node: dict, depth: int = 0) -> List[str]:
+    """
+    Дерево плана без чисел: тип узла, стратегия, таблица и индекс. Входы хеш-соединения
+    выводятся в постоянном порядке, а цепочка внутренних хеш-соединений — одним узлом: какую
+    сторону хешировать и в каком порядке соединять, планировщик выбирает по близким оценкам,
+    и такие перестановки — шум, а не регрессия.
+    """
+    parts = [node["Node Type"]]
+    details = [node[key] for key in ("Join Type", "Strategy", "Scan Direction") if key in node]
+    if node["Node Type"] == "Hash Join":
+        details = [{"Right": "Left", "Right Anti": "Anti"}.get(d, d) for d in details]
+    details = [d for d in details if d not in ("Inner", "Plain", "Forward")]
+    if details:
+        parts.append(f"({', '.join(details)})")
+    if "Index Name" in node:
+        parts.append(f"using {node['Index Name']}")
+    for key, prefix in (("Relation Name", "on"), ("CTE Name", "cte"), ("Function Name", "function")):
+        if key in node:
+            parts.append(f"{prefix} {node[key]}")
+    if node.get("Parent Relationship") in ("InitPlan", "SubPlan"):
+        parts.append(f"[{node.get('Subplan Name', node['Parent Relationship'])}]")
+
+    children = node.get("Plans", [])
+    if node["Node Type"] == "Hash Join":
+        subtrees = sorted(plan_shape(child, depth + 1) for child in _hash_join_inputs(node))
+    else:
+        subtrees = [plan_shape(child, depth + 1) for child in children]
+    return ["  " * depth + " ".join(parts)] + [line for subtree in subtrees for line in subtree]
+
+
+def _hash_join_inputs(node: dict) -> List[dict]:
+    inputs = []
+    for child in node.get("Plans", []):
+        if child["Node Type"] == "Hash":
+            child = child["Plans"][0]
+        if (node.get("Join Type") == "Inner" and child["Node Type"] == "Hash Join"
+                and child.get("Join Type") == "Inner" and "Subplan Name" not in child):
+            inputs.extend(_hash_join_inputs(child))
+        else:
+            inputs.append(child)
+    return inputs
+
+
+def _walk(node: dict, parents=()):
+    yield node, parents
+    for child in node.get("Plans", []):
+        yield from _walk(child, parents + (node,))
+
+
+def seq_scan_lookups(plan: dict, guarded: Dict[str, str]) -> List[str]:
+    """Seq Scan по охраняемым таблицам, из которых выбирается малая доля строк."""
+    problems = []
+    for node, parents in _walk(plan):
+        if node["Node Type"] not in ("Seq Scan", "Parallel Seq Scan"):
+            continue
+        table = guarded.get(node.get("Relation Name"))
+        loops = node.get("Actual Loops", 0)
+        if table is None or not loops:
+            continue
+        kept = node["Actual Rows"] * loops
+        scanned = kept + node.get("Rows Removed by Filter", 0) * loops
+        if "Filter" not in node:
+            # Без фильтра отбор делает соединение: таблица целиком читается ради строк,
+            # совпавших с другой стороной (Seq Scan -> Hash -> Hash Join или сразу под Join)
+            joins = [p for p in parents[-2:] if "Join" in p["Node Type"] or p["Node Type"] == "Nested Loop"]
+            if not joins:
+                continue
+            join = joins[-1]
+            kept = join["Actual Rows"] * join.get("Actual Loops", 1)
+        if scanned >= MIN_SCANNED_ROWS and kept < scanned * LOOKUP_FRACTION:
+            relation = node["Relation Name"]
+            where = table if relation == table else f"{table} ({relation})"
+            problems.append(f"Seq Scan on {where}: {scanned} rows read for {kept}")
+    return problems
+
+
+# --- Перехват операторов ---
+
+@dataclass
+class CapturedStatement:
+    normalized: str
+    sources: Set[str] = field(default_factory=set)
+    shapes: Set[str] = field(default_factory=set)
+    problems: Set[str] = field(default_factory=set)
+    errors: Set[str] = field(default_factory=set)
+
+
+class PlanRecorder:
+    def __init__(self, guarded: Dict[str, str]):
+        self.guarded = guarded
+        self.source = "setup"
+        self.statements: Dict[str, CapturedStatement] = {}
+
+    def install(self):
+        for engine_ in {id(engine): engine, id(read_engine): read_engine}.values():
+            event.listen(engine_, "before_cursor_execute", self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not _EXPLAINABLE.match(statement):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else None
+        self.explain(cursor.connection, statement, parameters)
+
+    def explain(self, raw, statement: str, parameters):
+        """EXPLAIN ANALYZE оператора на соединении приложения с откатом всех его изменений."""
+        if raw.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return
+        nested_log = []
+        saved_notices, raw.notices = raw.notices, nested_log
+        cursor = raw.cursor()
+        in_transaction = not raw.autocommit
+        cursor.execute("SAVEPOINT plan_check" if in_transaction else "BEGIN")
+        try:
+            cursor.execute("LOAD 'auto_explain'")
+            for setting in _AUTO_EXPLAIN_SETTINGS:
+                cursor.execute(setting)
+            cursor.execute(EXPLAIN + statement, parameters)
+            plan = cursor.fetchone()[0][0]["Plan"]
+        except psycopg2.Error as e:
+            self._entry(statement).errors.add(str(e).strip().splitlines()[0])
+            return
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT plan_check" if in_transaction else "ROLLBACK")
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT plan_check")
+            cursor.close()
+            raw.notices = saved_notices
+
+        self._record(statement, plan, self.source)
+        for query_text, nested_plan in _auto_explain_plans(nested_log):
+            if not query_text.lstrip().upper().startswith("EXPLAIN"):
+                self._record(query_text, nested_plan, f"{self.source} (nested)")
+
+    def _entry(self, statement: str) -> CapturedStatement:
+        normalized = normalize(statement)
+        return self.statements.setdefault(fingerprint(normalized), CapturedStatement(normalized))
+
+    def _record(self, statement: str, plan: dict, source: str):
+        shape = plan_shape(plan)
+        relations = [node for node, _ in _walk(plan) if "Relation Name" in node or "Function Name" in node]
+        # Операторы без таблиц (pg_advisory_lock, set_config, pg_notify) планов не имеют, а планы
+        # запросов только к системному каталогу (поиск секций) зависят от размера каталога, а не от данных
+        if all(node.get("Relation Name", "").startswith("pg_") and "Function Name" not in node for node in relations):
+            return
+        entry = self._entry(statement)
+        entry.sources.add(source)
+        entry.shapes.add("\n".join(shape))
+        entry.problems.update(seq_scan_lookups(plan, self.guarded))
+
+
+def _auto_explain_plans(notices: List[str]):
+    """Планы из сообщений auto_explain: "LOG:  duration: ... ms  plan:\\n{json}"."""
+    for notice in notices:
+        marker = notice.find("plan:\n")
+        if marker < 0:
+            continue
+        try:
+            payload = json.loads(notice[marker + len("plan:\n"):])
+        except ValueError:
+            continue
+        yield payload.get("Query Text", ""), payload["Plan"]
+
+
+# --- Сценарий ---
+
+class ScenarioFailed(Exception):
+    pass
+
+
+class Scenario:
+    """Вызывает эндпоинты по порядку, помечая перехваченные операторы маршрутом."""
+
+    def __init__(self, client: TestClient, recorder: PlanRecorder):
+        self.client = client
+        self.recorder = recorder
+        self.covered: Set[tuple] = set()
+        self.failures: List[str] = []
+
+    def call(self, method: str, route: str, path_params: Optional[dict] = None, expect=(200,), **kwargs):
+        path = route.format(**(path_params or {}))
+        self.recorder.source = f"{method} {route}"
+        self.covered.add((method, route))
+        response = self.client.request(method, path, **kwargs)
+        if response.status_code not in expect:
+            self.failures.append(f"{method} {path}: HTTP {response.status_code} {response.text[:200]}")
+        return response
+
+    def statement(self, source: str, sql: str, params: dict):
+        """Оператор, который приложение не выполняет само (функции и запросы из sql/)."""
+        self.recorder.source = source
+        with engine.connect() as conn:
+            conn.execute(text(sql), params).all()
+            conn.rollback()
+
+
+def pick_fixtures() -> dict:
+    """Лоты, пользователь и предметы для сценария — выбираются до перехвата."""
+    with engine.connect() as conn:
+        lots = conn.execute(text("""
+            SELECT a.auction_id, a.current_price, a.item_id
+            FROM auctions a
+            LEFT JOIN auction_bid_stats s ON s.auction_id = a.auction_id
+            WHERE a.status = 'active' AND a.end_time > LOCALTIMESTAMP + INTERVAL '1 day'
+            ORDER BY COALESCE(s.bids_count, 0) DESC, a.auction_id
+            LIMIT 2
+        """)).all()
+        if len(lots) < 2:
+            raise ScenarioFailed("Need at least two active auctions ending in more than a day: generate data first")
+        user = conn.execute(text("""
+            SELECT u.user_id, COALESCE(u.balance, 0) - e.leading_amount - e.escrow_amount AS funds
+            FROM users u
+            JOIN user_exposure e ON e.user_id = u.user_id
+            ORDER BY funds DESC, u.user_id
+            LIMIT 1
+        """)).one()
+        category_id = conn.execute(text("""
+            SELECT category_id FROM item_categories GROUP BY category_id ORDER BY count(*) DESC, category_id LIMIT 1
+        """)).scalar()
+        # Точный запрос по словам названия: типичный поиск находит единицы предметов
+        title = conn.execute(text("SELECT title FROM items WHERE item_id = :id"), {"id": lots[0].item_id}).scalar()
+        bidder = conn.execute(text("SELECT user_id FROM bids ORDER BY bid_id DESC LIMIT 1")).scalar()
+    return {
+        "lot": lots[0], "other_lot": lots[1], "user_id": user.user_id, "category_id": category_id,
+        "query": title or "item", "bidder_id": bidder or user.user_id,
+    }
+
+
+def run_scenario(scenario: Scenario, fx: dict):
+    call = scenario.call
+    lot, other, user_id = fx["lot"], fx["other_lot"], fx["user_id"]
+    now = datetime.now().replace(microsecond=0)
+
+    call("GET", "/")
+    call("GET", "/metrics")
+
+    # Списки аукционов: все сортировки и фильтры, вторая страница по курсору и старый skip/limit
+    first = call("GET", "/auctions/", params={"limit": 20})
+    if first.headers.get("X-Next-Cursor"):
+        call("GET", "/auctions/", params={"limit": 20, "cursor": first.headers["X-Next-Cursor"]})
+    call("GET", "/auctions/", params={"skip": 100, "limit": 20})
+    call("GET", "/auctions/", params={"status": "active", "sort": "end_time", "limit": 20})
+    call("GET", "/auctions/", params={"sort": "-end_time", "ends_after": now.isoformat(),
+                                      "ends_before": (now + timedelta(days=3)).isoformat(), "limit": 20})
+    call("GET", "/auctions/", params={"status": "active", "sort": "-price", "min_price": 100, "max_price": 5000})
+    call("GET", "/auctions/", params={"sort": "price", "category_id": fx["category_id"], "limit": 20})
+    call("GET", "/auctions/{auction_id}", {"auction_id": lot.auction_id})
+
+    call("GET", "/analytics/active-lots")
+    call("GET", "/analytics/category-sales")
+    call("GET", "/analytics/top-bidders")
+
+    # Предметы и полнотекстовый поиск
+    first = call("GET", "/items/", params={"limit": 20})
+    if first.headers.get("X-Next-Cursor"):
+        call("GET", "/items/", params={"limit": 20, "cursor": first.headers["X-Next-Cursor"]})
+    call("GET", "/items/", params={"skip": 100, "limit": 20})
+    call("GET", "/items/", params={"category_id": fx["category_id"], "limit": 20})
+    found = call("GET", "/items/search", params={"q": fx["query"], "limit": 1})
+    if found.headers.get("X-Next-Cursor"):
+        call("GET", "/items/search", params={"q": fx["query"], "limit": 1, "cursor": found.headers["X-Next-Cursor"]})
+    call("GET", "/items/search", params={"q": fx["query"], "category_id": fx["category_id"],
+                                         "year_from": 1900, "year_to": 2000, "is_verified": True})
+    call("GET", "/items/{item_id}", {"item_id": lot.item_id})
+
+    # Ставки: одиночная (place_bid_atomic и прокси) и пакетная
+    price = float(lot.current_price)
+    call("POST", "/auctions/{auction_id}/bid", {"auction_id": lot.auction_id},
+         json={"user_id": user_id, "amount": price + 1})
+    call("POST", "/auctions/bids:batch", json={"bids": [
+        {"auction_id": lot.auction_id, "user_id": user_id, "amount": price + 2},
+        {"auction_id": other.auction_id, "user_id": user_id, "amount": float(other.current_price) + 1},
+        {"auction_id": other.auction_id, "user_id": fx["bidder_id"], "amount": float(other.current_price) + 2},
+    ]})
+
+    # Жизненный цикл: предмет -> лот -> ставка -> закрытие; второй лот и предмет удаляются
+    item = {"title": f"Plan check {uuid.uuid4().hex[:8]}", "description": "plan check", "year_created": 1990,
+            "owner_id": user_id}
+    item_id = call("POST", "/items/", json=item).json()["item_id"]
+    call("PUT", "/items/{item_id}", {"item_id": item_id}, json={"description": "plan check, updated"})
+    auction_id = call("POST", "/auctions/", json={"item_id": item_id, "start_price": 10}).json()["auction_id"]
+    call("POST", "/auctions/{auction_id}/bid", {"auction_id": auction_id}, json={"user_id": user_id, "amount": 11})
+    call("POST", "/auctions/{auction_id}/close", {"auction_id": auction_id})
+    spare_item_id = call("POST", "/items/", json=dict(item, title=item["title"] + " spare")).json()["item_id"]
+    spare_id = call("POST", "/auctions/", json={"item_id": spare_item_id, "start_price": 10}).json()["auction_id"]
+    call("DELETE", "/auctions/{auction_id}", {"auction_id": spare_id})
+    call("DELETE", "/items/{item_id}", {"item_id": spare_item_id})
+
+    # Импорт: одна хорошая и одна отклоненная строка, затем состояние пакета и карантин
+    login = f"plan_check_{uuid.uuid4().hex[:8]}"
+    users_csv = (f"username,email,password_hash,role,balance\n"
+                 f"{login},{login}@example.com,x,user,100\n"
+                 f"{login}_bad,{login}_bad@example.com,x,user,-1\n")
+    batch = call("POST", "/import/batch-import", files=[("files", ("users.csv", users_csv, "text/csv"))]).json()
+    batch_id = batch.get("batch_id")
+    if batch_id:
+        call("GET", "/import/batches/{batch_id}", {"batch_id": batch_id})
+        call("GET", "/import/batches/{batch_id}/quarantine", {"batch_id": batch_id}, params={"limit": 10})
+
+    # Выгрузка: CSV и binary отдает COPY мимо движка, план NDJSON-запроса тот же
+    call("GET", "/export")
+    call("GET", "/export/{name}", {"name": "auctions"}, params={"format": "ndjson"})
+    call("GET", "/export/{name}", {"name": "v_active_lots_details"}, params={"format": "ndjson"})
+
+    call("POST", "/admin/rollups/rebuild")
+    call("POST", "/admin/logs/maintenance", expect=(200, 409))
+    call("POST", "/admin/bids/archive", expect=(200, 409))
+    call("POST", "/admin/exposure/reconcile", expect=(200, 409))
+
+    # Функция отчета и запрос из sql/optimization.sql эндпоинтами не вызываются
+    scenario.statement(
+        "get_auction_stats()", "SELECT * FROM get_auction_stats(:start, :end)",
+        {"start": now - timedelta(days=30), "end": now},
+    )
+    scenario.statement(
+        "sql/optimization.sql",
+        "SELECT bid_id, amount, bid_time FROM bids WHERE user_id = :user_id AND amount > :amount "
+        "ORDER BY bid_time DESC",
+        {"user_id": fx["bidder_id"], "amount": 1000},
+    )
+
+
+def uncovered_routes(scenario: Scenario) -> List[str]:
+    routes = {(method.upper(), path) for path, ops in app.openapi()["paths"].items() for method in ops}
+    missing = routes - scenario.covered - set(SKIPPED_ROUTES)
+    return [f"{method} {path}" for method, path in sorted(missing)]
+
+
+# --- Снимки ---
+
+def render_snapshot(entry: CapturedStatement) -> str:
+    lines = [f"-- {source}" for source in sorted(entry.sources)]
+    lines += textwrap.wrap(entry.normalized, width=110, break_long_words=False, break_on_hyphens=False)
+    for shape in sorted(entry.shapes):
+        lines += ["", shape]
+    return "\n".join(lines) + "\n"
+
+
+def _plans_part(snapshot: str) -> str:
+    # Заголовок (маршруты и текст оператора) отделен от планов пустой строкой
+    return snapshot.partition("\n\n")[2]
+
+
+def compare_snapshots(statements: Dict[str, CapturedStatement], update: bool) -> List[str]:
+    """
+    Сверяет планы со снимками (или перезаписывает их). Возвращает diff по файлам с измененными планами.
+    Изменение одного заголовка (например, оператор вызвал еще один маршрут) ошибкой не считается.
+    """
+    SNAPSHOT_DIR.mkdir(exist_ok=True)
+    expected = {snapshot_name(e.normalized): render_snapshot(e) for e in statements.values() if e.shapes}
+    existing = {path.name: path.read_text(encoding="utf-8") for path in SNAPSHOT_DIR.glob("*.plan")}
+    diffs = []
+    for name in sorted(set(expected) | set(existing)):
+        old, new = existing.get(name, ""), expected.get(name, "")
+        if old == new:
+            continue
+        if update and old and new:
+            (SNAPSHOT_DIR / name).write_text(new, encoding="utf-8")
+        if old and new and _plans_part(old) == _plans_part(new):
+            continue
+        diffs.append("".join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile=f"a/{name}" if old else "/dev/null", tofile=f"b/{name}" if new else "/dev/null",
+        )))
+        if update:
+            path = SNAPSHOT_DIR / name
+            if new:
+                path.write_text(new, encoding="utf-8")
+            else:
+                path.unlink()
+    return diffs
+
+
+# --- Запуск ---
+
+def guarded_relations() -> Dict[str, str]:
+    """Охраняемые таблицы и все их секции: имя отношения -> имя таблицы."""
+    relations = {table: table for table in GUARDED_TABLES}
+    with engine.connect() as conn:
+        for table in GUARDED_TABLES:
+            for row in conn.execute(text("""
+                SELECT c.relname
+                FROM pg_partition_tree(CAST(:table AS regclass)) t
+                JOIN pg_class c ON c.oid = t.relid
+            """), {"table": table}):
+                relations[row.relname] = table
+    return relations
+
+
+def auto_explain_available() -> bool:
+    with engine.connect() as conn:
+        try:
+            conn.exec_driver_sql("LOAD 'auto_explain'")
+            return True
+        except Exception:
+            return False
+        finally:
+            conn.rollback()
+
+
+def generate(scale: float, seed: int):
+    from scripts.generate_data import generate as generate_data, truncate
+
+    print(f"Generating data at scale {scale} straight into the database...")
+    truncate(SQLALCHEMY_DATABASE_URL)
+    generate_data(scale=scale, seed=seed, workers=os.cpu_count() or 1, dsn=SQLALCHEMY_DATABASE_URL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check BidMaster query plans against snapshots")
+    parser.add_argument("--scale", type=float,
+                        help="truncate the tables and generate data at this scale first (snapshots use 5)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--update", action="store_true", help="rewrite plan snapshots instead of failing on diffs")
+    args = parser.parse_args()
+
+    if args.scale:
+        generate(args.scale, args.seed)
+    # Секции журналов на текущие месяцы: иначе первый прогон обслуживания в сценарии переносит строки
+    # из DEFAULT-секций операторами с датами в тексте, и набор снимков зависит от дня и от прошлых прогонов
+    run_log_maintenance()
+    # Планы зависят от того, успел ли autovacuum после загрузки или прошлого прогона (статистика,
+    # карта видимости для Index Only Scan, pending list GIN-индекса поиска): приводим БД к одному состоянию
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM (ANALYZE)")
+
+    if not auto_explain_available():
+        print("ERROR: cannot LOAD 'auto_explain' (contrib, needs superuser): "
+              "statements inside functions and triggers would not be checked", file=sys.stderr)
+        return 1
+    recorder = PlanRecorder(guarded_relations())
+    scenario = Scenario(TestClient(app), recorder)
+    fixtures = pick_fixtures()
+    recorder.install()
+    run_scenario(scenario, fixtures)
+
+    failed = False
+    for problem in scenario.failures:
+        print(f"SCENARIO  {problem}")
+        failed = True
+    for route in uncovered_routes(scenario):
+        print(f"UNCOVERED {route}: add it to run_scenario() or SKIPPED_ROUTES")
+        failed = True
+
+    for entry in sorted(recorder.statements.values(), key=lambda e: snapshot_name(e.normalized)):
+        for error in sorted(entry.errors):
+            print(f"ERROR     {snapshot_name(entry.normalized)}: {error}")
+            failed = True
+        if entry.problems and snapshot_name(entry.normalized) not in ALLOWED_SEQ_SCANS:
+            print(f"SEQ SCAN  {snapshot_name(entry.normalized)} ({', '.join(sorted(entry.sources))})")
+            for problem in sorted(entry.problems):
+                print(f"          {problem}")
+            print(f"          {entry.normalized[:300]}")
+            failed = True
+
+    diffs = compare_snapshots(recorder.statements, args.update)
+    if diffs and not args.update:
+        print("".join(diffs))
+        print(f"PLAN DIFF {len(diffs)} snapshot(s) changed: review and rerun with --update to accept")
+        failed = True
+    elif diffs:
+        print(f"Updated {len(diffs)} snapshot(s) in {SNAPSHOT_DIR}")
+
+    checked = sum(1 for entry in recorder.statements.values() if entry.shapes)
+    print(f"{checked} statements checked (with nested), "
+          f"{len(scenario.covered)} routes called, {'FAILED' if failed else 'OK'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Нагрузочная проверка атомарной ставки place_bid_atomic.
+
+Создает временные лот и участников, параллельно шлет ставки из нескольких потоков
+и проверяет, что цена лота никогда не уменьшается:
+  - наблюдатель постоянно читает current_price и следит за монотонностью;
+  - ставки в bids (в порядке вставки) строго возрастают;
+  - итоговая цена равна максимальной принятой ставке.
+
+Запуск (нужны переменные окружения DB_*):
+    python -m scripts.stress_bids --threads 16 --bids 200
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+
+def create_fixtures(db, num_users: int):
+    tag = uuid.uuid4().hex[:8]
+    user_ids = [
+        db.execute(text("""
+            INSERT INTO users (username, email, password_hash, balance)
+            VALUES (:name, :email, 'stress', 100000000)
+            RETURNING user_id
+        """), {"name": f"stress_{tag}_{i}", "email": f"stress_{tag}_{i}@example.com"}).scalar()
+        for i in range(num_users)
+    ]
+    item_id = db.execute(text("""
+        INSERT INTO items (owner_id, title, year_created) VALUES (:owner, :title, 2000) RETURNING item_id
+    """), {"owner": user_ids[0], "title": f"Stress lot {tag}"}).scalar()
+    now = datetime.now()
+    auction_id = db.execute(text("""
+        INSERT INTO auctions (item_id, start_time, end_time, start_price, current_price, status)
+        VALUES (:item, :start, :end, 100, 100, 'active')
+        RETURNING auction_id
+    """), {"item": item_id, "start": now, "end": now + timedelta(hours=1)}).scalar()
+    db.commit()
+    return user_ids, item_id, auction_id
+
+
+def drop_fixtures(db, user_ids, item_id, auction_id):
+    db.execute(text("DELETE FROM escrow_accounts WHERE auction_id = :id"), {"id": auction_id})
+    db.execute(text("DELETE FROM auctions WHERE auction_id = :id"), {"id": auction_id})
+    db.execute(text("DELETE FROM items WHERE item_id = :id"), {"id": item_id})
+    db.execute(text("DELETE FROM users WHERE user_id = ANY(:ids)"), {"ids": user_ids})
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency stress test for place_bid_atomic")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--bids", type=int, default=200, help="bids per thread")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user_ids, item_id, auction_id = create_fixtures(db, args.threads)
+
+    accepted = []
+    accepted_lock = threading.Lock()
+    errors = []
+    stop = threading.Event()
+
+    def bidder(user_id: int):
+        session = SessionLocal()
+        rnd = random.Random(user_id)
+        try:
+            for step in range(args.bids):
+                # Все потоки идут по одной "лестнице" цен, поэтому ставки постоянно сталкиваются
+                amount = Decimal(100 + step) + Decimal(rnd.randint(1, 99)) / 100
+                row = session.execute(
+                    text("SELECT * FROM place_bid_atomic(:a, :u, :amount)"),
+                    {"a": auction_id, "u": user_id, "amount": amount},
+                ).one()
+                session.commit()
+                if row.result == 'accepted':
+                    with accepted_lock:
+                        accepted.append(amount)
+        finally:
+            session.close()
+
+    def watcher():
+        session = SessionLocal()
+        last = Decimal(0)
+        try:
+            while not stop.is_set():
+                price = session.execute(
+                    text("SELECT current_price FROM auctions WHERE auction_id = :id"), {"id": auction_id}
+                ).scalar()
+                session.commit()
+                if price < last:
+                    errors.append(f"price went backwards: {last} -> {price}")
+                last = price
+        finally:
+            session.close()
+
+    watcher_thread = threading.Thread(target=watcher)
+    watcher_thread.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=bidder, args=(uid,)) for uid in user_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    watcher_thread.join()
+
+    amounts = [row.amount for row in db.execute(
+        text("SELECT amount FROM bids WHERE auction_id = :id ORDER BY bid_id"), {"id": auction_id}
+    )]
+    final_price = db.execute(
+        text("SELECT current_price FROM auctions WHERE auction_id = :id"), {"id": auction_id}
+    ).scalar()
+
+    for prev, cur in zip(amounts, amounts[1:]):
+        if cur <= prev:
+            errors.append(f"bids are not increasing: {prev} -> {cur}")
+            break
+    if accepted and final_price != max(accepted):
+        errors.append(f"final price {final_price} != max accepted bid {max(accepted)}")
+
+    total = args.threads * args.bids
+    print(f"{total} bids in {elapsed:.2f}s ({total / elapsed:.0f} bids/sec), "
+          f"accepted {len(accepted)}, final price {final_price}")
+
+    drop_fixtures(db, user_ids, item_id, auction_id)
+    db.close()
+
+    if errors:
+        for error in errors:
+            print("FAIL:", error)
+        sys.exit(1)
+    print("OK: price never went backwards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+-- Атомарная ставка: проверка, вставка и обновление цены за один вызов (один round trip).
+-- Условный UPDATE берет блокировку строки лота и перепроверяет цену уже под ней,
+-- поэтому из двух конкурентных ставок пройдет только более высокая и цена никогда не уменьшится.
+CREATE OR REPLACE FUNCTION place_bid_atomic(p_auction_id INT, p_user_id INT, p_amount DECIMAL(12, 2))
+RETURNS TABLE (
+    result VARCHAR,
+    new_price DECIMAL(12, 2),
+    new_end_time TIMESTAMP
+) AS $$
+DECLARE
+    bid_at TIMESTAMP := LOCALTIMESTAMP;
+    lot auctions%ROWTYPE;
+BEGIN
+    UPDATE auctions
+    SET current_price = p_amount
+    WHERE auction_id = p_auction_id
+      AND status = 'active'
+      AND end_time >= bid_at
+      AND COALESCE(current_price, 0) < p_amount
+      AND EXISTS (SELECT 1 FROM users WHERE user_id = p_user_id AND balance >= p_amount);
+
+    IF FOUND THEN
+        -- Триггеры на bids продлят лот (антиснайпинг) и синхронизируют цену
+        INSERT INTO bids (auction_id, user_id, amount, bid_time)
+        VALUES (p_auction_id, p_user_id, p_amount, bid_at);
+
+        SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id;
+        RETURN QUERY SELECT 'accepted'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    END IF;
+
+    -- Ставка не прошла — определяем причину в том же порядке, что и API
+    SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'auction_not_found'::VARCHAR, NULL::DECIMAL(12, 2), NULL::TIMESTAMP;
+    ELSIF lot.status <> 'active' THEN
+        RETURN QUERY SELECT 'not_active'::VARCHAR, lot.current_price, lot.end_time;
+    ELSIF lot.end_time < bid_at THEN
+        UPDATE auctions SET status = 'finished' WHERE auction_id = p_auction_id;
+        RETURN QUERY SELECT 'finished'::VARCHAR, lot.current_price, lot.end_time;
+    ELSIF p_amount <= COALESCE(lot.current_price, 0) THEN
+        RETURN QUERY SELECT 'too_low'::VARCHAR, lot.current_price, lot.end_time;
+    ELSIF NOT EXISTS (SELECT 1 FROM users WHERE user_id = p_user_id) THEN
+        RETURN QUERY SELECT 'user_not_found'::VARCHAR, lot.current_price, lot.end_time;
+    ELSE
+        RETURN QUERY SELECT 'insufficient_funds'::VARCHAR, lot.current_price, lot.end_time;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
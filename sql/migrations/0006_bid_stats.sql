@@ -0,0 +1,186 @@
+-- Агрегаты по ставкам (поддерживаются триггерами на bids ниже).
+-- Аналитика читает готовые счетчики вместо пересчета по всей таблице bids.
+CREATE TABLE user_bid_stats (
+    user_id INT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    bids_count BIGINT NOT NULL DEFAULT 0,
+    bids_sum DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    max_bid DECIMAL(12, 2),
+    -- Формула рейтинга: (Кол-во ставок * 10) + (1% от суммы ставок)
+    activity_score DECIMAL(18, 2) GENERATED ALWAYS AS (bids_count * 10 + bids_sum * 0.01) STORED
+);
+
+CREATE TABLE auction_bid_stats (
+    auction_id INT PRIMARY KEY REFERENCES auctions(auction_id) ON DELETE CASCADE,
+    bids_count BIGINT NOT NULL DEFAULT 0,
+    bids_sum DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    max_bid DECIMAL(12, 2)
+);
+
+-- Рейтинг активности хранится в user_bid_stats и обновляется триггером на bids, здесь только чтение.
+CREATE OR REPLACE FUNCTION get_user_activity_score(target_user_id INT)
+RETURNS DECIMAL(10, 2) AS $$
+DECLARE
+    score DECIMAL(10, 2);
+BEGIN
+    SELECT activity_score INTO score
+    FROM user_bid_stats
+    WHERE user_id = target_user_id;
+
+    RETURN COALESCE(score, 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пересчет агрегатов ставок для указанных пользователей и лотов.
+-- Нужен при удалении и изменении ставок: максимум нельзя "вычесть", поэтому считаем заново.
+-- Ключи без ставок (и удаленные пользователи/лоты) просто исчезают из таблиц агрегатов.
+CREATE OR REPLACE FUNCTION refresh_bid_stats(p_user_ids INT[], p_auction_ids INT[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM user_bid_stats WHERE user_id = ANY(p_user_ids);
+    INSERT INTO user_bid_stats (user_id, bids_count, bids_sum, max_bid)
+    SELECT b.user_id, COUNT(*), SUM(b.amount), MAX(b.amount)
+    FROM bids b
+    JOIN users u ON u.user_id = b.user_id
+    WHERE b.user_id = ANY(p_user_ids)
+    GROUP BY b.user_id;
+
+    DELETE FROM auction_bid_stats WHERE auction_id = ANY(p_auction_ids);
+    INSERT INTO auction_bid_stats (auction_id, bids_count, bids_sum, max_bid)
+    SELECT b.auction_id, COUNT(*), SUM(b.amount), MAX(b.amount)
+    FROM bids b
+    JOIN auctions a ON a.auction_id = b.auction_id
+    WHERE b.auction_id = ANY(p_auction_ids)
+    GROUP BY b.auction_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Полная перестройка агрегатов ставок (админ-эндпоинт, восстановление после ручных правок).
+-- SHARE-блокировка bids не пускает новые ставки на время пересчета, чтобы не потерять их в счетчиках.
+CREATE OR REPLACE FUNCTION rebuild_bid_stats()
+RETURNS TABLE (
+    user_rows BIGINT,
+    auction_rows BIGINT
+) AS $$
+BEGIN
+    LOCK TABLE bids IN SHARE MODE;
+
+    DELETE FROM user_bid_stats;
+    INSERT INTO user_bid_stats (user_id, bids_count, bids_sum, max_bid)
+    SELECT b.user_id, COUNT(*), SUM(b.amount), MAX(b.amount)
+    FROM bids b
+    WHERE b.user_id IS NOT NULL
+    GROUP BY b.user_id;
+
+    DELETE FROM auction_bid_stats;
+    INSERT INTO auction_bid_stats (auction_id, bids_count, bids_sum, max_bid)
+    SELECT b.auction_id, COUNT(*), SUM(b.amount), MAX(b.amount)
+    FROM bids b
+    WHERE b.auction_id IS NOT NULL
+    GROUP BY b.auction_id;
+
+    RETURN QUERY SELECT (SELECT COUNT(*) FROM user_bid_stats), (SELECT COUNT(*) FROM auction_bid_stats);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Агрегаты ставок (user_bid_stats, auction_bid_stats).
+-- Триггеры уровня оператора с таблицами переходов: одна групповая запись на весь INSERT/COPY,
+-- а не UPDATE счетчика на каждую строку. Ключи сортируются, чтобы параллельные вставки
+-- блокировали строки агрегатов в одном порядке и не ловили deadlock.
+CREATE OR REPLACE FUNCTION bid_stats_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_bid_stats AS s (user_id, bids_count, bids_sum, max_bid)
+    SELECT user_id, COUNT(*), SUM(amount), MAX(amount)
+    FROM new_bids
+    WHERE user_id IS NOT NULL
+    GROUP BY user_id
+    ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET bids_count = s.bids_count + EXCLUDED.bids_count,
+        bids_sum = s.bids_sum + EXCLUDED.bids_sum,
+        max_bid = GREATEST(s.max_bid, EXCLUDED.max_bid);
+
+    INSERT INTO auction_bid_stats AS s (auction_id, bids_count, bids_sum, max_bid)
+    SELECT auction_id, COUNT(*), SUM(amount), MAX(amount)
+    FROM new_bids
+    WHERE auction_id IS NOT NULL
+    GROUP BY auction_id
+    ORDER BY auction_id
+    ON CONFLICT (auction_id) DO UPDATE
+    SET bids_count = s.bids_count + EXCLUDED.bids_count,
+        bids_sum = s.bids_sum + EXCLUDED.bids_sum,
+        max_bid = GREATEST(s.max_bid, EXCLUDED.max_bid);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удаление и изменение ставок редки (каскад от лота/пользователя), пересчитываем затронутые ключи
+CREATE OR REPLACE FUNCTION bid_stats_on_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (TG_OP = 'DELETE') THEN
+        PERFORM refresh_bid_stats(
+            ARRAY(SELECT DISTINCT user_id FROM old_bids WHERE user_id IS NOT NULL),
+            ARRAY(SELECT DISTINCT auction_id FROM old_bids WHERE auction_id IS NOT NULL)
+        );
+    ELSE -- UPDATE
+        PERFORM refresh_bid_stats(
+            ARRAY(SELECT user_id FROM old_bids UNION SELECT user_id FROM new_bids),
+            ARRAY(SELECT auction_id FROM old_bids UNION SELECT auction_id FROM new_bids)
+        );
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_bid_stats_insert
+AFTER INSERT ON bids
+REFERENCING NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_insert();
+
+CREATE TRIGGER trg_bid_stats_update
+AFTER UPDATE ON bids
+REFERENCING OLD TABLE AS old_bids NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_change();
+
+CREATE TRIGGER trg_bid_stats_delete
+AFTER DELETE ON bids
+REFERENCING OLD TABLE AS old_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_change();
+
+
+-- Представления читают агрегаты вместо подсчета по bids.
+-- Типы колонок v_top_bidders меняются, поэтому представление пересоздается.
+CREATE OR REPLACE VIEW v_active_lots_details AS
+SELECT
+    a.auction_id,
+    i.title AS item_title,
+    i.description,
+    u.username AS seller_name,
+    a.current_price,
+    a.end_time,
+    -- Популярность лота берем из агрегатов, а не считаем COUNT(*) по bids для каждого лота
+    COALESCE(s.bids_count, 0) AS total_bids
+FROM auctions a
+JOIN items i ON a.item_id = i.item_id
+JOIN users u ON i.owner_id = u.user_id
+LEFT JOIN auction_bid_stats s ON s.auction_id = a.auction_id
+WHERE a.status = 'active';
+
+DROP VIEW IF EXISTS v_top_bidders;
+CREATE VIEW v_top_bidders AS
+SELECT
+    u.username,
+    s.bids_count,
+    s.max_bid AS max_bid_amount,
+    s.activity_score
+FROM user_bid_stats s
+JOIN users u ON u.user_id = s.user_id
+WHERE s.bids_count > 0
+ORDER BY s.activity_score DESC;
+
+-- Заполнение агрегатов по уже накопленным ставкам
+SELECT rebuild_bid_stats();
@@ -0,0 +1,39 @@
+-- Сброс кэша аналитики во всех воркерах приложения.
+-- Триггер уровня оператора: одно уведомление на INSERT/UPDATE/COPY, payload — имя таблицы.
+-- NOTIFY доставляется только после COMMIT, поэтому кэш не сбросится из-за откаченной транзакции.
+-- Ставки сюда попадают через агрегаты user_bid_stats/auction_bid_stats.
+CREATE OR REPLACE FUNCTION notify_analytics_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('analytics_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_analytics_users
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_items
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON items
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_categories
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_item_categories
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON item_categories
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_auctions
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON auctions
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_user_bid_stats
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON user_bid_stats
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
+
+CREATE TRIGGER notify_analytics_auction_bid_stats
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON auction_bid_stats
+FOR EACH STATEMENT EXECUTE FUNCTION notify_analytics_changed();
@@ -0,0 +1,14 @@
+-- Keyset-пагинация сравнивает кортеж (current_price, auction_id) и не переносит NULL:
+-- цена лота становится обязательной, пустые цены существующих лотов приравниваются к нулю.
+UPDATE auctions SET current_price = 0 WHERE current_price IS NULL;
+ALTER TABLE auctions ALTER COLUMN current_price SET NOT NULL;
+
+-- Предметы категории (фильтр списков); первичный ключ начинается с item_id и здесь не помогает
+CREATE INDEX IF NOT EXISTS idx_item_categories_category ON item_categories(category_id, item_id);
+
+-- Индексы под keyset-пагинацию списка аукционов: фильтр по статусу + сортировка,
+-- auction_id в конце делает порядок однозначным. Цена индексируется только вместе со статусом:
+-- current_price меняется на каждой ставке, и каждый лишний индекс на нем удорожает запись.
+CREATE INDEX IF NOT EXISTS idx_auctions_status_end_time ON auctions(status, end_time, auction_id);
+CREATE INDEX IF NOT EXISTS idx_auctions_end_time ON auctions(end_time, auction_id);
+CREATE INDEX IF NOT EXISTS idx_auctions_status_price ON auctions(status, current_price, auction_id);
@@ -0,0 +1,42 @@
+-- Максимальная ставка лота (победитель при закрытии) — одна проба индекса вместо сортировки всех ставок
+CREATE INDEX IF NOT EXISTS idx_bids_auction_amount ON bids(auction_id, amount DESC);
+
+-- Пакетное закрытие истекших аукционов (фоновый планировщик).
+-- Один оператор на пачку: закрывает лоты, у которых время действительно вышло
+-- (продленные антиснайпингом пропускаются — условие перепроверяется под блокировкой строки),
+-- находит победителя пробой индекса idx_bids_auction_amount и создает счета escrow.
+-- Возвращает закрытые лоты; winner_id = NULL, если ставок не было.
+CREATE OR REPLACE FUNCTION settle_auctions(p_auction_ids INT[])
+RETURNS TABLE (
+    auction_id INT,
+    winner_id INT,
+    amount DECIMAL(12, 2)
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH closed AS (
+        UPDATE auctions a
+        SET status = 'finished'
+        WHERE a.auction_id = ANY(p_auction_ids)
+          AND a.status = 'active'
+          AND a.end_time <= LOCALTIMESTAMP
+        RETURNING a.auction_id
+    ), winners AS (
+        SELECT c.auction_id, w.user_id, w.amount
+        FROM closed c
+        LEFT JOIN LATERAL (
+            SELECT b.user_id, b.amount
+            FROM bids b
+            WHERE b.auction_id = c.auction_id
+            ORDER BY b.amount DESC
+            LIMIT 1
+        ) w ON TRUE
+    ), escrow AS (
+        INSERT INTO escrow_accounts (auction_id, buyer_id, amount, status)
+        SELECT w.auction_id, w.user_id, w.amount, 'held'
+        FROM winners w
+        WHERE w.user_id IS NOT NULL
+    )
+    SELECT w.auction_id, w.user_id, w.amount FROM winners w;
+END;
+$$ LANGUAGE plpgsql;
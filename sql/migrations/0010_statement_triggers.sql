@@ -0,0 +1,174 @@
+-- Построчные триггеры ставок и аудита заменяются триггерами уровня оператора,
+-- а импорт получает режим массовой загрузки bidmaster.bulk_load.
+DROP TRIGGER IF EXISTS trg_extend_auction ON bids;
+DROP TRIGGER IF EXISTS trg_update_price ON bids;
+DROP FUNCTION IF EXISTS extend_auction_time();
+DROP FUNCTION IF EXISTS update_auction_price();
+
+DROP TRIGGER IF EXISTS audit_users_changes ON users;
+DROP TRIGGER IF EXISTS audit_items_changes ON items;
+DROP TRIGGER IF EXISTS audit_auctions_changes ON auctions;
+
+-- Режим массовой загрузки: импорт выполняет SET LOCAL bidmaster.bulk_load = 'on',
+-- и триггеры ниже пропускают построчную работу. Производные данные после COPY
+-- пересчитываются одним проходом в finish_bulk_load() (ниже).
+CREATE OR REPLACE FUNCTION is_bulk_load()
+RETURNS BOOLEAN AS $$
+BEGIN
+    RETURN COALESCE(current_setting('bidmaster.bulk_load', TRUE), 'off') = 'on';
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+
+-- 1. Синхронизация цены и снайперская защита.
+-- Триггер уровня оператора: ставки всего INSERT/COPY агрегируются по аукционам,
+-- и каждый затронутый лот обновляется один раз, а не по UPDATE на каждую ставку.
+-- Цена — максимум из текущей и новых ставок (цена никогда не уменьшается).
+-- Если последняя ставка оператора сделана менее чем за 5 минут до конца,
+-- продлеваем аукцион еще на 10 минут — один раз на оператор.
+CREATE OR REPLACE FUNCTION apply_bids_to_auctions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE auctions a
+    SET current_price = GREATEST(a.current_price, s.max_amount),
+        end_time = CASE
+            WHEN a.end_time - s.last_bid_time < INTERVAL '5 minutes' THEN a.end_time + INTERVAL '10 minutes'
+            ELSE a.end_time
+        END
+    FROM (
+        SELECT auction_id, MAX(amount) AS max_amount, MAX(bid_time) AS last_bid_time
+        FROM new_bids
+        GROUP BY auction_id
+    ) s
+    WHERE a.auction_id = s.auction_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_apply_bids
+AFTER INSERT ON bids
+REFERENCING NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION apply_bids_to_auctions();
+
+
+-- 2. Универсальный аудит изменений.
+-- Используем row_to_json, чтобы функция могла работать с любой таблицей.
+-- Вставки и удаления журналируются на уровне оператора: одна запись на строку,
+-- но одним INSERT ... SELECT из таблицы переходов. Таблица переходов допускает
+-- только одно событие на триггер, поэтому на каждую таблицу вешается по триггеру на событие.
+CREATE OR REPLACE FUNCTION log_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- При массовой загрузке вместо построчного журнала finish_bulk_load пишет одну сводную запись
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    IF (TG_OP = 'INSERT') THEN
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        SELECT TG_TABLE_NAME, TG_OP, 0, NULL, row_to_json(n)::TEXT, 'system'
+        FROM new_rows n;
+    ELSE -- DELETE
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        SELECT TG_TABLE_NAME, TG_OP, 0, row_to_json(o)::TEXT, NULL, 'system'
+        FROM old_rows o;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Изменения остаются построчными: без ключа строки старую и новую версию из таблиц переходов не сопоставить
+CREATE OR REPLACE FUNCTION log_row_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+    VALUES (
+        TG_TABLE_NAME, -- Системная переменная (имя таблицы)
+        TG_OP,         -- UPDATE
+        0,             -- Заглушка для ID (так как структура таблиц разная)
+        row_to_json(OLD)::TEXT,
+        row_to_json(NEW)::TEXT,
+        'system'
+    );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Вешаем аудит на основные таблицы
+CREATE TRIGGER audit_users_insert
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_users_delete
+AFTER DELETE ON users
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_users_update
+AFTER UPDATE ON users
+FOR EACH ROW EXECUTE FUNCTION log_row_update();
+
+CREATE TRIGGER audit_items_insert
+AFTER INSERT ON items
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_items_delete
+AFTER DELETE ON items
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_items_update
+AFTER UPDATE ON items
+FOR EACH ROW EXECUTE FUNCTION log_row_update();
+
+CREATE TRIGGER audit_auctions_insert
+AFTER INSERT ON auctions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_auctions_delete
+AFTER DELETE ON auctions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes();
+
+CREATE TRIGGER audit_auctions_update
+AFTER UPDATE ON auctions
+FOR EACH ROW EXECUTE FUNCTION log_row_update();
+
+
+-- 3. Завершение массовой загрузки (режим bidmaster.bulk_load).
+-- Вызывается в той же транзакции сразу после COPY: вместо построчных триггеров
+-- пересчитывает производные данные одним проходом.
+-- Цены лотов поднимаются до максимальной ставки из агрегатов auction_bid_stats
+-- (антиснайпинг к историческим ставкам не применяется), а в журнал аудита
+-- пишется одна сводная запись вместо строки на каждую загруженную запись.
+CREATE OR REPLACE FUNCTION finish_bulk_load(p_table VARCHAR, p_rows BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    IF p_table = 'bids' THEN
+        UPDATE auctions a
+        SET current_price = s.max_bid
+        FROM auction_bid_stats s
+        WHERE s.auction_id = a.auction_id
+          AND s.max_bid > a.current_price;
+    END IF;
+
+    IF p_table IN ('users', 'items', 'auctions') THEN
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        VALUES (p_table, 'BULK_LOAD', NULL, NULL, json_build_object('rows', p_rows)::TEXT, 'import');
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,252 @@
+-- Журналы audit_log и system_logs секционируются по месяцам: старые месяцы удаляются или уходят
+-- в схему archive целиком (DETACH PARTITION), без DELETE и без роста стоимости VACUUM.
+-- Секции создает ensure_log_partitions() заранее; DEFAULT-секция ловит строки вне созданных
+-- месяцев (например, импорт старого журнала) до следующего обслуживания.
+-- Ключ секционирования обязан входить в первичный ключ.
+--
+-- Существующие таблицы переименовываются, для каждого месяца их строк сразу создается секция,
+-- строки копируются и старые таблицы удаляются. Время строки становится NOT NULL: строки без
+-- времени получают начало эпохи и уходят в архив при первом же проходе хранения.
+-- Последовательности log_id переходят к новым таблицам.
+ALTER TABLE audit_log RENAME TO audit_log_unpartitioned;
+ALTER TABLE audit_log_unpartitioned RENAME CONSTRAINT audit_log_pkey TO audit_log_unpartitioned_pkey;
+ALTER TABLE system_logs RENAME TO system_logs_unpartitioned;
+ALTER TABLE system_logs_unpartitioned RENAME CONSTRAINT system_logs_pkey TO system_logs_unpartitioned_pkey;
+
+CREATE TABLE audit_log (
+    log_id INT NOT NULL DEFAULT nextval('audit_log_log_id_seq'),
+    table_name VARCHAR(50),
+    operation_type VARCHAR(10), -- INSERT, UPDATE, DELETE
+    record_id INT,
+    old_value TEXT,
+    new_value TEXT,
+    changed_by VARCHAR(50), -- Имя пользователя или 'system'
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (changed_at);
+
+CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT;
+
+CREATE TABLE system_logs (
+    log_id INT NOT NULL DEFAULT nextval('system_logs_log_id_seq'),
+    level VARCHAR(10) CONSTRAINT system_logs_level_check CHECK (level IN ('INFO', 'WARNING', 'ERROR')),
+    source VARCHAR(50),
+    message TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE system_logs_default PARTITION OF system_logs DEFAULT;
+
+ALTER SEQUENCE audit_log_log_id_seq OWNED BY audit_log.log_id;
+ALTER SEQUENCE system_logs_log_id_seq OWNED BY system_logs.log_id;
+
+-- Секции под месяцы существующих строк: копия раскладывается по ним сразу, минуя DEFAULT
+DO $$
+DECLARE
+    spec RECORD;
+    month DATE;
+BEGIN
+    FOR spec IN SELECT * FROM (VALUES ('audit_log', 'changed_at'), ('system_logs', 'created_at')) AS t(tbl, col) LOOP
+        FOR month IN EXECUTE format(
+            'SELECT DISTINCT date_trunc(''month'', COALESCE(%I, ''epoch''))::DATE FROM %I',
+            spec.col, spec.tbl || '_unpartitioned'
+        ) LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                spec.tbl || '_' || to_char(month, 'YYYY_MM'), spec.tbl, month, (month + INTERVAL '1 month')::DATE
+            );
+        END LOOP;
+    END LOOP;
+END;
+$$;
+
+INSERT INTO audit_log (log_id, table_name, operation_type, record_id, old_value, new_value, changed_by, changed_at)
+SELECT log_id, table_name, operation_type, record_id, old_value, new_value, changed_by, COALESCE(changed_at, 'epoch')
+FROM audit_log_unpartitioned;
+
+INSERT INTO system_logs (log_id, level, source, message, created_at)
+SELECT log_id, level, source, message, COALESCE(created_at, 'epoch')
+FROM system_logs_unpartitioned;
+
+DROP TABLE audit_log_unpartitioned;
+DROP TABLE system_logs_unpartitioned;
+
+ALTER TABLE audit_log ADD PRIMARY KEY (log_id, changed_at);
+ALTER TABLE system_logs ADD PRIMARY KEY (log_id, created_at);
+
+-- История конкретной записи: WHERE table_name = ... AND record_id = ...
+CREATE INDEX idx_audit_log_record ON audit_log(table_name, record_id);
+-- Журнал пишется по возрастанию времени, поэтому BRIN на порядки меньше B-Tree и хватает для диапазонов
+CREATE INDEX idx_audit_log_changed_at ON audit_log USING BRIN (changed_at);
+CREATE INDEX idx_system_logs_created_at ON system_logs USING BRIN (created_at);
+
+ANALYZE audit_log;
+ANALYZE system_logs;
+
+-- Отсюда retention-задача хранит отсоединенные секции журналов вместо удаления
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- Секции журналов audit_log и system_logs на месяцы вперед.
+-- Дополнительно создает месяцы для строк, попавших в DEFAULT-секцию, и переносит их туда:
+-- иначе ATTACH PARTITION не пройдет проверку DEFAULT-секции. Возвращает число созданных секций.
+CREATE OR REPLACE FUNCTION ensure_log_partitions(p_months_ahead INT DEFAULT 2)
+RETURNS INT AS $$
+DECLARE
+    spec RECORD;
+    month DATE;
+    part TEXT;
+    created INT := 0;
+BEGIN
+    FOR spec IN SELECT * FROM (VALUES ('audit_log', 'changed_at'), ('system_logs', 'created_at')) AS t(tbl, col) LOOP
+        FOR month IN EXECUTE format(
+            'SELECT DISTINCT date_trunc(''month'', %I)::DATE FROM %I
+             UNION
+             SELECT generate_series(date_trunc(''month'', LOCALTIMESTAMP),
+                                    date_trunc(''month'', LOCALTIMESTAMP) + make_interval(months => %s),
+                                    INTERVAL ''1 month'')::DATE
+             ORDER BY 1',
+            spec.col, spec.tbl || '_default', p_months_ahead
+        ) LOOP
+            part := spec.tbl || '_' || to_char(month, 'YYYY_MM');
+            CONTINUE WHEN to_regclass(part) IS NOT NULL;
+
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, spec.tbl);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                spec.tbl || '_default', spec.col, month, spec.col, (month + INTERVAL '1 month')::DATE, part
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                spec.tbl, part, month, (month + INTERVAL '1 month')::DATE
+            );
+            created := created + 1;
+        END LOOP;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Хранение журналов: месячные секции старше p_keep_months отсоединяются целиком
+-- и либо переносятся в схему archive, либо удаляются. DELETE по журналу не выполняется.
+-- Возвращает число обработанных секций.
+CREATE OR REPLACE FUNCTION apply_log_retention(p_keep_months INT, p_archive BOOLEAN DEFAULT TRUE)
+RETURNS INT AS $$
+DECLARE
+    part RECORD;
+    cutoff DATE := (date_trunc('month', LOCALTIMESTAMP) - make_interval(months => p_keep_months))::DATE;
+    removed INT := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname AS name, p.relname AS parent
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE i.inhparent IN ('audit_log'::regclass, 'system_logs'::regclass)
+          AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.name);
+        IF p_archive THEN
+            EXECUTE format('ALTER TABLE %I SET SCHEMA archive', part.name);
+        ELSE
+            EXECUTE format('DROP TABLE %I', part.name);
+        END IF;
+        removed := removed + 1;
+    END LOOP;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Универсальный аудит изменений (см. 0010_statement_triggers.sql) пишет настоящий record_id.
+-- Используем row_to_json, чтобы функция могла работать с любой таблицей.
+-- Триггер уровня оператора: одна запись журнала на строку, но одним INSERT ... SELECT
+-- из таблиц переходов. Имя первичного ключа передается аргументом триггера (TG_ARGV[0]):
+-- по нему заполняется record_id и сопоставляются старая и новая версии строк при UPDATE.
+-- Таблица переходов допускает только одно событие на триггер, поэтому на каждую таблицу
+-- вешается по триггеру на событие.
+CREATE OR REPLACE FUNCTION log_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    pk TEXT := TG_ARGV[0];
+BEGIN
+    -- При массовой загрузке вместо построчного журнала finish_bulk_load пишет одну сводную запись
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    IF (TG_OP = 'INSERT') THEN
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        SELECT TG_TABLE_NAME, TG_OP, (to_jsonb(n) ->> pk)::INT, NULL, row_to_json(n)::TEXT, 'system'
+        FROM new_rows n;
+    ELSIF (TG_OP = 'DELETE') THEN
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        SELECT TG_TABLE_NAME, TG_OP, (to_jsonb(o) ->> pk)::INT, row_to_json(o)::TEXT, NULL, 'system'
+        FROM old_rows o;
+    ELSE -- UPDATE
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        SELECT TG_TABLE_NAME, TG_OP, COALESCE(n.id, o.id), o.data::TEXT, n.data::TEXT, 'system'
+        FROM (SELECT (to_jsonb(r) ->> pk)::INT AS id, row_to_json(r) AS data FROM old_rows r) o
+        FULL JOIN (SELECT (to_jsonb(r) ->> pk)::INT AS id, row_to_json(r) AS data FROM new_rows r) n
+            ON n.id = o.id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Построчные триггеры изменений заменяются операторными, остальные получают имя первичного ключа
+DROP TRIGGER audit_users_insert ON users;
+DROP TRIGGER audit_users_update ON users;
+DROP TRIGGER audit_users_delete ON users;
+DROP TRIGGER audit_items_insert ON items;
+DROP TRIGGER audit_items_update ON items;
+DROP TRIGGER audit_items_delete ON items;
+DROP TRIGGER audit_auctions_insert ON auctions;
+DROP TRIGGER audit_auctions_update ON auctions;
+DROP TRIGGER audit_auctions_delete ON auctions;
+DROP FUNCTION log_row_update();
+
+CREATE TRIGGER audit_users_insert
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('user_id');
+
+CREATE TRIGGER audit_users_update
+AFTER UPDATE ON users
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('user_id');
+
+CREATE TRIGGER audit_users_delete
+AFTER DELETE ON users
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('user_id');
+
+CREATE TRIGGER audit_items_insert
+AFTER INSERT ON items
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('item_id');
+
+CREATE TRIGGER audit_items_update
+AFTER UPDATE ON items
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('item_id');
+
+CREATE TRIGGER audit_items_delete
+AFTER DELETE ON items
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('item_id');
+
+CREATE TRIGGER audit_auctions_insert
+AFTER INSERT ON auctions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('auction_id');
+
+CREATE TRIGGER audit_auctions_update
+AFTER UPDATE ON auctions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('auction_id');
+
+CREATE TRIGGER audit_auctions_delete
+AFTER DELETE ON auctions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_changes('auction_id');
@@ -0,0 +1,97 @@
+-- Ставки секционируются на горячую часть (ставки идущих и недавно закрытых торгов) и архив.
+-- Ставки лотов, закрытых давно, переносит в архив archive_finished_bids() по расписанию,
+-- поэтому индексы горячей секции остаются маленькими и держатся в кэше.
+-- Запросы к bids без условия на archived просматривают обе секции.
+--
+-- Существующая таблица переименовывается, ее ставки копируются в новую секционированную таблицу
+-- (все в bids_hot: архив наполнит фоновая задача), и старая удаляется. Первичный ключ, внешние ключи,
+-- индекс и триггеры создаются после копирования: индексы строятся один раз, а триггеры цен и агрегатов
+-- не пересчитывают уже учтенные ставки. Последовательность bid_id переходит к новой таблице.
+-- Миграция держит эксклюзивную блокировку bids до конца копирования.
+ALTER TABLE bids RENAME TO bids_unpartitioned;
+ALTER TABLE bids_unpartitioned RENAME CONSTRAINT bids_pkey TO bids_unpartitioned_pkey;
+
+CREATE TABLE bids (
+    bid_id INT NOT NULL DEFAULT nextval('bids_bid_id_seq'),
+    auction_id INT,
+    user_id INT,
+    amount DECIMAL(12, 2) NOT NULL,
+    bid_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    archived BOOLEAN NOT NULL DEFAULT FALSE
+) PARTITION BY LIST (archived);
+
+CREATE TABLE bids_hot PARTITION OF bids FOR VALUES IN (FALSE);
+CREATE TABLE bids_archive PARTITION OF bids FOR VALUES IN (TRUE);
+
+ALTER SEQUENCE bids_bid_id_seq OWNED BY bids.bid_id;
+
+INSERT INTO bids_hot (bid_id, auction_id, user_id, amount, bid_time, archived)
+SELECT bid_id, auction_id, user_id, amount, bid_time, FALSE
+FROM bids_unpartitioned;
+
+DROP TABLE bids_unpartitioned;
+
+ALTER TABLE bids ADD PRIMARY KEY (bid_id, archived);
+ALTER TABLE bids ADD FOREIGN KEY (auction_id) REFERENCES auctions(auction_id) ON DELETE CASCADE;
+-- Если юзер удалился, история ставок остается
+ALTER TABLE bids ADD FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE SET NULL;
+
+-- Максимальная ставка лота (победитель при закрытии) — одна проба индекса вместо сортировки всех ставок
+CREATE INDEX idx_bids_auction_amount ON bids(auction_id, amount DESC);
+
+-- Триггеры ставок (см. 0010_statement_triggers.sql и 0006_bid_stats.sql) — на новой таблице
+CREATE TRIGGER trg_apply_bids
+AFTER INSERT ON bids
+REFERENCING NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION apply_bids_to_auctions();
+
+CREATE TRIGGER trg_bid_stats_insert
+AFTER INSERT ON bids
+REFERENCING NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_insert();
+
+CREATE TRIGGER trg_bid_stats_update
+AFTER UPDATE ON bids
+REFERENCING OLD TABLE AS old_bids NEW TABLE AS new_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_change();
+
+CREATE TRIGGER trg_bid_stats_delete
+AFTER DELETE ON bids
+REFERENCING OLD TABLE AS old_bids
+FOR EACH STATEMENT EXECUTE FUNCTION bid_stats_on_change();
+
+ANALYZE bids;
+
+-- Перенос ставок давно закрытых аукционов в архивную секцию bids_archive.
+-- Работает напрямую с секциями: операторные триггеры родительской таблицы bids
+-- (цены лотов, агрегаты, кэш аналитики) не срабатывают — сами ставки не меняются.
+-- За вызов обрабатывается не больше p_max_auctions лотов, чтобы транзакции оставались короткими.
+CREATE OR REPLACE FUNCTION archive_finished_bids(p_older_than INTERVAL, p_max_auctions INT DEFAULT 500)
+RETURNS TABLE (
+    auctions_moved INT,
+    bids_moved BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH lots AS (
+        SELECT a.auction_id
+        FROM auctions a
+        WHERE a.status IN ('finished', 'cancelled')
+          AND a.end_time < LOCALTIMESTAMP - p_older_than
+          AND EXISTS (SELECT 1 FROM bids_hot b WHERE b.auction_id = a.auction_id)
+        ORDER BY a.auction_id
+        LIMIT p_max_auctions
+    ), moved AS (
+        DELETE FROM bids_hot b
+        USING lots l
+        WHERE b.auction_id = l.auction_id
+        RETURNING b.bid_id, b.auction_id, b.user_id, b.amount, b.bid_time
+    ), archived AS (
+        INSERT INTO bids_archive (bid_id, auction_id, user_id, amount, bid_time, archived)
+        SELECT m.bid_id, m.auction_id, m.user_id, m.amount, m.bid_time, TRUE
+        FROM moved m
+        RETURNING auction_id
+    )
+    SELECT COUNT(DISTINCT ar.auction_id)::INT, COUNT(*) FROM archived ar;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,30 @@
+-- События аукционов для живых подписчиков (/auctions/{id}/stream).
+-- Одно уведомление на каждый лот, у которого изменились цена, время окончания или статус:
+-- это покрывает ставки (trg_apply_bids), антиснайпинг, ручное закрытие и settle_auctions.
+-- Payload — полное состояние лота, поэтому подписчику достаточно последнего уведомления.
+CREATE OR REPLACE FUNCTION notify_auction_events()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM pg_notify('auction_events', json_build_object(
+        'auction_id', n.auction_id,
+        'status', n.status,
+        'current_price', n.current_price,
+        'end_time', n.end_time
+    )::text)
+    FROM new_rows n
+    JOIN old_rows o ON o.auction_id = n.auction_id
+    WHERE n.current_price IS DISTINCT FROM o.current_price
+       OR n.end_time IS DISTINCT FROM o.end_time
+       OR n.status IS DISTINCT FROM o.status;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_auction_events
+AFTER UPDATE ON auctions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_auction_events();
@@ -0,0 +1,11 @@
+-- Поисковый вектор предметов (GET /items/search). Вычисляемая колонка: PostgreSQL сам пересчитывает ее
+-- при INSERT, UPDATE и COPY, отдельный триггер не нужен. Конфигурация russian стеммит
+-- и русские, и латинские слова; совпадение в названии весит больше, чем в описании.
+-- На существующей базе ADD COLUMN ... STORED переписывает items и считает вектор для всех строк
+-- под эксклюзивной блокировкой таблицы: миграцию стоит применять вне пиковой нагрузки.
+ALTER TABLE items ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('russian', COALESCE(description, '')), 'B')
+) STORED;
+
+CREATE INDEX idx_items_search ON items USING GIN (search_vector);
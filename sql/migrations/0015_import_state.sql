@@ -0,0 +1,28 @@
+-- Состояние пакетного импорта (POST /import/batches).
+-- Файл грузится порциями, каждая порция — своя транзакция вместе со своей контрольной точкой,
+-- поэтому прерванный пакет продолжается с первой незафиксированной строки (см. routers/importer.py).
+CREATE TABLE import_checkpoints (
+    batch_id VARCHAR(36) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    rows_committed BIGINT NOT NULL DEFAULT 0, -- строк файла обработано (загружено + в карантине)
+    rows_loaded BIGINT NOT NULL DEFAULT 0,
+    rows_quarantined BIGINT NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'in_progress' CHECK (status IN ('in_progress', 'done', 'failed')),
+    error TEXT,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (batch_id, file_name)
+);
+
+-- Строки, которые не разобрались или были отвергнуты БД, вместе с причиной
+CREATE TABLE import_quarantine (
+    quarantine_id BIGSERIAL PRIMARY KEY,
+    batch_id VARCHAR(36) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    row_number BIGINT NOT NULL, -- номер строки данных в файле, с 1
+    raw_row JSONB NOT NULL,
+    error TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_import_quarantine_file ON import_quarantine(batch_id, file_name, row_number);
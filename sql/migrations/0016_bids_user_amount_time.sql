@@ -0,0 +1,4 @@
+-- Крупные ставки пользователя от новых к старым (личный кабинет), см. sql/optimization.sql.
+-- Индекс раньше создавался вручную, поэтому IF NOT EXISTS: на таких базах миграция ничего не меняет.
+CREATE INDEX IF NOT EXISTS idx_bids_user_amount_time
+ON bids(user_id, amount, bid_time DESC);
@@ -0,0 +1,350 @@
+-- Реестр обязательств пользователей (exposure).
+-- Раньше ставка проверялась только против баланса: пользователь с балансом 10 000 мог лидировать
+-- в 500 лотах по 9 000. Теперь свободные средства = баланс - (цены лотов, где он лидер,
+-- + удержанные escrow), а сумма хранится готовой и поддерживается триггерами по изменениям,
+-- поэтому проверка при ставке — чтение одной строки под блокировкой, а не сумма по всем лотам.
+
+-- Текущий лидер лота (автор ставки, равной current_price); поддерживается trg_apply_bids
+ALTER TABLE auctions ADD COLUMN leader_id INT REFERENCES users(user_id) ON DELETE SET NULL;
+
+CREATE TABLE user_exposure (
+    user_id INT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    leading_amount DECIMAL(15, 2) NOT NULL DEFAULT 0, -- сумма цен активных лотов, где пользователь лидирует
+    escrow_amount DECIMAL(15, 2) NOT NULL DEFAULT 0,  -- сумма escrow_accounts в статусе 'held'
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Строка реестра есть у каждого пользователя: place_bid_atomic всегда находит, что блокировать
+CREATE OR REPLACE FUNCTION create_user_exposure()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_exposure (user_id)
+    SELECT user_id FROM new_users
+    ON CONFLICT (user_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_users_exposure
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_users
+FOR EACH STATEMENT EXECUTE FUNCTION create_user_exposure();
+
+
+-- Применяет приращения реестра одним оператором. Пользователи сортируются, чтобы параллельные
+-- транзакции блокировали строки реестра в одном порядке; удаленные пользователи пропускаются.
+CREATE OR REPLACE FUNCTION change_user_exposure(p_user_ids INT[], p_leading DECIMAL[], p_escrow DECIMAL[])
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO user_exposure AS e (user_id, leading_amount, escrow_amount)
+    SELECT d.user_id, SUM(d.leading_delta), SUM(d.escrow_delta)
+    FROM unnest(p_user_ids, p_leading, p_escrow) AS d(user_id, leading_delta, escrow_delta)
+    JOIN users u ON u.user_id = d.user_id
+    GROUP BY d.user_id
+    HAVING SUM(d.leading_delta) <> 0 OR SUM(d.escrow_delta) <> 0
+    ORDER BY d.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET leading_amount = e.leading_amount + EXCLUDED.leading_amount,
+        escrow_amount = e.escrow_amount + EXCLUDED.escrow_amount,
+        updated_at = LOCALTIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Лидерство: строка лота дает лидеру current_price, пока лот активен.
+-- Приращение = вклад новых версий строк - вклад старых: это покрывает смену лидера, рост цены,
+-- закрытие лота (вклад уходит, а escrow приходит триггером ниже) и удаление лота.
+-- Работает и в режиме bulk_load: триггер уровня оператора, а не построчный.
+CREATE OR REPLACE FUNCTION auctions_exposure_on_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids INT[] := '{}';
+    amounts DECIMAL[] := '{}';
+BEGIN
+    -- reconcile_user_exposure пересчитывает реестр целиком сам
+    IF current_setting('bidmaster.exposure_rebuild', TRUE) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP <> 'INSERT' THEN
+        SELECT user_ids || array_agg(leader_id), amounts || array_agg(-current_price)
+        INTO user_ids, amounts
+        FROM old_rows
+        WHERE status = 'active' AND leader_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        SELECT user_ids || array_agg(leader_id), amounts || array_agg(current_price)
+        INTO user_ids, amounts
+        FROM new_rows
+        WHERE status = 'active' AND leader_id IS NOT NULL;
+    END IF;
+
+    IF cardinality(user_ids) > 0 THEN
+        PERFORM change_user_exposure(user_ids, amounts, array_fill(0::DECIMAL, ARRAY[cardinality(user_ids)]));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_auctions_exposure_insert
+AFTER INSERT ON auctions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION auctions_exposure_on_change();
+
+CREATE TRIGGER trg_auctions_exposure_update
+AFTER UPDATE ON auctions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION auctions_exposure_on_change();
+
+CREATE TRIGGER trg_auctions_exposure_delete
+AFTER DELETE ON auctions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION auctions_exposure_on_change();
+
+-- Удержания: счет escrow в статусе 'held' держит сумму покупателя
+CREATE OR REPLACE FUNCTION escrow_exposure_on_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids INT[] := '{}';
+    amounts DECIMAL[] := '{}';
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        SELECT user_ids || array_agg(buyer_id), amounts || array_agg(-amount)
+        INTO user_ids, amounts
+        FROM old_rows
+        WHERE status = 'held' AND buyer_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        SELECT user_ids || array_agg(buyer_id), amounts || array_agg(amount)
+        INTO user_ids, amounts
+        FROM new_rows
+        WHERE status = 'held' AND buyer_id IS NOT NULL;
+    END IF;
+
+    IF cardinality(user_ids) > 0 THEN
+        PERFORM change_user_exposure(user_ids, array_fill(0::DECIMAL, ARRAY[cardinality(user_ids)]), amounts);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_escrow_exposure_insert
+AFTER INSERT ON escrow_accounts
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION escrow_exposure_on_change();
+
+CREATE TRIGGER trg_escrow_exposure_update
+AFTER UPDATE ON escrow_accounts
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION escrow_exposure_on_change();
+
+CREATE TRIGGER trg_escrow_exposure_delete
+AFTER DELETE ON escrow_accounts
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION escrow_exposure_on_change();
+
+
+-- Триггер ставок (см. 0010_statement_triggers.sql, раздел 1) теперь ведет и лидера: автор старшей ставки
+-- оператора становится лидером, если она не ниже текущей цены (place_bid_atomic поднимает цену
+-- до вставки ставки, поэтому "не ниже", а не "выше").
+CREATE OR REPLACE FUNCTION apply_bids_to_auctions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF is_bulk_load() THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE auctions a
+    SET current_price = GREATEST(a.current_price, s.max_amount),
+        leader_id = CASE WHEN s.max_amount >= a.current_price THEN s.top_user_id ELSE a.leader_id END,
+        end_time = CASE
+            WHEN a.end_time - s.last_bid_time < INTERVAL '5 minutes' THEN a.end_time + INTERVAL '10 minutes'
+            ELSE a.end_time
+        END
+    FROM (
+        SELECT DISTINCT ON (auction_id)
+               auction_id, user_id AS top_user_id, amount AS max_amount,
+               MAX(bid_time) OVER (PARTITION BY auction_id) AS last_bid_time
+        FROM new_bids
+        ORDER BY auction_id, amount DESC, bid_id DESC
+    ) s
+    WHERE a.auction_id = s.auction_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- После массовой загрузки ставок цена и лидер берутся из старшей ставки лота
+-- (см. 0010_statement_triggers.sql, раздел 3)
+CREATE OR REPLACE FUNCTION finish_bulk_load(p_table VARCHAR, p_rows BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    IF p_table = 'bids' THEN
+        UPDATE auctions a
+        SET current_price = s.max_bid,
+            leader_id = (
+                SELECT b.user_id FROM bids b
+                WHERE b.auction_id = a.auction_id
+                ORDER BY b.amount DESC, b.bid_id DESC
+                LIMIT 1
+            )
+        FROM auction_bid_stats s
+        WHERE s.auction_id = a.auction_id
+          AND s.max_bid >= a.current_price
+          AND (s.max_bid > a.current_price OR a.leader_id IS NULL);
+    END IF;
+
+    IF p_table IN ('users', 'items', 'auctions') THEN
+        INSERT INTO audit_log (table_name, operation_type, record_id, old_value, new_value, changed_by)
+        VALUES (p_table, 'BULK_LOAD', NULL, NULL, json_build_object('rows', p_rows)::TEXT, 'import');
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Атомарная ставка (см. 0005_place_bid_atomic.sql) с проверкой средств по реестру.
+-- Лот блокируется первым, затем строки реестра ставящего и текущего лидера в порядке user_id
+-- (тот же порядок, что у триггеров реестра). Свободные средства = баланс - обязательства,
+-- а собственное лидерство в этом же лоте не считается: повышая свою ставку, пользователь
+-- заменяет обязательство, а не добавляет новое.
+CREATE OR REPLACE FUNCTION place_bid_atomic(p_auction_id INT, p_user_id INT, p_amount DECIMAL(12, 2))
+RETURNS TABLE (
+    result VARCHAR,
+    new_price DECIMAL(12, 2),
+    new_end_time TIMESTAMP
+) AS $$
+DECLARE
+    bid_at TIMESTAMP := LOCALTIMESTAMP;
+    lot auctions%ROWTYPE;
+    available DECIMAL(15, 2);
+BEGIN
+    SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'auction_not_found'::VARCHAR, NULL::DECIMAL(12, 2), NULL::TIMESTAMP;
+        RETURN;
+    ELSIF lot.status <> 'active' THEN
+        RETURN QUERY SELECT 'not_active'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF lot.end_time < bid_at THEN
+        UPDATE auctions SET status = 'finished' WHERE auction_id = p_auction_id;
+        RETURN QUERY SELECT 'finished'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF p_amount <= COALESCE(lot.current_price, 0) THEN
+        RETURN QUERY SELECT 'too_low'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM user_exposure
+    WHERE user_id IN (p_user_id, lot.leader_id)
+    ORDER BY user_id
+    FOR UPDATE;
+
+    SELECT COALESCE(u.balance, 0) - COALESCE(e.leading_amount + e.escrow_amount, 0)
+           + CASE WHEN lot.leader_id = p_user_id THEN lot.current_price ELSE 0 END
+    INTO available
+    FROM users u
+    LEFT JOIN user_exposure e ON e.user_id = u.user_id
+    WHERE u.user_id = p_user_id;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'user_not_found'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF available < p_amount THEN
+        RETURN QUERY SELECT 'insufficient_funds'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    END IF;
+
+    UPDATE auctions
+    SET current_price = p_amount, leader_id = p_user_id
+    WHERE auction_id = p_auction_id;
+
+    -- Триггеры на bids продлят лот (антиснайпинг) и синхронизируют цену
+    INSERT INTO bids (auction_id, user_id, amount, bid_time)
+    VALUES (p_auction_id, p_user_id, p_amount, bid_at);
+
+    SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id;
+    RETURN QUERY SELECT 'accepted'::VARCHAR, lot.current_price, lot.end_time;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Сверка реестра: лидеры активных лотов пересчитываются по bids, обязательства — по auctions
+-- и escrow_accounts. Расхождения исправляются и возвращаются для журнала.
+-- Блокировки в порядке пути ставки (лоты, затем реестр): ставки ждут окончания сверки, чтение не ждет.
+CREATE OR REPLACE FUNCTION reconcile_user_exposure()
+RETURNS TABLE (
+    leaders_fixed BIGINT,
+    users_drifted BIGINT,
+    drift_total DECIMAL(18, 2)
+) AS $$
+DECLARE
+    fixed BIGINT;
+BEGIN
+    LOCK TABLE auctions IN SHARE ROW EXCLUSIVE MODE;
+    LOCK TABLE user_exposure IN SHARE ROW EXCLUSIVE MODE;
+
+    -- Реестр пересчитывается ниже целиком, поэтому исправление лидеров не должно двигать его триггером
+    PERFORM set_config('bidmaster.exposure_rebuild', 'on', TRUE);
+    WITH top AS (
+        SELECT a.auction_id, t.user_id
+        FROM auctions a
+        CROSS JOIN LATERAL (
+            SELECT b.user_id FROM bids b
+            WHERE b.auction_id = a.auction_id
+            ORDER BY b.amount DESC, b.bid_id DESC
+            LIMIT 1
+        ) t
+        WHERE a.status = 'active'
+    ), fixed_rows AS (
+        UPDATE auctions a
+        SET leader_id = top.user_id
+        FROM top
+        WHERE a.auction_id = top.auction_id
+          AND a.leader_id IS DISTINCT FROM top.user_id
+        RETURNING a.auction_id
+    )
+    SELECT COUNT(*) INTO fixed FROM fixed_rows;
+    PERFORM set_config('bidmaster.exposure_rebuild', 'off', TRUE);
+
+    INSERT INTO user_exposure (user_id)
+    SELECT user_id FROM users
+    ON CONFLICT (user_id) DO NOTHING;
+
+    RETURN QUERY
+    WITH expected AS (
+        SELECT u.user_id,
+               COALESCE(l.amount, 0) AS leading_amount,
+               COALESCE(h.amount, 0) AS escrow_amount
+        FROM users u
+        LEFT JOIN (
+            SELECT leader_id, SUM(current_price) AS amount
+            FROM auctions
+            WHERE status = 'active' AND leader_id IS NOT NULL
+            GROUP BY leader_id
+        ) l ON l.leader_id = u.user_id
+        LEFT JOIN (
+            SELECT buyer_id, SUM(amount) AS amount
+            FROM escrow_accounts
+            WHERE status = 'held' AND buyer_id IS NOT NULL
+            GROUP BY buyer_id
+        ) h ON h.buyer_id = u.user_id
+    ), diff AS (
+        SELECT x.user_id, x.leading_amount, x.escrow_amount,
+               ABS(x.leading_amount - e.leading_amount) + ABS(x.escrow_amount - e.escrow_amount) AS drift
+        FROM expected x
+        JOIN user_exposure e ON e.user_id = x.user_id
+        WHERE e.leading_amount <> x.leading_amount OR e.escrow_amount <> x.escrow_amount
+    ), drifted AS (
+        UPDATE user_exposure e
+        SET leading_amount = d.leading_amount,
+            escrow_amount = d.escrow_amount,
+            updated_at = LOCALTIMESTAMP
+        FROM diff d
+        WHERE e.user_id = d.user_id
+        RETURNING d.drift
+    )
+    SELECT fixed, COUNT(*), COALESCE(SUM(d.drift), 0)::DECIMAL(18, 2) FROM drifted d;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Исходное заполнение: лидеры из bids, обязательства из auctions и escrow_accounts
+SELECT reconcile_user_exposure();
@@ -0,0 +1,4 @@
+-- Список аукционов по цене без фильтра статуса (GET /auctions/?sort=price или -price, в том числе
+-- с category_id): idx_auctions_status_price начинается со статуса, поэтому без него лоты читались
+-- целиком и сортировались. Пара к idx_auctions_end_time; найдено scripts/plan_check.py.
+CREATE INDEX IF NOT EXISTS idx_auctions_price ON auctions(current_price, auction_id);
@@ -0,0 +1,62 @@
+-- Ставка после end_time больше не переводит лот в finished простым UPDATE: так лот закрывался
+-- без счета escrow и без победителя, а триггер реестра освобождал обязательство лидера.
+-- Теперь такая ставка только отклоняется, а закрывает лот settle_auctions (планировщик закрытия
+-- подхватывает активные лоты с истекшим end_time). В остальном функция — как в 0017_user_exposure.sql.
+CREATE OR REPLACE FUNCTION place_bid_atomic(p_auction_id INT, p_user_id INT, p_amount DECIMAL(12, 2))
+RETURNS TABLE (
+    result VARCHAR,
+    new_price DECIMAL(12, 2),
+    new_end_time TIMESTAMP
+) AS $$
+DECLARE
+    bid_at TIMESTAMP := LOCALTIMESTAMP;
+    lot auctions%ROWTYPE;
+    available DECIMAL(15, 2);
+BEGIN
+    SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'auction_not_found'::VARCHAR, NULL::DECIMAL(12, 2), NULL::TIMESTAMP;
+        RETURN;
+    ELSIF lot.status <> 'active' THEN
+        RETURN QUERY SELECT 'not_active'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF lot.end_time < bid_at THEN
+        RETURN QUERY SELECT 'finished'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF p_amount <= COALESCE(lot.current_price, 0) THEN
+        RETURN QUERY SELECT 'too_low'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM user_exposure
+    WHERE user_id IN (p_user_id, lot.leader_id)
+    ORDER BY user_id
+    FOR UPDATE;
+
+    SELECT COALESCE(u.balance, 0) - COALESCE(e.leading_amount + e.escrow_amount, 0)
+           + CASE WHEN lot.leader_id = p_user_id THEN lot.current_price ELSE 0 END
+    INTO available
+    FROM users u
+    LEFT JOIN user_exposure e ON e.user_id = u.user_id
+    WHERE u.user_id = p_user_id;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'user_not_found'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    ELSIF available < p_amount THEN
+        RETURN QUERY SELECT 'insufficient_funds'::VARCHAR, lot.current_price, lot.end_time;
+        RETURN;
+    END IF;
+
+    UPDATE auctions
+    SET current_price = p_amount, leader_id = p_user_id
+    WHERE auction_id = p_auction_id;
+
+    -- Триггеры на bids продлят лот (антиснайпинг) и синхронизируют цену
+    INSERT INTO bids (auction_id, user_id, amount, bid_time)
+    VALUES (p_auction_id, p_user_id, p_amount, bid_at);
+
+    SELECT * INTO lot FROM auctions WHERE auction_id = p_auction_id;
+    RETURN QUERY SELECT 'accepted'::VARCHAR, lot.current_price, lot.end_time;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,172 @@
+-- Сверка реестра обязательств без блокировки таблиц.
+-- reconcile_user_exposure из 0017_user_exposure.sql брала SHARE ROW EXCLUSIVE на auctions и user_exposure
+-- на весь пересчет, и ставки, пакеты и закрытие лотов стояли, пока она читала все лоты и пользователей.
+-- Теперь расхождения ищутся по снимку без блокировок, а исправляются только найденные строки
+-- под блокировками строк, после которых значения перепроверяются по свежему снимку.
+-- Лидеры и реестр сверяются двумя функциями в разных транзакциях: исправление лидера блокирует лот,
+-- а сверка реестра держит строки user_exposure до конца транзакции; в одной транзакции их порядок
+-- разошелся бы с путем ставки (лот, затем реестр) и мог бы дать взаимоблокировку.
+
+-- Исправление лидера теперь проходит через триггер реестра как обычное изменение лота,
+-- поэтому флаг bidmaster.exposure_rebuild больше не нужен
+CREATE OR REPLACE FUNCTION auctions_exposure_on_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids INT[] := '{}';
+    amounts DECIMAL[] := '{}';
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        SELECT user_ids || array_agg(leader_id), amounts || array_agg(-current_price)
+        INTO user_ids, amounts
+        FROM old_rows
+        WHERE status = 'active' AND leader_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        SELECT user_ids || array_agg(leader_id), amounts || array_agg(current_price)
+        INTO user_ids, amounts
+        FROM new_rows
+        WHERE status = 'active' AND leader_id IS NOT NULL;
+    END IF;
+
+    IF cardinality(user_ids) > 0 THEN
+        PERFORM change_user_exposure(user_ids, amounts, array_fill(0::DECIMAL, ARRAY[cardinality(user_ids)]));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Лидеры активных лотов по bids (у лота без ставок лидера нет). Блокируются только лоты
+-- с расхождением, в порядке auction_id, как в пакетном приеме ставок; под блокировкой все ставки
+-- этих лотов уже зафиксированы (их вставка берет блокировку лота триггером), поэтому лидер
+-- считается заново по свежему снимку. Триггер реестра переносит цену лота от прежнего лидера
+-- к новому. Возвращает число исправленных лотов.
+CREATE OR REPLACE FUNCTION reconcile_auction_leaders()
+RETURNS BIGINT AS $$
+DECLARE
+    candidates INT[];
+    fixed BIGINT;
+BEGIN
+    SELECT array_agg(a.auction_id) INTO candidates
+    FROM auctions a
+    LEFT JOIN LATERAL (
+        SELECT b.user_id FROM bids b
+        WHERE b.auction_id = a.auction_id
+        ORDER BY b.amount DESC, b.bid_id DESC
+        LIMIT 1
+    ) t ON TRUE
+    WHERE a.status = 'active'
+      AND a.leader_id IS DISTINCT FROM t.user_id;
+
+    IF candidates IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM 1 FROM auctions
+    WHERE auction_id = ANY(candidates)
+    ORDER BY auction_id
+    FOR UPDATE;
+
+    WITH fixed_rows AS (
+        UPDATE auctions a
+        SET leader_id = t.user_id
+        FROM (
+            SELECT c.auction_id, (
+                SELECT b.user_id FROM bids b
+                WHERE b.auction_id = c.auction_id
+                ORDER BY b.amount DESC, b.bid_id DESC
+                LIMIT 1
+            ) AS user_id
+            FROM unnest(candidates) AS c(auction_id)
+        ) t
+        WHERE a.auction_id = t.auction_id
+          AND a.status = 'active'
+          AND a.leader_id IS DISTINCT FROM t.user_id
+        RETURNING a.auction_id
+    )
+    SELECT COUNT(*) INTO fixed FROM fixed_rows;
+    RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Обязательства по auctions и escrow_accounts. Строки реестра с расхождением блокируются в порядке
+-- user_id (как в триггерах реестра) без блокировки лотов. Под блокировкой строки пользователя
+-- изменение его обязательств либо уже зафиксировано, либо ждет эту строку и еще не видно,
+-- поэтому перепроверка по свежему снимку сравнивает согласованные значения.
+-- Возвращает число исправленных пользователей и сумму расхождений.
+DROP FUNCTION reconcile_user_exposure();
+
+CREATE FUNCTION reconcile_user_exposure()
+RETURNS TABLE (
+    users_drifted BIGINT,
+    drift_total DECIMAL(18, 2)
+) AS $$
+DECLARE
+    candidates INT[];
+BEGIN
+    INSERT INTO user_exposure (user_id)
+    SELECT user_id FROM users
+    ON CONFLICT (user_id) DO NOTHING;
+
+    SELECT array_agg(e.user_id) INTO candidates
+    FROM user_exposure e
+    LEFT JOIN (
+        SELECT leader_id, SUM(current_price) AS amount
+        FROM auctions
+        WHERE status = 'active' AND leader_id IS NOT NULL
+        GROUP BY leader_id
+    ) l ON l.leader_id = e.user_id
+    LEFT JOIN (
+        SELECT buyer_id, SUM(amount) AS amount
+        FROM escrow_accounts
+        WHERE status = 'held' AND buyer_id IS NOT NULL
+        GROUP BY buyer_id
+    ) h ON h.buyer_id = e.user_id
+    WHERE e.leading_amount <> COALESCE(l.amount, 0)
+       OR e.escrow_amount <> COALESCE(h.amount, 0);
+
+    IF candidates IS NULL THEN
+        RETURN QUERY SELECT 0::BIGINT, 0::DECIMAL(18, 2);
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM user_exposure
+    WHERE user_id = ANY(candidates)
+    ORDER BY user_id
+    FOR UPDATE;
+
+    RETURN QUERY
+    WITH expected AS (
+        SELECT c.user_id,
+               COALESCE(l.amount, 0) AS leading_amount,
+               COALESCE(h.amount, 0) AS escrow_amount
+        FROM unnest(candidates) AS c(user_id)
+        LEFT JOIN (
+            SELECT leader_id, SUM(current_price) AS amount
+            FROM auctions
+            WHERE status = 'active' AND leader_id = ANY(candidates)
+            GROUP BY leader_id
+        ) l ON l.leader_id = c.user_id
+        LEFT JOIN (
+            SELECT buyer_id, SUM(amount) AS amount
+            FROM escrow_accounts
+            WHERE status = 'held' AND buyer_id = ANY(candidates)
+            GROUP BY buyer_id
+        ) h ON h.buyer_id = c.user_id
+    ), diff AS (
+        SELECT x.user_id, x.leading_amount, x.escrow_amount,
+               ABS(x.leading_amount - e.leading_amount) + ABS(x.escrow_amount - e.escrow_amount) AS drift
+        FROM expected x
+        JOIN user_exposure e ON e.user_id = x.user_id
+        WHERE e.leading_amount <> x.leading_amount OR e.escrow_amount <> x.escrow_amount
+    ), drifted AS (
+        UPDATE user_exposure e
+        SET leading_amount = d.leading_amount,
+            escrow_amount = d.escrow_amount,
+            updated_at = LOCALTIMESTAMP
+        FROM diff d
+        WHERE e.user_id = d.user_id
+        RETURNING d.drift
+    )
+    SELECT COUNT(*), COALESCE(SUM(d.drift), 0)::DECIMAL(18, 2) FROM drifted d;
+END;
+$$ LANGUAGE plpgsql;
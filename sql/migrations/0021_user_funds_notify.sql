@@ -0,0 +1,63 @@
+-- Уведомления об изменении свободных средств не из ставок: пополнение или списание баланса,
+-- удержание и освобождение escrow. In-memory движок ставок (BID_ENGINE_ENABLED=1) держит средства
+-- пользователей в памяти и по NOTIFY 'user_funds_changed' перечитывает их из users/user_exposure.
+-- Изменения от самих ставок не уведомляются: их движок ведет сам, а поток NOTIFY на каждую ставку
+-- только нагрузил бы слушателей. Payload — id пользователей через запятую.
+CREATE OR REPLACE FUNCTION notify_user_funds(p_user_ids INT[])
+RETURNS VOID AS $$
+DECLARE
+    ids TEXT;
+BEGIN
+    SELECT string_agg(DISTINCT id::TEXT, ',') INTO ids
+    FROM unnest(p_user_ids) AS t(id)
+    WHERE id IS NOT NULL;
+
+    IF ids IS NOT NULL THEN
+        PERFORM pg_notify('user_funds_changed', ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION users_funds_on_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM notify_user_funds(array_agg(n.user_id))
+    FROM new_users n
+    JOIN old_users o ON o.user_id = n.user_id
+    WHERE n.balance IS DISTINCT FROM o.balance;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_users_funds_update
+AFTER UPDATE ON users
+REFERENCING OLD TABLE AS old_users NEW TABLE AS new_users
+FOR EACH STATEMENT EXECUTE FUNCTION users_funds_on_change();
+
+-- Триггер удержаний (см. 0017_user_exposure.sql) дополнительно уведомляет покупателей
+CREATE OR REPLACE FUNCTION escrow_exposure_on_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    user_ids INT[] := '{}';
+    amounts DECIMAL[] := '{}';
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        SELECT user_ids || array_agg(buyer_id), amounts || array_agg(-amount)
+        INTO user_ids, amounts
+        FROM old_rows
+        WHERE status = 'held' AND buyer_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        SELECT user_ids || array_agg(buyer_id), amounts || array_agg(amount)
+        INTO user_ids, amounts
+        FROM new_rows
+        WHERE status = 'held' AND buyer_id IS NOT NULL;
+    END IF;
+
+    IF cardinality(user_ids) > 0 THEN
+        PERFORM change_user_exposure(user_ids, array_fill(0::DECIMAL, ARRAY[cardinality(user_ids)]), amounts);
+        PERFORM notify_user_funds(user_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
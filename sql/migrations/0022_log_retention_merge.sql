@@ -0,0 +1,35 @@
+-- Хранение журналов (см. 0011_log_partitions.sql): месяц, уже перенесенный в archive, может
+-- появиться в журнале снова — ensure_log_partitions создает секцию для строк из DEFAULT-секции.
+-- ALTER TABLE ... SET SCHEMA archive падал на такой секции ("relation already exists") и прерывал
+-- все обслуживание. Теперь ее строки дописываются в уже архивную секцию месяца, а сама она удаляется.
+CREATE OR REPLACE FUNCTION apply_log_retention(p_keep_months INT, p_archive BOOLEAN DEFAULT TRUE)
+RETURNS INT AS $$
+DECLARE
+    part RECORD;
+    cutoff DATE := (date_trunc('month', LOCALTIMESTAMP) - make_interval(months => p_keep_months))::DATE;
+    removed INT := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname AS name, p.relname AS parent
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE i.inhparent IN ('audit_log'::regclass, 'system_logs'::regclass)
+          AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.name);
+        IF p_archive AND to_regclass(format('archive.%I', part.name)) IS NOT NULL THEN
+            EXECUTE format('INSERT INTO archive.%I SELECT * FROM %I', part.name, part.name);
+            EXECUTE format('DROP TABLE %I', part.name);
+        ELSIF p_archive THEN
+            EXECUTE format('ALTER TABLE %I SET SCHEMA archive', part.name);
+        ELSE
+            EXECUTE format('DROP TABLE %I', part.name);
+        END IF;
+        removed := removed + 1;
+    END LOOP;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
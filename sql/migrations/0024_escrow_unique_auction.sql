@@ -0,0 +1,10 @@
+-- Один счет escrow на лот: ручное закрытие и планировщик (settle_auctions) больше не могут
+-- оба создать счет для одного победителя.
+-- Дубликаты, созданные до ограничения, удаляются — остается самый ранний счет лота;
+-- триггер trg_escrow_exposure_delete снимает их суммы с обязательств покупателей.
+DELETE FROM escrow_accounts e
+USING escrow_accounts first
+WHERE first.auction_id = e.auction_id
+  AND first.escrow_id < e.escrow_id;
+
+ALTER TABLE escrow_accounts ADD CONSTRAINT escrow_accounts_auction_id_key UNIQUE (auction_id);
@@ -15,7 +15,8 @@ ORDER BY bid_time DESC;
 -- 2. amount (для фильтрации по цене)
 -- 3. bid_time (для мгновенной сортировки)
 
-CREATE INDEX idx_bids_user_amount_time
+-- Индекс создается миграцией sql/migrations/0016_bids_user_amount_time.sql
+CREATE INDEX IF NOT EXISTS idx_bids_user_amount_time
 ON bids(user_id, amount, bid_time DESC);
 
 -- Проверка после оптимизации
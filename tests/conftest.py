@@ -0,0 +1,79 @@
+import os
+import uuid
+
+import pytest
+
+# Тесты с настоящей БД запускаются, только если подключение задано снаружи
+DB_CONFIGURED = all(os.getenv(name) for name in ("DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_NAME"))
+
+# Модули app создают движки SQLAlchemy при импорте (без подключения): тестам чистой логики
+# нужны только значения настроек, сама БД не используется
+for name, value in {
+    "DB_USER": "bidmaster", "DB_PASSWORD": "bidmaster", "DB_HOST": "localhost",
+    "DB_PORT": "5432", "DB_NAME": "bidmaster", "BID_ENGINE_ENABLED": "0",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def scratch_db():
+    """Движок пустой временной БД на сервере из DB_*; после теста БД удаляется."""
+    if not DB_CONFIGURED:
+        pytest.skip("needs PostgreSQL: set DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME")
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.engine import make_url
+
+    from app.database import SQLALCHEMY_DATABASE_URL
+
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    name = f"{url.database}_test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f'CREATE DATABASE "{name}"'))
+    engine = create_engine(url.set(database=name))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        admin.dispose()
+
+
+@pytest.fixture
+def migrated_db(scratch_db):
+    """Временная БД со схемой последней версии."""
+    from app.migrate import upgrade
+
+    upgrade(scratch_db, log=lambda _message: None)
+    return scratch_db
+
+
+@pytest.fixture
+def auction_db(migrated_db):
+    """Временная БД с активным лотом 1 продавца 1 и ставкой 50 покупателя 2."""
+    from sqlalchemy import text
+
+    with migrated_db.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO users (username, email, password_hash, balance)
+            VALUES ('seller', 'seller@example.com', 'x', 0), ('buyer', 'buyer@example.com', 'x', 1000)
+        """))
+        conn.execute(text("INSERT INTO items (owner_id, title) VALUES (1, 'Lot')"))
+        conn.execute(text("""
+            INSERT INTO auctions (item_id, start_time, end_time, start_price, status)
+            VALUES (1, now() - interval '1 hour', now() + interval '1 hour', 10, 'active')
+        """))
+    with migrated_db.begin() as conn:
+        conn.execute(text("SELECT * FROM place_bid_atomic(1, 2, 50)"))
+    return migrated_db
+
+
+@pytest.fixture
+def read_replica():
+    """Модуль app.database, настроенный на настоящую реплику (DB_READ_HOST)."""
+    if not (DB_CONFIGURED and os.getenv("DB_READ_HOST")):
+        pytest.skip("needs a streaming replica: set DB_* and DB_READ_HOST")
+    from app import database
+
+    return database
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app.services.bid_batch import LotState, simulate
+from app.services.bid_engine import SNIPING_EXTENSION, SNIPING_WINDOW
+from app.services.proxy_bidding import Proxy, ProxyBook
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+def lot(price="10.00", leader=None, ends_in=timedelta(days=1), status="active"):
+    return LotState(status, NOW + ends_in, Decimal(price), leader)
+
+
+def test_accepted_bids_move_funds_between_leaders():
+    lots = {1: lot()}
+    funds = {10: Decimal("100"), 20: Decimal("100")}
+    outcomes, rows = simulate([(1, 10, Decimal("20")), (1, 20, Decimal("30"))], lots, funds, {}, NOW)
+
+    assert [o.result for o in outcomes] == ["accepted", "accepted"]
+    assert [(r["user_id"], r["amount"]) for r in rows] == [(10, Decimal("20")), (20, Decimal("30"))]
+    assert funds == {10: Decimal("100"), 20: Decimal("70")}
+    assert (lots[1].current_price, lots[1].leader_id) == (Decimal("30"), 20)
+
+
+def test_leader_raising_own_bid_replaces_reservation():
+    funds = {10: Decimal("80")}
+    outcomes, _ = simulate([(1, 10, Decimal("100"))], {1: lot("20.00", leader=10)}, funds, {}, NOW)
+    assert outcomes[0].result == "accepted"
+    assert funds[10] == Decimal("0")
+
+
+def test_rejections_in_place_bid_atomic_order():
+    lots = {1: lot(), 2: lot(status="finished")}
+    funds = {10: Decimal("15")}
+    outcomes, rows = simulate([
+        (9, 10, Decimal("20")),
+        (2, 10, Decimal("20")),
+        (1, 10, Decimal("10")),
+        (1, 99, Decimal("20")),
+        (1, 10, Decimal("20")),
+    ], lots, funds, {}, NOW)
+    assert [o.result for o in outcomes] == [
+        "auction_not_found", "not_active", "too_low", "user_not_found", "insufficient_funds",
+    ]
+    assert rows == []
+    assert funds == {10: Decimal("15")}
+
+
+def test_late_bid_rejected_without_closing_lot():
+    # Истекший лот закрывает settle_auctions (с победителем и escrow); пакет только отклоняет ставку
+    lots = {1: lot(leader=20, ends_in=-timedelta(seconds=1))}
+    funds = {10: Decimal("100"), 20: Decimal("90")}
+    outcomes, rows = simulate([(1, 10, Decimal("50")), (1, 10, Decimal("60"))], lots, funds, {}, NOW)
+
+    assert [o.result for o in outcomes] == ["finished", "finished"]
+    assert rows == []
+    assert lots[1].status == "active"
+    assert (lots[1].current_price, lots[1].leader_id) == (Decimal("10.00"), 20)
+    assert funds == {10: Decimal("100"), 20: Decimal("90")}
+
+
+def test_bid_in_sniping_window_extends_once_per_bid():
+    lots = {1: lot(ends_in=SNIPING_WINDOW / 2)}
+    outcomes, _ = simulate([(1, 10, Decimal("20"))], lots, {10: Decimal("100")}, {}, NOW)
+    assert outcomes[0].new_end_time == NOW + SNIPING_WINDOW / 2 + SNIPING_EXTENSION
+
+
+def test_proxy_answers_manual_bid():
+    books = {1: ProxyBook([Proxy(20, Decimal("50"), (1,))])}
+    funds = {10: Decimal("100"), 20: Decimal("100")}
+    outcomes, rows = simulate([(1, 10, Decimal("20"))], {1: lot()}, funds, books, NOW)
+
+    assert [(r["user_id"], r["amount"]) for r in rows] == [(10, Decimal("20")), (20, Decimal("21.00"))]
+    assert outcomes[0].leader_id == 20
+    assert funds == {10: Decimal("100"), 20: Decimal("79.00")}
+
+
+def test_proxy_without_funds_stops_resolution():
+    books = {1: ProxyBook([Proxy(20, Decimal("50"), (1,))])}
+    funds = {10: Decimal("100"), 20: Decimal("5")}
+    outcomes, rows = simulate([(1, 10, Decimal("20"))], {1: lot()}, funds, books, NOW)
+    assert len(rows) == 1
+    assert outcomes[0].leader_id == 10
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import ThreadedSession
+from app.routers.auctions import close_auction_transaction
+
+
+async def close_concurrently(engine, auction_id: int, attempts: int):
+    make_session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def close_once():
+        db = ThreadedSession(make_session())
+        try:
+            return await close_auction_transaction(auction_id, db)
+        finally:
+            await db.close()
+
+    return await asyncio.gather(*(close_once() for _ in range(attempts)), return_exceptions=True)
+
+
+def test_concurrent_close_creates_one_escrow(auction_db):
+    results = asyncio.run(close_concurrently(auction_db, 1, attempts=4))
+
+    closed = [r for r in results if isinstance(r, dict)]
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(closed) == 1 and closed[0]["winner_id"] == 2
+    assert len(rejected) == 3 and all(e.status_code == 400 for e in rejected)
+    with auction_db.connect() as conn:
+        escrows = conn.execute(text("SELECT buyer_id, amount FROM escrow_accounts")).all()
+    assert [(row.buyer_id, row.amount) for row in escrows] == [(2, 50)]
+
+
+def test_second_escrow_for_auction_is_rejected(auction_db):
+    insert = text("INSERT INTO escrow_accounts (auction_id, buyer_id, amount, status) VALUES (1, 2, 50, 'held')")
+    with auction_db.begin() as conn:
+        conn.execute(insert)
+
+    with pytest.raises(IntegrityError, match="escrow_accounts_auction_id_key"):
+        with auction_db.begin() as conn:
+            conn.execute(insert)
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+
+from app.models import Auction, Bid, Item, User
+from app.services.import_scheduler import dependency_levels
+
+
+def names(levels):
+    return [[model.__table__.name for model in level] for level in levels]
+
+
+def test_levels_follow_foreign_keys():
+    levels = names(dependency_levels([Bid, Auction, Item, User]))
+    position = {name: i for i, level in enumerate(levels) for name in level}
+    assert position["auctions"] > position["items"]
+    assert position["bids"] > position["auctions"]
+    assert position["bids"] > position["users"]
+
+
+def test_links_to_models_outside_the_set_ignored():
+    assert names(dependency_levels([Bid])) == [["bids"]]
+
+
+def test_cycle_rejected():
+    metadata = MetaData()
+
+    class A:
+        __table__ = Table("a", metadata, Column("id", Integer, primary_key=True),
+                          Column("b_id", Integer, ForeignKey("b.id")))
+
+    class B:
+        __table__ = Table("b", metadata, Column("id", Integer, primary_key=True),
+                          Column("a_id", Integer, ForeignKey("a.id")))
+
+    with pytest.raises(ValueError, match="cycle"):
+        dependency_levels([A, B])
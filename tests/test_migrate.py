@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import text
+
+from app.migrate import (
+    BASELINE_FINGERPRINT, BASELINE_VERSION, UnknownSchema, discover, latest_version, schema_fingerprint, upgrade,
+)
+
+
+def quiet(_message):
+    pass
+
+
+def run_scripts(engine, migrations):
+    """Выполняет файлы как docker-entrypoint-initdb.d — без записи в schema_migrations."""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for migration in migrations:
+            cursor.execute(migration.sql)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def test_versions_are_contiguous():
+    versions = [m.version for m in discover()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_original_scripts_are_adopted_as_baseline(scratch_db):
+    run_scripts(scratch_db, [m for m in discover() if m.version <= BASELINE_VERSION])
+    with scratch_db.connect() as conn:
+        assert schema_fingerprint(conn) == BASELINE_FINGERPRINT
+
+    applied = upgrade(scratch_db, log=quiet)
+
+    assert [m.version for m in applied] == list(range(BASELINE_VERSION + 1, latest_version() + 1))
+    with scratch_db.connect() as conn:
+        baseline = conn.execute(text("SELECT version FROM schema_migrations WHERE baseline ORDER BY version")).scalars()
+        assert list(baseline) == list(range(1, BASELINE_VERSION + 1))
+
+
+def test_other_schema_without_history_is_rejected(scratch_db):
+    upgrade(scratch_db, target=BASELINE_VERSION + 1, log=quiet)
+    with scratch_db.begin() as conn:
+        conn.execute(text("DROP TABLE schema_migrations"))
+
+    with pytest.raises(UnknownSchema, match="fingerprint"):
+        upgrade(scratch_db, log=quiet)
@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.models import Auction
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, key_types
+
+PRICE_TYPES = key_types((Auction.current_price, Auction.auction_id))
+END_TYPES = key_types((Auction.end_time, Auction.auction_id))
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_round_trip_keeps_types():
+    key = [Decimal("12.50"), 7]
+    assert decode_cursor(encode_cursor("price", key), "price", PRICE_TYPES) == key
+
+    key = [datetime(2026, 3, 1, 12, 30), 7]
+    assert decode_cursor(encode_cursor("end_time", key), "end_time", END_TYPES) == key
+
+
+def test_rank_accepts_integral_float():
+    assert decode_cursor(encode_cursor("rank", [0, 5]), "rank", (float, int)) == [0, 5]
+
+
+def test_cursor_of_other_sort_rejected():
+    with pytest.raises(InvalidCursor, match="different sort"):
+        decode_cursor(encode_cursor("price", [Decimal("1.00"), 1]), "end_time", END_TYPES)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    raw_cursor([1, 2]),
+    raw_cursor({"s": "price"}),
+    raw_cursor({"s": "price", "k": 5}),
+])
+def test_garbage_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "price", PRICE_TYPES)
+
+
+@pytest.mark.parametrize("key", [
+    [{"dec": "abc"}, 1],
+    [{"dec": "NaN"}, 1],
+    ["12.50", 1],
+    [{"dec": "12.50"}, "1"],
+    [{"dec": "12.50"}, True],
+    [{"dec": "12.50"}, None],
+    [{"dec": "12.50"}, [1]],
+    [{"dec": "12.50"}],
+    [{"dec": "12.50"}, 1, 2],
+])
+def test_key_of_wrong_shape_rejected(key):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(raw_cursor({"s": "price", "k": key}), "price", PRICE_TYPES)
+
+
+@pytest.mark.parametrize("value", [{"dt": "yesterday"}, {"dt": 5}, {"dt": "2026-03-01T12:00:00+03:00"}])
+def test_bad_timestamp_rejected(value):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(raw_cursor({"s": "end_time", "k": [value, 1]}), "end_time", END_TYPES)
@@ -0,0 +1,37 @@
+from app.services.periodic import PeriodicJob
+
+
+class RecordingSession:
+    def __init__(self, logs):
+        self._logs = logs
+
+    def add(self, row):
+        self._logs.append(row)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_job_failure_is_logged_and_job_keeps_running():
+    logs, calls = [], []
+
+    def job():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        periodic._stopped.set()
+
+    periodic = PeriodicJob("log-maintenance", job, 0.01, session_factory=lambda: RecordingSession(logs))
+    periodic.start()
+    periodic._thread.join(timeout=5)
+
+    assert len(calls) == 2
+    assert [(r.level, r.source, r.message) for r in logs] == [
+        ("ERROR", "LOG_MAINTENANCE", "log-maintenance failed: RuntimeError: boom")
+    ]
@@ -0,0 +1,60 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from sqlalchemy import text
+
+BIDDERS = 8
+BIDS_PER_BIDDER = 40
+
+
+def place(engine, user_id: int, amount: Decimal) -> str:
+    with engine.begin() as conn:
+        return conn.execute(
+            text("SELECT result FROM place_bid_atomic(1, :user_id, :amount)"), {"user_id": user_id, "amount": amount}
+        ).scalar()
+
+
+def test_concurrent_bids_never_lower_the_price(auction_db):
+    with auction_db.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO users (username, email, password_hash, balance)
+            SELECT 'bidder' || n, 'bidder' || n || '@example.com', 'x', 1000000
+            FROM generate_series(1, :n) n
+        """), {"n": BIDDERS})
+        bidder_ids = conn.execute(text("SELECT user_id FROM users WHERE username LIKE 'bidder%'")).scalars().all()
+
+    prices = []
+    stop = threading.Event()
+
+    def watch_price():
+        # Цена, которую видят читатели, тоже только растет
+        with auction_db.connect() as conn:
+            while not stop.is_set():
+                prices.append(conn.execute(text("SELECT current_price FROM auctions WHERE auction_id = 1")).scalar())
+                conn.rollback()
+
+    def bidder(user_id: int):
+        rng = random.Random(user_id)
+        # Суммы пересекаются между участниками: часть ставок конкурирует за одну и ту же цену
+        return [place(auction_db, user_id, Decimal(rng.randint(51, 2000))) for _ in range(BIDS_PER_BIDDER)]
+
+    watcher = threading.Thread(target=watch_price)
+    watcher.start()
+    try:
+        with ThreadPoolExecutor(max_workers=BIDDERS) as pool:
+            results = [r for batch in pool.map(bidder, bidder_ids) for r in batch]
+    finally:
+        stop.set()
+        watcher.join()
+
+    assert set(results) <= {"accepted", "too_low"}
+    assert "accepted" in results
+    with auction_db.connect() as conn:
+        amounts = conn.execute(text("SELECT amount FROM bids WHERE auction_id = 1 ORDER BY bid_id")).scalars().all()
+        price = conn.execute(text("SELECT current_price FROM auctions WHERE auction_id = 1")).scalar()
+    assert len(amounts) == results.count("accepted") + 1
+    assert all(earlier < later for earlier, later in zip(amounts, amounts[1:]))
+    assert price == amounts[-1]
+    assert all(earlier <= later for earlier, later in zip(prices, prices[1:]))
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from app.services.proxy_bidding import Proxy, ProxyBook, resolve
+
+INC = Decimal("1.00")
+
+
+def book(*limits):
+    return ProxyBook(Proxy(user_id, Decimal(limit), (seq,)) for seq, (user_id, limit) in enumerate(limits))
+
+
+def test_empty_book_keeps_manual_bid():
+    assert resolve(ProxyBook(), 1, Decimal("10"), INC) == [(1, Decimal("10"))]
+
+
+def test_proxy_outbids_by_one_increment():
+    assert resolve(book((2, "50")), 1, Decimal("10"), INC) == [(1, Decimal("10")), (2, Decimal("11.00"))]
+
+
+def test_manual_bid_above_limit_wins():
+    assert resolve(book((2, "50")), 1, Decimal("60"), INC) == [(1, Decimal("60"))]
+
+
+def test_manual_bid_at_limit_is_not_outbid():
+    # Прокси не может поставить больше своего лимита, поэтому ручная ставка, равная лимиту, остается лидирующей
+    assert resolve(book((2, "50")), 1, Decimal("50"), INC) == [(1, Decimal("50"))]
+
+
+def test_two_proxies_resolved_in_one_pass():
+    bids = resolve(book((2, "50"), (3, "80")), 1, Decimal("10"), INC)
+    # Лимит второго участника фиксируется ставкой, лидер платит второй лимит + шаг
+    assert bids == [(1, Decimal("10")), (2, Decimal("50")), (3, Decimal("51.00"))]
+
+
+def test_equal_limits_earlier_proxy_wins():
+    bids = resolve(book((2, "50"), (3, "50")), 1, Decimal("10"), INC)
+    assert bids[-1] == (2, Decimal("50"))
+
+
+def test_own_limit_protects_manual_bid():
+    assert resolve(book((1, "100"), (2, "50")), 1, Decimal("20"), INC) == [(1, Decimal("20")), (2, Decimal("50")), (1, Decimal("51.00"))]
+
+
+def test_replaced_and_removed_proxies_skipped():
+    proxies = book((2, "50"), (3, "80"))
+    proxies.add(Proxy(3, Decimal("30"), (5,)))
+    proxies.remove(2)
+    assert [p.limit for p in proxies.top(3)] == [Decimal("30")]
+    assert len(proxies) == 1